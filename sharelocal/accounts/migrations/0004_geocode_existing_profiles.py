@@ -1,43 +1,63 @@
 # Generated by Django 6.0.2 on 2026-03-24 08:55
 
+import re
+
 from django.db import migrations
 
-def geocode_location(location):
-    """Geocode a location string to get latitude and longitude."""
+
+def normalize_query(location):
+    """core.geocoding.normalize_query as of this migration."""
     if not location:
-        return None, None
-    
+        return ''
+    query = re.sub(r'\s+', ' ', location.casefold())
+    query = re.sub(r'\s*[,;](?:\s*[,;])*\s*', ', ', query)
+    return query.strip(' ,.')
+
+
+def known_coordinates(apps, location):
+    """
+    (lat, lon) for a location from the geocode cache or the gazetteer, or
+    None. The provider is never called here: locations left unresolved are
+    geocoded by the geocode_backfill command.
+
+    Databases that ran this migration before core gained the cache table
+    (0003) and the gazetteer columns (0005) must stay consistent, so it
+    depends on neither: each source is used only when the migration state
+    has it.
+    """
+    query = normalize_query(location)
+    if not query:
+        return None
     try:
-        import requests
-        # Using Nominatim API (OpenStreetMap) - free and no API key required
-        url = f"https://nominatim.openstreetmap.org/search"
-        params = {
-            'q': location,
-            'format': 'json',
-            'limit': 1
-        }
-        headers = {
-            'User-Agent': 'ShareLocal/1.0'
-        }
-        response = requests.get(url, params=params, headers=headers, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        
-        if data:
-            return float(data[0]['lat']), float(data[0]['lon'])
-    except Exception:
-        # Gracefully handle any errors (including missing requests library)
-        pass
-    
-    return None, None
+        GeocodeCache = apps.get_model('core', 'GeocodeCache')
+    except LookupError:
+        GeocodeCache = None
+    if GeocodeCache is not None:
+        cached = GeocodeCache.objects.filter(
+            query=query, latitude__isnull=False, longitude__isnull=False,
+        ).values_list('latitude', 'longitude').first()
+        if cached is not None:
+            return cached
+    Location = apps.get_model('core', 'Location')
+    if not {'latitude', 'longitude', 'normalized_name'} <= {field.name for field in Location._meta.fields}:
+        return None
+    places = Location.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    # The full query, then its first part ("navrangpura" of "navrangpura, ahmedabad")
+    for name in dict.fromkeys([query, query.partition(', ')[0]]):
+        matches = list(places.filter(normalized_name=name).values_list('latitude', 'longitude')[:2])
+        if len(matches) == 1:
+            return matches[0]
+    return None
+
 
 def geocode_existing_profiles(apps, schema_editor):
     """Geocode existing user profiles that have location but no coordinates."""
     UserProfile = apps.get_model('accounts', 'UserProfile')
-    
+
     for profile in UserProfile.objects.filter(location__isnull=False).exclude(latitude__isnull=False, longitude__isnull=False):
-        lat, lon = geocode_location(profile.location)
-        if lat is not None and lon is not None:
+        coordinates = known_coordinates(apps, profile.location)
+        if coordinates is not None:
+            lat, lon = coordinates
             profile.latitude = lat
             profile.longitude = lon
             profile.save(update_fields=['latitude', 'longitude'])
@@ -51,6 +71,7 @@ class Migration(migrations.Migration):
 
     dependencies = [
         ('accounts', '0003_alter_userprofile_latitude_and_more'),
+        ('core', '0002_location_alter_category_options_category_created_at_and_more'),
     ]
 
     operations = [
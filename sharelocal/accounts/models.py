@@ -1,43 +1,18 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
 
-def geocode_location(location):
-    """Geocode a location string to get latitude and longitude."""
-    if not location:
-        return None, None
-    
-    try:
-        import requests
-        # Using Nominatim API (OpenStreetMap) - free and no API key required
-        url = f"https://nominatim.openstreetmap.org/search"
-        params = {
-            'q': location,
-            'format': 'json',
-            'limit': 1
-        }
-        headers = {
-            'User-Agent': 'ShareLocal/1.0'
-        }
-        response = requests.get(url, params=params, headers=headers, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        
-        if data:
-            return float(data[0]['lat']), float(data[0]['lon'])
-    except Exception:
-        # Gracefully handle any errors (including missing requests library)
-        pass
-    
-    return None, None
+from core.geocode_queue import GeocodedLocationMixin, enqueue_geocode
+from core.models import GEOCODE_STATUS_CHOICES
 
 # Create your models here.
 
-class UserProfile(models.Model):
+class UserProfile(GeocodedLocationMixin, models.Model):
     user = models.OneToOneField(User,on_delete=models.CASCADE)
     phone = models.CharField(max_length=15)
     location = models.CharField(max_length=100, blank=True, null=True)
     latitude = models.FloatField(null=True, blank=True, help_text='User latitude for location services')
     longitude = models.FloatField(null=True, blank=True, help_text='User longitude for location services')
+    geocode_status = models.CharField(max_length=20, choices=GEOCODE_STATUS_CHOICES, blank=True, default='')
     profile_photo = models.ImageField(upload_to='profiles/', blank=True, null=True)
 
     def save(self, *args, **kwargs):
@@ -52,22 +27,53 @@ class UserProfile(models.Model):
                 pass
         
         # Geocode location if it changed or coordinates are missing
+        queue_geocode = False
         if location_changed or (self.location and (not self.latitude or not self.longitude)):
-            lat, lon = geocode_location(self.location)
-            if lat is not None and lon is not None:
-                self.latitude = lat
-                self.longitude = lon
+            if not self.location:
+                self.geocode_status = ''
+            else:
+                queue_geocode = self._geocode_location()
         
         super().save(*args, **kwargs)
         
         # Update all items owned by this user if location changed
         if location_changed:
-            from items.models import Item
-            Item.objects.filter(owner=self.user).update(
-                location=self.location,
-                latitude=self.latitude,
-                longitude=self.longitude
-            )
+            self.sync_items_location()
+        if queue_geocode:
+            enqueue_geocode('profile', self.pk, self.location)
+
+    def _store_geocode(self):
+        """Store a result from the geocoding worker and pass it on to the items."""
+        UserProfile.objects.filter(pk=self.pk).update(
+            latitude=self.latitude,
+            longitude=self.longitude,
+            geocode_status=self.geocode_status
+        )
+        self.sync_items_location()
+
+    def sync_items_location(self):
+        """Copy this profile's location and coordinates onto all the user's items."""
+        from items.models import Item
+        from items.geo import geohash_encode
+        from items.spatial import spatial_index
+        if self.latitude is not None and self.longitude is not None:
+            geohash = geohash_encode(self.latitude, self.longitude)
+        else:
+            geohash = ''
+        owner_items = Item.objects.filter(owner=self.user_id)
+        owner_items.update(
+            location=self.location,
+            latitude=self.latitude,
+            longitude=self.longitude,
+            geohash=geohash,
+            geocode_status=self.geocode_status
+        )
+        # Bulk updates skip Item signals, so patch the spatial index directly
+        index_rows = [
+            (item_id, self.latitude, self.longitude, is_available)
+            for item_id, is_available in owner_items.values_list('id', 'is_available')
+        ]
+        transaction.on_commit(lambda: spatial_index.upsert_many(index_rows))
 
     def __str__(self):
         return self.user.username
\ No newline at end of file
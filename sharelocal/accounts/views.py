@@ -6,6 +6,7 @@ from django.contrib import messages
 from django.views.decorators.http import require_http_methods
 from .forms import UserRegistrationForm, UserProfileForm, UserLoginForm
 from .models import UserProfile
+from request_app.counters import stats_for
 from request_app.models import ItemRequest
 from items.models import Item
 
@@ -120,39 +121,21 @@ def profile(request):
     # Get user's uploaded items
     user_items = Item.objects.filter(owner=request.user).order_by('-created_at')
     
-    # Get request statistics
-    pending_received = ItemRequest.objects.filter(
-        item__owner=request.user,
-        status='Pending'
-    ).count()
-    
-    accepted_received = ItemRequest.objects.filter(
-        item__owner=request.user,
-        status='Accepted'
-    ).count()
-    
-    pending_sent = ItemRequest.objects.filter(
-        requested_by=request.user,
-        status='Pending'
-    ).count()
-    
-    accepted_sent = ItemRequest.objects.filter(
-        requested_by=request.user,
-        status='Accepted'
-    ).count()
+    # Get request statistics (denormalized, one row)
+    request_stats = stats_for(request.user)
     
     # Get recent requests
     recent_received = ItemRequest.objects.filter(
-        item__owner=request.user
+        item_owner=request.user
     ).select_related('requested_by', 'item').order_by('-requested_date')[:5]
     
     context = {
         'user_profile': user_profile,
         'user_items': user_items,
-        'pending_received': pending_received,
-        'accepted_received': accepted_received,
-        'pending_sent': pending_sent,
-        'accepted_sent': accepted_sent,
+        'pending_received': request_stats.pending_received,
+        'accepted_received': request_stats.accepted_received,
+        'pending_sent': request_stats.pending_sent,
+        'accepted_sent': request_stats.accepted_sent,
         'recent_received': recent_received,
     }
     return render(request, 'accounts/profile.html', context)
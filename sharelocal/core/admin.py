@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Location
+from .models import Category, GeocodeCache, GeocodeJob, Location, SiteCounter
 
 
 @admin.register(Category)
@@ -26,7 +26,7 @@ class LocationAdmin(admin.ModelAdmin):
     """
     Admin configuration for Location model.
     """
-    list_display = ('name', 'city', 'state', 'zip_code', 'created_at')
+    list_display = ('name', 'city', 'state', 'zip_code', 'latitude', 'longitude', 'created_at')
     list_filter = ('city', 'state')
     search_fields = ('name', 'city', 'state')
     readonly_fields = ('created_at',)
@@ -34,8 +34,45 @@ class LocationAdmin(admin.ModelAdmin):
         ('Location Details', {
             'fields': ('name', 'city', 'state', 'zip_code'),
         }),
+        ('Coordinates', {
+            'fields': ('latitude', 'longitude'),
+        }),
         ('Timestamps', {
             'fields': ('created_at',),
             'classes': ('collapse',),
         }),
-    )
\ No newline at end of file
+    )
+
+
+@admin.register(GeocodeCache)
+class GeocodeCacheAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for GeocodeCache model.
+    """
+    list_display = ('query', 'latitude', 'longitude', 'updated_at')
+    search_fields = ('query',)
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(GeocodeJob)
+class GeocodeJobAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for GeocodeJob model.
+    """
+    list_display = ('target', 'object_id', 'location', 'status', 'attempts', 'available_at')
+    list_filter = ('target', 'status')
+    search_fields = ('location',)
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(SiteCounter)
+class SiteCounterAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for SiteCounter model.
+    """
+    list_display = ('name', 'value', 'updated_at')
+    readonly_fields = ('name', 'value', 'updated_at')
+
+    def has_add_permission(self, request):
+        # Counters are maintained by core.counters; fix drift with reconcile_counters
+        return False
@@ -6,6 +6,7 @@ class CoreConfig(AppConfig):
     name = 'core'
 
     def ready(self):
+        from . import signals  # noqa: F401
         from .models import Category
 
         def create_default_categories(sender, **kwargs):
@@ -0,0 +1,167 @@
+"""
+View benchmarks through the test client.
+
+run() requests every URL of the project's apps (APP_URLCONFS) as one
+user, a few times each, and returns timings and query counts as a
+JSON-serializable dict. Each request runs in a transaction that is
+rolled back, so views that write on GET (toggle_availability) leave the
+data set unchanged between samples and between runs. Seed a realistic
+data set first with the seed_bench command; bench_views wraps run() and
+compare() for the command line.
+"""
+import importlib
+import platform
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from .querybudget import QueryRecorder
+
+APP_URLCONFS = ('accounts.urls', 'items.urls', 'request_app.urls', 'core.urls')
+
+# (min_lat, max_lat, min_lon, max_lon) synthetic locations are drawn
+# from: a box roughly the size of India
+BOUNDS = (8.0, 35.0, 68.0, 97.0)
+
+
+def app_urls():
+    """(url_name, pattern) for every named URL of the project's apps."""
+    for urlconf in APP_URLCONFS:
+        for pattern in importlib.import_module(urlconf).urlpatterns:
+            if pattern.name:
+                yield pattern.name, pattern
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of a list of samples."""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def url_kwargs(user):
+    """
+    Objects for the URL parameters: one of user's items, a request on
+    user's items and, for create-request, somebody else's item.
+    """
+    from items.models import Item
+    from request_app.models import ItemRequest
+
+    own_item = Item.objects.filter(owner=user).values_list('pk', flat=True).first()
+    other_item = Item.objects.exclude(owner=user).values_list('pk', flat=True).first()
+    received = ItemRequest.objects.filter(item_owner=user).values_list('pk', flat=True).first()
+    return {
+        '*': {'item_id': own_item, 'request_id': received},
+        'create-request': {'item_id': other_item},
+    }
+
+
+class Rollback(Exception):
+    """Raised inside a transaction to discard whatever a benchmark wrote."""
+
+
+def view_urls(user, names=None):
+    """(url_name, url) for every app URL, or only names; url is None when no object fits."""
+    kwargs_for = url_kwargs(user)
+    for name, pattern in app_urls():
+        if names and name not in names:
+            continue
+        kwargs = kwargs_for.get(name) or {key: kwargs_for['*'][key] for key in pattern.pattern.converters}
+        yield name, None if None in kwargs.values() else reverse(name, kwargs=kwargs)
+
+
+def sample(client, user, url):
+    """
+    GET url as user in a rolled-back transaction; returns (status code,
+    milliseconds, QueryRecorder).
+    """
+    # Logged in again every time: the logout view ends the session
+    client.force_login(user)
+    with QueryRecorder() as recorder:
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                response = client.get(url)
+                raise Rollback
+        except Rollback:
+            pass
+        elapsed = (time.perf_counter() - start) * 1000
+    return response.status_code, elapsed, recorder
+
+
+def client_hosts():
+    """Settings override letting the test client through ALLOWED_HOSTS."""
+    return override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'])
+
+
+def run(user, repeat=10, warmup=1, names=None):
+    """Time every app URL (or only names) as user; returns the results dict."""
+    from django.contrib.auth.models import User
+    from items.models import Item
+    from request_app.models import ItemRequest
+
+    client = Client()
+    results = {}
+    with client_hosts():
+        for name, url in view_urls(user, names):
+            if url is None:
+                results[name] = {'skipped': 'no object for the URL parameters'}
+                continue
+            for _ in range(warmup):
+                sample(client, user, url)
+            samples = [sample(client, user, url) for _ in range(repeat)]
+            timings = [elapsed for _, elapsed, _ in samples]
+            results[name] = {
+                'url': url,
+                'status': samples[-1][0],
+                'queries': samples[-1][2].count,
+                'samples': repeat,
+                'min_ms': round(min(timings), 3),
+                'p50_ms': round(percentile(timings, 50), 3),
+                'p95_ms': round(percentile(timings, 95), 3),
+                'max_ms': round(max(timings), 3),
+                'mean_ms': round(statistics.mean(timings), 3),
+            }
+
+    return {
+        'commit': current_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'database': connection.vendor,
+        'user': user.username,
+        'data': {
+            'users': User.objects.count(),
+            'items': Item.objects.count(),
+            'requests': ItemRequest.objects.count(),
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, metric='p50_ms'):
+    """[(url_name, before, after, change %)] for URLs timed in both runs."""
+    rows = []
+    for name, result in current['results'].items():
+        before = baseline.get('results', {}).get(name, {}).get(metric)
+        after = result.get(metric)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before * 100 if before else 0.0
+        rows.append((name, before, after, change))
+    return rows
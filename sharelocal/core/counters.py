@@ -0,0 +1,69 @@
+"""
+Materialized site-wide counters shown on the home page.
+
+Counts are kept in SiteCounter rows and adjusted with F() updates from
+model signals (see core.signals), inside the same transaction as the
+change they record. Code that bypasses signals (bulk_create, raw SQL)
+calls adjust() itself; reconcile() recomputes every counter from the
+source tables and is run periodically by the reconcile_counters command.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+ITEMS = 'items'
+REQUESTS = 'requests'
+ITEM_OWNERS = 'item_owners'
+
+NAMES = (ITEMS, REQUESTS, ITEM_OWNERS)
+
+
+def adjust(name, delta=1):
+    """Add delta to a counter, creating it on first use."""
+    from .models import SiteCounter
+
+    if not delta:
+        return
+    if SiteCounter.objects.filter(name=name).update(value=F('value') + delta):
+        return
+    try:
+        with transaction.atomic():
+            SiteCounter.objects.create(name=name, value=delta)
+    except IntegrityError:
+        # Created concurrently
+        SiteCounter.objects.filter(name=name).update(value=F('value') + delta)
+
+
+def read(*names):
+    """Return {name: value} for names (all counters by default) in one query."""
+    from .models import SiteCounter
+
+    names = names or NAMES
+    values = dict.fromkeys(names, 0)
+    values.update(SiteCounter.objects.filter(name__in=names).values_list('name', 'value'))
+    return values
+
+
+def actual_values():
+    """Compute every counter from the source tables (slow: full scans)."""
+    from items.models import Item
+    from request_app.models import ItemRequest
+
+    return {
+        ITEMS: Item.objects.count(),
+        REQUESTS: ItemRequest.objects.count(),
+        ITEM_OWNERS: Item.objects.values('owner').distinct().count(),
+    }
+
+
+def reconcile():
+    """Reset counters to their true values; returns {name: (stored, actual)} for drifted ones."""
+    from .models import SiteCounter
+
+    drift = {}
+    with transaction.atomic():
+        stored = read()
+        for name, value in actual_values().items():
+            if stored[name] != value:
+                drift[name] = (stored[name], value)
+                SiteCounter.objects.update_or_create(name=name, defaults={'value': value})
+    return drift
@@ -0,0 +1,149 @@
+"""
+Database-backed queue of geocoding work.
+
+Item.save() and UserProfile.save() enqueue a job when a location is not
+already cached (GeocodedLocationMixin); the geocode_worker management
+command claims jobs and hands the result back to the model's
+apply_geocode() method. A claim is
+a lease: a job still running GEOCODE_JOB_LEASE seconds after it was
+claimed belonged to a worker that died, and requeue_stale() puts it back.
+"""
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .geocoding import GeocodingError, cached_coordinates, geocode_async, geocode_location, resolve
+from .models import GeocodeJob
+
+TARGET_MODELS = {
+    'item': 'items.Item',
+    'profile': 'accounts.UserProfile',
+}
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 30  # seconds, doubled after every failed attempt
+LEASE = 300  # seconds a claimed job may run before it is taken back
+
+
+class GeocodedLocationMixin:
+    """
+    Geocoding for a model with location, latitude, longitude and
+    geocode_status fields (Item, UserProfile).
+
+    Subclasses implement _store_geocode() to write a worker's result.
+    """
+
+    def _geocode_location(self):
+        """
+        Set the coordinates of self.location before a save.
+
+        Never blocks on the provider unless GEOCODE_ASYNC is off: a cached
+        answer is used, or the object is left pending. Returns True when
+        it is pending and must be queued once saved.
+        """
+        if not geocode_async():
+            self._set_coordinates(geocode_location(self.location))
+            return False
+        result = cached_coordinates(self.location)
+        if result is None:
+            self.geocode_status = 'pending'
+            return True
+        self._set_coordinates(result)
+        return False
+
+    def _set_coordinates(self, result):
+        lat, lon = result
+        if lat is not None and lon is not None:
+            self.latitude = lat
+            self.longitude = lon
+            self.geocode_status = 'resolved'
+        else:
+            self.geocode_status = 'failed'
+
+    def apply_geocode(self, result):
+        """Store a result from the geocoding worker."""
+        if self.geocode_status != 'pending':
+            # Coordinates were supplied some other way since the job was queued
+            return
+        self._set_coordinates(result)
+        self._store_geocode()
+
+    def _store_geocode(self):
+        raise NotImplementedError
+
+
+def enqueue_geocode(target, object_id, location):
+    """Queue (or refresh the queued) geocoding job for one object."""
+    now = timezone.now()
+    updated = GeocodeJob.objects.filter(target=target, object_id=object_id, status='queued').update(
+        location=location, attempts=0, available_at=now, updated_at=now,
+    )
+    if not updated:
+        GeocodeJob.objects.create(target=target, object_id=object_id, location=location)
+
+
+def _claim(job):
+    """Mark a queued job as running; False if another worker got it first."""
+    return GeocodeJob.objects.filter(pk=job.pk, status='queued').update(
+        status='running', updated_at=timezone.now(),
+    ) == 1
+
+
+def requeue_stale(lease=None):
+    """
+    Queue again the running jobs claimed more than lease seconds ago.
+
+    The lost run counts as an attempt, so a job that kills its worker
+    every time ends up failed instead of cycling forever. Returns how
+    many jobs were taken back.
+    """
+    if lease is None:
+        lease = getattr(settings, 'GEOCODE_JOB_LEASE', LEASE)
+    max_attempts = getattr(settings, 'GEOCODE_JOB_MAX_ATTEMPTS', MAX_ATTEMPTS)
+    now = timezone.now()
+    stale = GeocodeJob.objects.filter(status='running', updated_at__lt=now - timedelta(seconds=lease))
+    lost = {'attempts': F('attempts') + 1, 'last_error': 'worker lease expired', 'updated_at': now}
+    failed = stale.filter(attempts__gte=max_attempts - 1).update(status='failed', **lost)
+    return failed + stale.update(status='queued', available_at=now, **lost)
+
+
+def process_job(job):
+    """Geocode one claimed job and apply the result to its target."""
+    job.attempts += 1
+    try:
+        result = resolve(job.location)
+    except GeocodingError as exc:
+        max_attempts = getattr(settings, 'GEOCODE_JOB_MAX_ATTEMPTS', MAX_ATTEMPTS)
+        job.last_error = str(exc)
+        if job.attempts >= max_attempts:
+            job.status = 'failed'
+        else:
+            job.status = 'queued'
+            job.available_at = timezone.now() + timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+    else:
+        model = apps.get_model(TARGET_MODELS[job.target])
+        with transaction.atomic():
+            target = model.objects.filter(pk=job.object_id, location=job.location).first()
+            # The object may have been deleted or moved since the job was queued
+            if target is not None:
+                target.apply_geocode(result)
+        job.status = 'done'
+        job.last_error = ''
+    job.updated_at = timezone.now()
+    job.save(update_fields=['attempts', 'status', 'available_at', 'last_error', 'updated_at'])
+    return job.status
+
+
+def run_pending(batch_size=50):
+    """Process up to batch_size due jobs; returns how many were handled."""
+    jobs = GeocodeJob.objects.filter(status='queued', available_at__lte=timezone.now())[:batch_size]
+    handled = 0
+    for job in jobs:
+        if _claim(job):
+            process_job(job)
+            handled += 1
+    return handled
@@ -0,0 +1,216 @@
+"""
+Shared HTTP client for the geocoding provider.
+
+One client per process keeps a pooled requests Session (no TCP/TLS
+handshake per lookup), spaces requests with a TokenBucket to honour the
+provider's rate policy, retries transient failures with exponential
+backoff and trips a circuit breaker after repeated failures so an outage
+fails fast instead of making every caller wait for a timeout.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from .geocoding import NOMINATIM_URL, USER_AGENT, GeocodingError, TokenBucket, stats
+
+# Defaults, overridable from settings
+RATE_LIMIT = 1.0
+TIMEOUT = 5
+MAX_RETRIES = 2
+BACKOFF = 0.5
+MAX_BACKOFF = 8
+CIRCUIT_THRESHOLD = 5
+CIRCUIT_COOLDOWN = 60
+POOL_SIZE = 4
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Client errors about the query itself; any other 4xx (401, 403...) means
+# the provider is refusing us and counts against the circuit
+QUERY_ERROR_STATUSES = {400, 404}
+
+
+class CircuitOpenError(GeocodingError):
+    """The provider failed repeatedly and is not being called until the cooldown ends."""
+
+
+class _RetryableError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _RequestError(Exception):
+    """The request failed in a way a retry would not fix (bad URL, redirect loop, access refused...)."""
+
+
+class CircuitBreaker:
+    """
+    Open after threshold consecutive failures, then reject calls for cooldown seconds.
+
+    Once the cooldown has passed a single trial call is let through; success
+    closes the circuit, failure keeps it open for another cooldown.
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at >= self.cooldown:
+                # Restart the window so concurrent callers wait for this trial
+                self.opened_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class GeocoderClient:
+    """Pooled, rate-limited, circuit-broken client for a Nominatim-style search API."""
+
+    def __init__(self, url=NOMINATIM_URL, rate=RATE_LIMIT, timeout=TIMEOUT, max_retries=MAX_RETRIES,
+                 backoff=BACKOFF, max_backoff=MAX_BACKOFF, circuit_threshold=CIRCUIT_THRESHOLD,
+                 circuit_cooldown=CIRCUIT_COOLDOWN, pool_size=POOL_SIZE):
+        self.url = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+        self.limiter = TokenBucket(rate)
+        self.breaker = CircuitBreaker(circuit_threshold, circuit_cooldown)
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            url=getattr(settings, 'GEOCODER_URL', NOMINATIM_URL),
+            rate=getattr(settings, 'GEOCODER_RATE_LIMIT', RATE_LIMIT),
+            timeout=getattr(settings, 'GEOCODER_TIMEOUT', TIMEOUT),
+            max_retries=getattr(settings, 'GEOCODER_MAX_RETRIES', MAX_RETRIES),
+            backoff=getattr(settings, 'GEOCODER_BACKOFF', BACKOFF),
+            circuit_threshold=getattr(settings, 'GEOCODER_CIRCUIT_THRESHOLD', CIRCUIT_THRESHOLD),
+            circuit_cooldown=getattr(settings, 'GEOCODER_CIRCUIT_COOLDOWN', CIRCUIT_COOLDOWN),
+            pool_size=getattr(settings, 'GEOCODER_POOL_SIZE', POOL_SIZE),
+        )
+
+    @property
+    def session(self):
+        with self._session_lock:
+            if self._session is None:
+                try:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                except ImportError as exc:
+                    raise GeocodingError('the requests library is not installed') from exc
+                session = requests.Session()
+                session.headers['User-Agent'] = USER_AGENT
+                # Retries are handled here, not by urllib3
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def close(self):
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def _delay(self, attempt, retry_after=None):
+        delay = self.backoff * 2 ** attempt
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return min(delay, self.max_backoff)
+
+    def _get(self, session, params):
+        """One rate-limited request; returns decoded JSON."""
+        import requests
+
+        self.limiter.acquire()
+        started = time.monotonic()
+        try:
+            response = session.get(self.url, params=params, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as exc:
+            raise _RetryableError(str(exc)) from exc
+        except requests.RequestException as exc:
+            raise _RequestError(str(exc) or type(exc).__name__) from exc
+        finally:
+            stats.observe(time.monotonic() - started)
+
+        if response.status_code in RETRY_STATUSES:
+            retry_after = response.headers.get('Retry-After')
+            retry_after = float(retry_after) if retry_after and retry_after.isdigit() else None
+            raise _RetryableError(f'HTTP {response.status_code}', retry_after)
+        if response.status_code in QUERY_ERROR_STATUSES:
+            raise GeocodingError(f'HTTP {response.status_code}')
+        if response.status_code >= 400:
+            raise _RequestError(f'HTTP {response.status_code}')
+        try:
+            return response.json()
+        except ValueError as exc:
+            raise GeocodingError('invalid JSON from provider') from exc
+
+    def search(self, params):
+        """
+        GET the search endpoint with params and return the decoded JSON.
+
+        Raises CircuitOpenError without touching the network while the
+        circuit is open, and GeocodingError once retries are exhausted.
+        """
+        session = self.session
+        if not self.breaker.allow():
+            stats.incr('short_circuits')
+            raise CircuitOpenError('geocoding provider unavailable, circuit open')
+
+        for attempt in range(self.max_retries + 1):
+            stats.incr('requests')
+            try:
+                data = self._get(session, params)
+            except _RetryableError as exc:
+                stats.incr('errors')
+                if attempt == self.max_retries:
+                    self.breaker.record_failure()
+                    raise GeocodingError(f'{exc} after {attempt + 1} attempt(s)') from exc
+                stats.incr('retries')
+                time.sleep(self._delay(attempt, exc.retry_after))
+            except _RequestError as exc:
+                stats.incr('errors')
+                self.breaker.record_failure()
+                raise GeocodingError(str(exc)) from exc
+            except GeocodingError:
+                # This request was unusable; that says nothing either way
+                # about the provider, so the breaker is left as it is
+                stats.incr('errors')
+                raise
+            else:
+                self.breaker.record_success()
+                return data
@@ -0,0 +1,410 @@
+"""
+Geocoding of free-text locations shared by items and accounts.
+
+Lookups go through two cache layers before reaching the provider: an
+in-process LRU, then the GeocodeCache table keyed by the normalized
+query. "Not found" answers are cached too (with a shorter TTL);
+transport errors are not, so a provider outage is retried later. The LRU
+keeps answers for minutes only: forget() can clear it in its own process
+alone, so other workers pick up gazetteer changes when it expires.
+
+The provider is pluggable through settings.GEOCODER_BACKEND; StubGeocoder
+answers from settings.GEOCODER_STUB_RESULTS so tests run offline. Cache
+hits, provider lookups and request latency are counted in `stats`.
+"""
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+DEFAULT_BACKEND = 'core.geocoding.GazetteerGeocoder'
+DEFAULT_FALLBACK_BACKEND = 'core.geocoding.NominatimGeocoder'
+NOMINATIM_URL = 'https://nominatim.openstreetmap.org/search'
+USER_AGENT = 'ShareLocal/1.0'
+
+# Defaults, overridable from settings
+MEMORY_CACHE_SIZE = 2048
+MEMORY_CACHE_TTL = 5 * 60
+CACHE_TTL = 30 * 24 * 60 * 60
+NEGATIVE_CACHE_TTL = 24 * 60 * 60
+
+_NOT_FOUND = (None, None)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def normalize_query(location):
+    """Lower-case a location and collapse whitespace and stray punctuation."""
+    if not location:
+        return ''
+    query = re.sub(r'\s+', ' ', location.casefold())
+    query = re.sub(r'\s*[,;](?:\s*[,;])*\s*', ', ', query)
+    return query.strip(' ,.')
+
+
+class LRUCache:
+    """Thread-safe LRU mapping whose entries expire after their own TTL."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value, or None when missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def discard_matching(self, predicate):
+        """Drop every entry whose key satisfies predicate."""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+
+memory_cache = LRUCache(_setting('GEOCODE_MEMORY_CACHE_SIZE', MEMORY_CACHE_SIZE))
+
+
+class GeocoderStats:
+    """Thread-safe counters and request latency for the geocoding pipeline."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counts = Counter()
+            self._latency_total = 0.0
+            self._latency_max = 0.0
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def observe(self, seconds):
+        """Record the duration of one provider request."""
+        with self._lock:
+            self._counts['timed_requests'] += 1
+            self._latency_total += seconds
+            self._latency_max = max(self._latency_max, seconds)
+
+    def __getitem__(self, name):
+        return self._counts[name]
+
+    def snapshot(self):
+        """Return the counters plus mean/max latency in milliseconds."""
+        with self._lock:
+            data = dict(self._counts)
+            timed = data.pop('timed_requests', 0)
+            data['latency_avg_ms'] = round(1000 * self._latency_total / timed, 1) if timed else 0.0
+            data['latency_max_ms'] = round(1000 * self._latency_max, 1)
+            return data
+
+
+stats = GeocoderStats()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: acquire() blocks until a token is available.
+
+    Tokens refill at rate per second up to capacity, so short bursts are
+    allowed while the long-run rate never exceeds the provider's policy.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """Take a token if one is available right now."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class GeocodingError(Exception):
+    """The provider could not be reached or returned an unusable response."""
+
+
+class NominatimGeocoder:
+    """
+    OpenStreetMap Nominatim - free and no API key required.
+
+    Requests go through a GeocoderClient built from settings; the backend
+    instance is cached by _load_backend, so its pool, rate limiter and
+    circuit breaker are shared by the whole process.
+    """
+
+    def __init__(self):
+        from .geocoder_client import GeocoderClient
+
+        self.client = GeocoderClient.from_settings()
+
+    def geocode(self, query):
+        """Return (lat, lon), or (None, None) when nothing matches."""
+        data = self.client.search({
+            'q': query,
+            'format': 'json',
+            'limit': 1
+        })
+        if not data:
+            return _NOT_FOUND
+        try:
+            return float(data[0]['lat']), float(data[0]['lon'])
+        except (KeyError, IndexError, TypeError, ValueError) as exc:
+            raise GeocodingError(f'unexpected response for {query!r}') from exc
+
+
+class StubGeocoder:
+    """Offline backend answering from settings.GEOCODER_STUB_RESULTS."""
+
+    def geocode(self, query):
+        results = getattr(settings, 'GEOCODER_STUB_RESULTS', {})
+        for location, coordinates in results.items():
+            if normalize_query(location) == query:
+                if coordinates is None:
+                    raise GeocodingError(f'stub error for {query!r}')
+                return tuple(coordinates)
+        return _NOT_FOUND
+
+
+class GazetteerGeocoder:
+    """
+    Answer from core.Location rows that have coordinates, then fall back.
+
+    A query such as "navrangpura, ahmedabad" matches on the indexed
+    normalized name; trailing parts only disambiguate by city or state. A
+    unique prefix of a name also matches. Misses go to
+    settings.GEOCODER_FALLBACK_BACKEND (Nominatim by default); set it to
+    None to stay fully offline.
+    """
+
+    def lookup_local(self, query):
+        """Return (lat, lon) from the gazetteer, or None on a miss."""
+        from .models import Location
+
+        places = Location.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        fields = ('city', 'state', 'latitude', 'longitude')
+
+        candidates = list(places.filter(normalized_name=query).values_list(*fields)[:2])
+        if len(candidates) == 1:
+            return candidates[0][2], candidates[0][3]
+
+        name, _, rest = query.partition(', ')
+        qualifiers = {part for part in rest.split(', ') if part}
+        candidates = list(places.filter(normalized_name=name).values_list(*fields)[:20])
+        if not candidates:
+            # Range instead of LIKE so the name index is usable on every backend
+            candidates = list(places.filter(
+                normalized_name__gte=name, normalized_name__lt=name + '\uffff',
+            ).values_list(*fields)[:20])
+        if qualifiers:
+            candidates = [
+                place for place in candidates
+                if qualifiers & {normalize_query(place[0]), normalize_query(place[1])}
+            ]
+        if len(candidates) == 1:
+            return candidates[0][2], candidates[0][3]
+        return None
+
+    def geocode(self, query):
+        result = self.lookup_local(query)
+        if result is not None:
+            return result
+        fallback = _setting('GEOCODER_FALLBACK_BACKEND', DEFAULT_FALLBACK_BACKEND)
+        if not fallback:
+            return _NOT_FOUND
+        return _load_backend(fallback).geocode(query)
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path):
+    return import_string(path)()
+
+
+def get_geocoder():
+    """Return the configured geocoder backend instance."""
+    return _load_backend(_setting('GEOCODER_BACKEND', DEFAULT_BACKEND))
+
+
+def fetch_coordinates(query):
+    """Ask the configured backend about a normalized query, bypassing caches."""
+    return get_geocoder().geocode(query)
+
+
+def _ttl_for(result):
+    if result == _NOT_FOUND:
+        return _setting('GEOCODE_NEGATIVE_CACHE_TTL', NEGATIVE_CACHE_TTL)
+    return _setting('GEOCODE_CACHE_TTL', CACHE_TTL)
+
+
+def _memory_ttl_for(result):
+    return min(_ttl_for(result), _setting('GEOCODE_MEMORY_CACHE_TTL', MEMORY_CACHE_TTL))
+
+
+def _db_lookup(query):
+    from .models import GeocodeCache
+
+    entry = GeocodeCache.objects.filter(query=query).first()
+    if entry is None:
+        return None
+    result = (entry.latitude, entry.longitude) if entry.found else _NOT_FOUND
+    if entry.updated_at + timedelta(seconds=_ttl_for(result)) < timezone.now():
+        return None
+    return result
+
+
+def _db_store(query, result):
+    from .models import GeocodeCache
+
+    GeocodeCache.objects.update_or_create(
+        query=query,
+        defaults={'latitude': result[0], 'longitude': result[1], 'updated_at': timezone.now()},
+    )
+
+
+def remember(query, result):
+    """Record a provider answer for a normalized query in both cache layers."""
+    memory_cache.set(query, result, _memory_ttl_for(result))
+    _db_store(query, result)
+
+
+def cached_coordinates(location):
+    """
+    Return a cached (lat, lon) / (None, None) answer, or None if unknown.
+
+    Never calls the provider, so it is safe on the request path.
+    """
+    query = normalize_query(location)
+    if not query:
+        return _NOT_FOUND
+    result = memory_cache.get(query)
+    if result is not None:
+        stats.incr('memory_hits')
+        return result
+    result = _db_lookup(query)
+    if result is not None:
+        stats.incr('db_hits')
+        memory_cache.set(query, result, _memory_ttl_for(result))
+        return result
+    # Local backends (the gazetteer) are cheap enough for the request path
+    lookup_local = getattr(get_geocoder(), 'lookup_local', None)
+    if lookup_local is not None:
+        result = lookup_local(query)
+        if result is not None:
+            stats.incr('local_hits')
+            remember(query, result)
+            return result
+    stats.incr('misses')
+    return None
+
+
+def forget(name):
+    """Drop cached answers for a gazetteer name (with or without qualifiers)."""
+    from .models import GeocodeCache
+
+    def matches(query):
+        return query == name or query.startswith(name + ', ')
+
+    GeocodeCache.objects.filter(query=name).delete()
+    GeocodeCache.objects.filter(query__startswith=name + ', ').delete()
+    memory_cache.discard_matching(matches)
+
+
+def resolve(location):
+    """
+    Geocode a location through the caches; raise GeocodingError on provider errors.
+    """
+    query = normalize_query(location)
+    if not query:
+        return _NOT_FOUND
+
+    result = memory_cache.get(query)
+    if result is not None:
+        stats.incr('memory_hits')
+        return result
+
+    result = _db_lookup(query)
+    if result is not None:
+        stats.incr('db_hits')
+        memory_cache.set(query, result, _memory_ttl_for(result))
+        return result
+
+    # Errors propagate uncached so the next attempt retries
+    stats.incr('misses')
+    result = fetch_coordinates(query)
+
+    remember(query, result)
+    return result
+
+
+def geocode_location(location):
+    """
+    Geocode a location string to get latitude and longitude.
+
+    Returns (None, None) when the location is empty, unknown, or the
+    provider could not be reached.
+    """
+    try:
+        return resolve(location)
+    except GeocodingError:
+        return _NOT_FOUND
+
+
+def geocode_async():
+    """Whether model saves should queue geocoding instead of blocking on it."""
+    return _setting('GEOCODE_ASYNC', True)
+
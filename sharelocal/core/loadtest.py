@@ -0,0 +1,334 @@
+"""
+HTTP load generator for a running ShareLocal server (load_test command).
+
+Worker threads act as users: each logs in as one of the seed_bench users
+and then, until the time is up, picks a scenario from a weighted traffic
+mix and runs it over plain HTTP (urllib, cookies and CSRF handled like a
+browser, redirects not followed). Every request is timed under an
+endpoint label; Stats turns the samples into throughput, error rate and
+latency percentiles per endpoint.
+
+The server under test must use the same database as the command: item,
+category and request ids for the scenarios are sampled from it
+(TrafficData). Run the mix at increasing concurrency to find the point
+where throughput stops growing and only latency does.
+"""
+import http.cookiejar
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+from .benchmark import percentile
+
+# Scenario weights; see SCENARIOS
+DEFAULT_MIX = {
+    'home': 15,
+    'item_list': 10,
+    'item_search': 10,
+    'item_autocomplete': 10,
+    'item_filter': 5,
+    'item_nearby': 5,
+    'item_detail': 25,
+    'profile': 10,
+    'create_request': 12,
+    'accept_request': 8,
+}
+
+
+class Stats:
+    """Thread-safe latency samples and errors per endpoint label."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, label, seconds, status):
+        with self.lock:
+            self.latencies[label].append(seconds * 1000)
+            self.statuses[label][status] += 1
+            if not status or status >= 400:
+                self.errors[label] += 1
+
+    def summary(self, elapsed):
+        """{label: {...}} per endpoint plus a 'total' row; latencies in ms."""
+        with self.lock:
+            rows = {label: self._row(samples, self.errors[label], elapsed, self.statuses[label])
+                    for label, samples in sorted(self.latencies.items())}
+            everything = [sample for samples in self.latencies.values() for sample in samples]
+            if everything:
+                statuses = defaultdict(int)
+                for counts in self.statuses.values():
+                    for status, count in counts.items():
+                        statuses[status] += count
+                rows['total'] = self._row(everything, sum(self.errors.values()), elapsed, statuses)
+        return rows
+
+    @staticmethod
+    def _row(samples, errors, elapsed, statuses):
+        return {
+            'requests': len(samples),
+            'errors': errors,
+            'error_rate': round(errors / len(samples), 4),
+            'rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+            'p50_ms': round(percentile(samples, 50), 2),
+            'p90_ms': round(percentile(samples, 90), 2),
+            'p99_ms': round(percentile(samples, 99), 2),
+            'max_ms': round(max(samples), 2),
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        }
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Report 3xx responses instead of following them: each hop is timed on its own."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Client:
+    """One simulated browser: its own cookies, CSRF token and session."""
+
+    def __init__(self, base_url, stats, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect,
+        )
+
+    def csrf_token(self):
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def request(self, label, path, data=None):
+        """GET (or POST data) path; returns the status, 0 on connection errors."""
+        url = self.base_url + path
+        body = None
+        headers = {}
+        if data is not None:
+            token = self.csrf_token()
+            body = urllib.parse.urlencode({'csrfmiddlewaretoken': token, **data}).encode()
+            headers = {'X-CSRFToken': token, 'Referer': url}
+        start = time.perf_counter()
+        try:
+            with self.opener.open(urllib.request.Request(url, body, headers), timeout=self.timeout) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as error:
+            # Also raised for the redirects _NoRedirect refuses to follow
+            status = error.code
+            error.read()
+        except (urllib.error.URLError, OSError):
+            status = 0
+        self.stats.record(label, time.perf_counter() - start, status)
+        return status
+
+    def login(self, username, password):
+        self.request('login', '/accounts/login/')
+        return self.request('login', '/accounts/login/', {'username': username, 'password': password}) == 302
+
+
+class TrafficData:
+    """Ids and users for the scenarios, sampled from the database."""
+
+    def __init__(self, items, categories, words, points, users, pending):
+        self.items = items            # [(item_id, owner username)]
+        self.categories = categories  # [category_id]
+        self.words = words            # search terms
+        self.points = points          # [(lat, lon)] near items
+        self.users = users            # [username]
+        self.pending = pending        # {owner username: [pending request ids]}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_database(cls, prefix='bench', sample=1000):
+        from django.contrib.auth.models import User
+        from core.models import Category
+        from items.models import Item, SearchTerm
+        from request_app.models import ItemRequest
+
+        # Workers log in as owners with pending requests, so the accept
+        # flow has something to accept
+        pending = defaultdict(list)
+        for pk, owner in (
+            ItemRequest.objects.filter(status='Pending', item_owner__username__startswith=f'{prefix}-')
+            .values_list('pk', 'item_owner__username')[:sample * 10]
+        ):
+            pending[owner].append(pk)
+        users = list(pending)[:sample] or list(
+            User.objects.filter(username__startswith=f'{prefix}-', items__isnull=False)
+            .distinct().values_list('username', flat=True)[:sample]
+        )
+        items = list(
+            Item.objects.filter(is_available=True).order_by('?')
+            .values_list('pk', 'owner__username', 'latitude', 'longitude')[:sample]
+        )
+        return cls(
+            items=[(pk, owner) for pk, owner, _, _ in items],
+            categories=list(Category.objects.values_list('pk', flat=True)),
+            words=list(SearchTerm.objects.order_by('-frequency').values_list('word', flat=True)[:100]),
+            points=[(lat, lon) for _, _, lat, lon in items if lat is not None and lon is not None],
+            users=users,
+            pending=dict(pending),
+        )
+
+    def take_pending(self, owner):
+        """A pending request on owner's items, never handed out twice."""
+        with self.lock:
+            requests = self.pending.get(owner)
+            return requests.pop() if requests else None
+
+
+class VirtualUser:
+    """Scenario state of one worker."""
+
+    def __init__(self, client, data, rng, username, password):
+        self.client = client
+        self.data = data
+        self.rng = rng
+        self.username = username
+        self.password = password
+        self.logged_in = False
+
+    def ensure_login(self):
+        if not self.logged_in:
+            self.logged_in = self.client.login(self.username, self.password)
+        return self.logged_in
+
+    def other_item(self):
+        for _ in range(10):
+            item_id, owner = self.rng.choice(self.data.items)
+            if owner != self.username:
+                return item_id
+        return None
+
+
+# Scenarios: each runs one or more timed requests as user
+
+def home(user):
+    user.client.request('home', '/')
+
+
+def item_list(user):
+    sort = user.rng.choice(['newest', 'price_asc', 'price_desc'])
+    user.client.request('item_list', f'/items/?sort={sort}')
+
+
+def item_search(user):
+    if user.data.words:
+        query = urllib.parse.urlencode({'search': user.rng.choice(user.data.words)})
+        user.client.request('item_list?search', f'/items/?{query}')
+
+
+def item_autocomplete(user):
+    if user.data.words:
+        word = user.rng.choice(user.data.words)
+        # One keystroke of typing the word
+        query = urllib.parse.urlencode({'q': word[:user.rng.randint(1, len(word))]})
+        user.client.request('item_autocomplete', f'/items/autocomplete/?{query}')
+
+
+def item_filter(user):
+    params = {'item_type': user.rng.choice(['Share', 'Sell', 'Rent'])}
+    if user.data.categories:
+        params['category'] = user.rng.choice(user.data.categories)
+    user.client.request('item_list?filter', f'/items/?{urllib.parse.urlencode(params)}')
+
+
+def item_nearby(user):
+    if user.data.points:
+        lat, lon = user.rng.choice(user.data.points)
+        query = urllib.parse.urlencode({'lat': f'{lat:.4f}', 'lon': f'{lon:.4f}', 'radius': user.rng.choice([5, 10, 25])})
+        user.client.request('item_list?nearby', f'/items/?{query}')
+
+
+def item_detail(user):
+    if user.data.items:
+        user.client.request('item_detail', f'/items/{user.rng.choice(user.data.items)[0]}/')
+
+
+def profile(user):
+    if user.ensure_login():
+        user.client.request('profile', '/accounts/profile/')
+
+
+def create_request(user):
+    item_id = user.other_item()
+    if item_id and user.ensure_login():
+        path = f'/requests/request/create/{item_id}/'
+        user.client.request('create_request', path)
+        user.client.request('create_request POST', path, {})
+
+
+def accept_request(user):
+    if not user.ensure_login():
+        return
+    request_id = user.data.take_pending(user.username)
+    if request_id is None:
+        # Nothing left to accept: the owner looks at the list instead
+        user.client.request('request_list', '/requests/requests/?status=Pending')
+        return
+    path = f'/requests/request/{request_id}/accept/'
+    user.client.request('accept_request', path)
+    user.client.request('accept_request POST', path, {})
+
+
+SCENARIOS = {
+    'home': home,
+    'item_list': item_list,
+    'item_search': item_search,
+    'item_autocomplete': item_autocomplete,
+    'item_filter': item_filter,
+    'item_nearby': item_nearby,
+    'item_detail': item_detail,
+    'profile': profile,
+    'create_request': create_request,
+    'accept_request': accept_request,
+}
+
+
+def run(base_url, data, concurrency, duration, password, mix=None, seed=0, timeout=30):
+    """
+    Drive base_url with concurrency workers for duration seconds.
+
+    Returns (stats summary, elapsed seconds).
+    """
+    mix = mix or DEFAULT_MIX
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    stats = Stats()
+    deadline = time.monotonic() + duration
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        username = data.users[index % len(data.users)] if data.users else ''
+        user = VirtualUser(Client(base_url, stats, timeout), data, rng, username, password)
+        while time.monotonic() < deadline:
+            SCENARIOS[rng.choices(names, weights)[0]](user)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    return stats.summary(elapsed), elapsed
+
+
+def saturation_point(levels):
+    """
+    The concurrency after which throughput grew by less than 10%, given
+    [(concurrency, total summary row)] in increasing order; None if it
+    kept growing.
+    """
+    for (level, row), (_, following) in zip(levels, levels[1:]):
+        if following['rps'] < row['rps'] * 1.10:
+            return level
+    return None
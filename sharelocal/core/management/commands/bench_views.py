@@ -0,0 +1,46 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from core import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Time every view of the accounts, items, request_app and core apps through '
+        'the test client and print the results as JSON (seed data with seed_bench '
+        'first). Pass --compare with an earlier output to see the change per view.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to browse as (default: the user with most items)')
+        parser.add_argument('--repeat', type=int, default=10, help='Timed requests per view')
+        parser.add_argument('--warmup', type=int, default=1, help='Untimed requests per view')
+        parser.add_argument('--view', action='append', dest='views', help='Only time this URL name (repeatable)')
+        parser.add_argument('--output', help='Write the JSON here instead of stdout')
+        parser.add_argument('--compare', help='Earlier JSON output to compare p50 timings with')
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+        else:
+            user = User.objects.annotate(n=Count('items')).order_by('-n').first()
+        if user is None:
+            raise CommandError('No user to browse as; run seed_bench first or pass --user.')
+
+        results = benchmark.run(user, options['repeat'], options['warmup'], options['views'])
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            self.stderr.write(f'p50 vs {baseline.get("commit") or options["compare"]}:')
+            for name, before, after, change in benchmark.compare(baseline, results):
+                self.stderr.write(f'  {name:<22} {before:9.2f}ms -> {after:9.2f}ms  {change:+6.1f}%')
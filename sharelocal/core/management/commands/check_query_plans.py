@@ -0,0 +1,37 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+
+from core import queryplan
+
+
+class Command(BaseCommand):
+    help = (
+        'Request every view of the accounts, items, request_app and core apps and run '
+        'EXPLAIN QUERY PLAN on each SELECT they issue. Fails when a query scans a whole '
+        'table or sorts with a temp B-tree. Run it against a seeded SQLite database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to browse as (default: the user with most items)')
+        parser.add_argument('--view', action='append', dest='views', help='Only check this URL name (repeatable)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Query plans are only checked on SQLite.')
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+        else:
+            user = User.objects.annotate(n=Count('items')).order_by('-n').first()
+        if user is None:
+            raise CommandError('No user to browse as; run seed_bench first or pass --user.')
+
+        statuses, problems = queryplan.check(user, options['views'])
+
+        for problem in problems:
+            self.stdout.write(f'{problem.view}: {problem.step}\n    {problem.sql}')
+        if problems:
+            views = sorted({problem.view for problem in problems})
+            raise CommandError(f'{len(problems)} plan problem(s) in {", ".join(views)}')
+        self.stdout.write(self.style.SUCCESS(f'{len(statuses)} views checked, no full scans or temp B-tree sorts'))
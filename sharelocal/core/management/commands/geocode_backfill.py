@@ -0,0 +1,130 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from accounts.models import UserProfile
+from core.geocoding import (
+    GeocodingError, TokenBucket, cached_coordinates, fetch_coordinates, normalize_query, remember, stats,
+)
+from items.geo import geohash_encode
+from items.models import Item
+from items.spatial import spatial_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Geocode every distinct Item/UserProfile location that still lacks coordinates. '
+        'Each distinct location is resolved once and stored in the geocode cache as soon as it '
+        'is known, and rows are written back in committed batches, so an interrupted run '
+        'resumes where it stopped when started again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent provider requests')
+        parser.add_argument('--rate', type=float, default=1.0, help='Provider requests per second')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per bulk_update')
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Also retry locations previously reported as not found')
+
+    def handle(self, *args, **options):
+        self.retry_failed = options['retry_failed']
+        models = [Item, UserProfile]
+
+        queries = set()
+        for model in models:
+            for location in self._pending_rows(model).values_list('location', flat=True).distinct():
+                query = normalize_query(location)
+                if query:
+                    queries.add(query)
+        self.stdout.write(f'{len(queries)} distinct location(s) to resolve')
+
+        results = {}
+        missing = []
+        for query in queries:
+            result = cached_coordinates(query)
+            if result is None or (self.retry_failed and result == (None, None)):
+                missing.append(query)
+            else:
+                results[query] = result
+        self.stdout.write(f'{len(results)} already cached, {len(missing)} to fetch')
+
+        results.update(self._fetch(missing, options['workers'], options['rate']))
+
+        for model in models:
+            updated = self._write_back(model, results, options['batch_size'])
+            self.stdout.write(f'{model._meta.verbose_name_plural}: {updated} row(s) updated')
+        self.stdout.write(f'Geocoder stats: {stats.snapshot()}')
+        self.stdout.write(self.style.SUCCESS('Backfill complete'))
+
+    def _pending_rows(self, model):
+        rows = model.objects.exclude(location__isnull=True).exclude(location='').filter(
+            Q(latitude__isnull=True) | Q(longitude__isnull=True)
+        )
+        if not self.retry_failed:
+            rows = rows.exclude(geocode_status='failed')
+        return rows
+
+    def _fetch(self, queries, workers, rate):
+        """Resolve queries through a bounded, rate-limited thread pool."""
+        bucket = TokenBucket(rate)
+        results = {}
+
+        def fetch(query):
+            bucket.acquire()
+            return fetch_coordinates(query)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {pool.submit(fetch, query): query for query in queries}
+            for done, future in enumerate(as_completed(futures), start=1):
+                query = futures[future]
+                try:
+                    result = future.result()
+                except GeocodingError as exc:
+                    # Left out of the cache and the results: retried on the next run
+                    self.stderr.write(f'  {query!r}: {exc}')
+                    continue
+                # Persist right away; this is the checkpoint a rerun resumes from
+                remember(query, result)
+                results[query] = result
+                if done % 100 == 0:
+                    self.stdout.write(f'  fetched {done}/{len(queries)}')
+        return results
+
+    def _write_back(self, model, results, batch_size):
+        ids = list(self._pending_rows(model).values_list('id', flat=True))
+        fields = ['latitude', 'longitude', 'geocode_status']
+        if model is Item:
+            fields.append('geohash')
+
+        updated = 0
+        for start in range(0, len(ids), batch_size):
+            batch = []
+            for obj in model.objects.filter(id__in=ids[start:start + batch_size]):
+                result = results.get(normalize_query(obj.location))
+                if result is None:
+                    continue
+                lat, lon = result
+                if lat is None or lon is None:
+                    obj.geocode_status = 'failed'
+                else:
+                    obj.latitude, obj.longitude = lat, lon
+                    obj.geocode_status = 'resolved'
+                    if model is Item:
+                        obj.geohash = geohash_encode(lat, lon)
+                batch.append(obj)
+            if not batch:
+                continue
+            with transaction.atomic():
+                model.objects.bulk_update(batch, fields)
+                if model is Item:
+                    # bulk_update skips Item signals, so patch the spatial index directly
+                    rows = [(obj.id, obj.latitude, obj.longitude, obj.is_available) for obj in batch]
+                    transaction.on_commit(lambda rows=rows: spatial_index.upsert_many(rows))
+                else:
+                    # As the geocoding worker does, pass profile coordinates on to the items
+                    for profile in batch:
+                        profile.sync_items_location()
+            updated += len(batch)
+        return updated
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.geocode_queue import requeue_stale, run_pending
+from core.geocoding import stats
+
+
+class Command(BaseCommand):
+    help = 'Drain the geocoding job queue, filling in item and profile coordinates.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            # Jobs claimed by a worker that died
+            requeued = requeue_stale()
+            if requeued:
+                self.stdout.write(f'Took back {requeued} stale geocoding job(s)')
+            handled = run_pending(batch_size=options['batch_size'])
+            total += handled
+            if handled:
+                self.stdout.write(f'Processed {handled} geocoding job(s)')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
+        self.stdout.write(f'Geocoder stats: {stats.snapshot()}')
+        self.stdout.write(self.style.SUCCESS(f'Done, {total} job(s) processed'))
@@ -0,0 +1,92 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import loadtest
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive a running ShareLocal server with a weighted traffic mix (browsing, '
+        'search, nearby search, item pages, request and accept flows, profile) and '
+        'report throughput, error rate and latency percentiles per endpoint. The '
+        'server must use the same database (seed it with seed_bench). Pass several '
+        '--concurrency levels to find the saturation point of a worker.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the server under test')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                            help='Concurrent simulated users; one run per level')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds per concurrency level')
+        parser.add_argument('--prefix', default='bench', help='Username prefix of the seed_bench users')
+        parser.add_argument('--password', default='bench-password', help='Password of the seed_bench users')
+        parser.add_argument('--mix', help='Scenario weights, e.g. "home=20,item_detail=50,profile=30"')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds before a request counts as failed')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Also write every level\'s results to this JSON file')
+
+    def handle(self, *args, **options):
+        mix = self._mix(options['mix'])
+        data = loadtest.TrafficData.from_database(options['prefix'])
+        if not data.items or not data.users:
+            raise CommandError(f'No items or {options["prefix"]}-* users with items; run seed_bench first.')
+
+        levels = []
+        for concurrency in options['concurrency']:
+            summary, elapsed = loadtest.run(
+                options['url'], data, concurrency, options['duration'], options['password'],
+                mix=mix, seed=options['seed'], timeout=options['timeout'],
+            )
+            if 'total' not in summary:
+                raise CommandError(f'No requests completed against {options["url"]}.')
+            levels.append((concurrency, summary))
+            self._report(concurrency, elapsed, summary)
+
+        if len(levels) > 1:
+            self.stdout.write('\nconcurrency      req/s   errors      p50      p99')
+            for concurrency, summary in levels:
+                total = summary['total']
+                self.stdout.write(
+                    f'{concurrency:>11} {total["rps"]:>10.1f} {total["error_rate"]:>8.1%} '
+                    f'{total["p50_ms"]:>6.0f}ms {total["p99_ms"]:>6.0f}ms'
+                )
+            point = loadtest.saturation_point([(level, summary['total']) for level, summary in levels])
+            if point is None:
+                self.stdout.write('Throughput still growing at the highest level; try more concurrency.')
+            else:
+                self.stdout.write(self.style.WARNING(f'Throughput saturates at {point} concurrent users.'))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'url': options['url'],
+                    'duration': options['duration'],
+                    'mix': mix or loadtest.DEFAULT_MIX,
+                    'levels': {str(level): summary for level, summary in levels},
+                }, f, indent=2)
+
+    def _mix(self, spec):
+        if not spec:
+            return None
+        mix = {}
+        for part in spec.split(','):
+            name, _, weight = part.partition('=')
+            name = name.strip()
+            if name not in loadtest.SCENARIOS:
+                raise CommandError(f'Unknown scenario {name!r}; choose from {", ".join(loadtest.SCENARIOS)}.')
+            try:
+                mix[name] = float(weight)
+            except ValueError:
+                raise CommandError(f'Bad weight for {name!r}: {weight!r}')
+        return mix
+
+    def _report(self, concurrency, elapsed, summary):
+        self.stdout.write(f'\n{concurrency} concurrent users, {elapsed:.1f}s')
+        self.stdout.write(f'{"endpoint":<22} {"requests":>8} {"req/s":>8} {"errors":>7} '
+                          f'{"p50":>8} {"p90":>8} {"p99":>8}')
+        for label, row in summary.items():
+            self.stdout.write(
+                f'{label:<22} {row["requests"]:>8} {row["rps"]:>8.1f} {row["error_rate"]:>7.1%} '
+                f'{row["p50_ms"]:>6.1f}ms {row["p90_ms"]:>6.1f}ms {row["p99_ms"]:>6.1f}ms'
+            )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core import counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the materialized site counters from the source tables and '
+        'fix any drift. Safe to run periodically (e.g. from cron).'
+    )
+
+    def handle(self, *args, **options):
+        drift = counters.reconcile()
+        for name, (stored, actual) in sorted(drift.items()):
+            self.stdout.write(f'{name}: {stored} -> {actual}')
+        self.stdout.write(self.style.SUCCESS(f'Counters reconciled, {len(drift)} corrected'))
@@ -0,0 +1,187 @@
+import math
+import random
+import time
+from collections import Counter
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts.models import UserProfile
+from core import counters
+from core.benchmark import BOUNDS
+from core.models import Category, Location
+from items import trigram
+from items.geo import geohash_encode
+from items.models import Item
+from request_app import counters as request_counters
+from request_app.models import ItemRequest
+
+DEFAULT_CATEGORIES = ('Tools', 'Electronics', 'Books', 'Furniture', 'Sports', 'Garden', 'Kitchen', 'Toys')
+ADJECTIVES = (
+    'cordless', 'vintage', 'electric', 'wooden', 'folding', 'portable', 'large', 'small',
+    'kids', 'outdoor', 'camping', 'mountain', 'acoustic', 'digital', 'cast iron', 'leather',
+)
+NOUNS = (
+    'drill', 'ladder', 'bicycle', 'guitar', 'tent', 'camera', 'projector', 'table', 'chair',
+    'lawn mower', 'sewing machine', 'pressure washer', 'stroller', 'kayak', 'saw', 'speaker',
+    'bookshelf', 'skillet', 'telescope', 'sleeping bag', 'board game', 'keyboard', 'monitor', 'jacket',
+)
+STATUSES = ('Pending', 'Accepted', 'Rejected')
+STATUS_WEIGHTS = (3, 4, 3)
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk-create a synthetic data set for benchmarks: users with profiles, '
+        'geolocated items and item requests. Bypasses Item.save() (no geocoding, '
+        'no per-row signals) and writes in batched transactions, then reconciles '
+        'the counters and adds the titles to the search vocabulary. Never run it against production.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--items', type=int, default=1000000)
+        parser.add_argument('--requests', type=int, default=5000000)
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows per transaction')
+        parser.add_argument('--prefix', default='bench', help='Username prefix of the generated users')
+        parser.add_argument('--password', default='bench-password',
+                            help='Password of every generated user (for load tests)')
+        parser.add_argument('--towns', type=int, default=200,
+                            help='Synthetic towns to use when the gazetteer has no coordinates')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        users, items, requests = options['users'], options['items'], options['requests']
+        if users < 2 or items < 1:
+            raise CommandError('Need at least 2 users and 1 item.')
+        if requests > items * (users - 1):
+            raise CommandError('Too many requests: each user can request an item only once.')
+        if User.objects.filter(username__startswith=f'{options["prefix"]}-').exists():
+            raise CommandError(f'Users named {options["prefix"]}-* already exist; pass another --prefix.')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        towns = self._towns(options['towns'])
+        categories = self._categories()
+
+        user_ids, user_towns = self._seed_users(users, options['prefix'], options['password'], towns)
+        item_ids, item_owners = self._seed_items(items, user_ids, user_towns, categories)
+        self._seed_requests(requests, item_ids, item_owners, user_ids)
+
+        started = time.perf_counter()
+        counters.reconcile()
+        request_counters.reconcile()
+        self._log('counters reconciled', started)
+
+    def _log(self, message, started):
+        self.stdout.write(f'{message} in {time.perf_counter() - started:.1f}s')
+
+    def _batches(self, rows):
+        """Yield lists of at most batch_size rows."""
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _towns(self, count):
+        towns = list(
+            Location.objects.filter(latitude__isnull=False, longitude__isnull=False)
+            .values_list('name', 'latitude', 'longitude')
+        )
+        return towns or [
+            (f'Town {i}', self.rng.uniform(BOUNDS[0], BOUNDS[1]), self.rng.uniform(BOUNDS[2], BOUNDS[3]))
+            for i in range(count)
+        ]
+
+    def _categories(self):
+        if not Category.objects.exists():
+            Category.objects.bulk_create(Category(name=name) for name in DEFAULT_CATEGORIES)
+        return list(Category.objects.values_list('pk', flat=True))
+
+    def _seed_users(self, count, prefix, password, towns):
+        started = time.perf_counter()
+        # Hashing is slow: every user shares one hash
+        password = make_password(password)
+        user_ids, user_towns = [], []
+        for batch in self._batches(range(count)):
+            with transaction.atomic():
+                created = User.objects.bulk_create(
+                    User(username=f'{prefix}-{i}', password=password, email=f'{prefix}-{i}@example.com')
+                    for i in batch
+                )
+                profiles = []
+                for user in created:
+                    town = self.rng.choice(towns)
+                    profiles.append(UserProfile(
+                        user=user, phone='555-0100', location=town[0],
+                        latitude=town[1], longitude=town[2], geocode_status='resolved',
+                    ))
+                    user_ids.append(user.pk)
+                    user_towns.append(town)
+                UserProfile.objects.bulk_create(profiles)
+        self._log(f'{count} users', started)
+        return user_ids, user_towns
+
+    def _seed_items(self, count, user_ids, user_towns, categories):
+        started = time.perf_counter()
+        # A few users own many items, most own a handful
+        weights = [1 / (rank + 1) ** 0.8 for rank in range(len(user_ids))]
+        cumulative, total = [], 0.0
+        for weight in weights:
+            total += weight
+            cumulative.append(total)
+        owners = self.rng.choices(range(len(user_ids)), cum_weights=cumulative, k=count)
+
+        words = Counter()
+        item_ids = []
+        for batch in self._batches(owners):
+            rows = []
+            for owner in batch:
+                name, lat, lon = user_towns[owner]
+                # Within a few km of the owner's town
+                lat += self.rng.uniform(-0.05, 0.05)
+                lon += self.rng.uniform(-0.05, 0.05)
+                title = f'{self.rng.choice(ADJECTIVES)} {self.rng.choice(NOUNS)}'.capitalize()
+                item_type = self.rng.choice(('Share', 'Share', 'Sell', 'Rent'))
+                words.update(trigram.words(title))
+                rows.append(Item(
+                    owner_id=user_ids[owner], category_id=self.rng.choice(categories),
+                    title=title, description=f'{title} in good condition, available for pickup in {name}.',
+                    location=name, latitude=lat, longitude=lon, geohash=geohash_encode(lat, lon),
+                    geocode_status='resolved', item_type=item_type,
+                    price=None if item_type == 'Share' else self.rng.randint(5, 500),
+                    is_available=self.rng.random() < 0.9,
+                ))
+            with transaction.atomic():
+                item_ids.extend(item.pk for item in Item.objects.bulk_create(rows))
+        trigram.add_words(words)
+        self._log(f'{count} items', started)
+        return item_ids, owners
+
+    def _seed_requests(self, count, item_ids, item_owners, user_ids):
+        started = time.perf_counter()
+        items = len(item_ids)
+        # Walk the items with a stride so requests spread over the whole
+        # catalogue; the n-th pass over an item uses the n-th user after
+        # its owner, so no user requests the same item twice
+        stride = next(step for step in range(items // 2 + 1, 2 * items + 2) if math.gcd(step, items) == 1)
+        statuses = self.rng.choices(STATUSES, weights=STATUS_WEIGHTS, k=count)
+        for batch in self._batches(range(count)):
+            rows = []
+            for k in batch:
+                index = k * stride % items
+                requester = (item_owners[index] + 1 + k // items) % len(user_ids)
+                rows.append(ItemRequest(
+                    item_id=item_ids[index], item_owner_id=user_ids[item_owners[index]],
+                    requested_by_id=user_ids[requester], status=statuses[k],
+                ))
+            with transaction.atomic():
+                ItemRequest.objects.bulk_create(rows)
+        self._log(f'{count} requests', started)
+
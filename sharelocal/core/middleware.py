@@ -0,0 +1,47 @@
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .querybudget import QueryRecorder, load_budgets, violations
+
+logger = logging.getLogger('sharelocal.querybudget')
+
+
+class QueryBudgetMiddleware:
+    """
+    Record the SQL of every request and compare it with the checked-in
+    query budgets (see core.querybudget).
+
+    Opt-in: add 'core.middleware.QueryBudgetMiddleware' to MIDDLEWARE. It
+    only runs when DEBUG or QUERY_BUDGET_ENABLED is set. Responses get
+    X-Query-Count and X-Query-Time headers; requests over budget are
+    logged as warnings with the duplicate report (QUERY_BUDGET_RAISE turns
+    that into an error, for use in development).
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.budgets = load_budgets()
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        name = match.url_name if match else None
+        budget = self.budgets.get(name, {})
+        problems = violations(recorder, budget)
+
+        response['X-Query-Count'] = str(recorder.count)
+        response['X-Query-Time'] = f'{recorder.total_time * 1000:.1f}ms'
+        if problems:
+            message = f'{request.path} over query budget ({"; ".join(problems)})\n{recorder.report(name, budget)}'
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise AssertionError(message)
+            logger.warning(message)
+        elif recorder.duplicates():
+            logger.debug(recorder.report(name or request.path, budget))
+        return response
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:34
+
+import re
+
+from django.db import migrations, models
+
+
+def normalize_query(location):
+    """core.geocoding.normalize_query as of this migration."""
+    if not location:
+        return ''
+    query = re.sub(r'\s+', ' ', location.casefold())
+    query = re.sub(r'\s*[,;](?:\s*[,;])*\s*', ', ', query)
+    return query.strip(' ,.')
+
+
+def fill_normalized_names(apps, schema_editor):
+    """Index existing locations under their normalized name."""
+    Location = apps.get_model('core', 'Location')
+    locations = list(Location.objects.all())
+    for location in locations:
+        location.normalized_name = normalize_query(location.name)
+    Location.objects.bulk_update(locations, ['normalized_name'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_geocodejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='normalized_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(fill_normalized_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:20
+
+from django.db import migrations, models
+
+
+def seed_counters(apps, schema_editor):
+    """Start the counters from the current table sizes."""
+    SiteCounter = apps.get_model('core', 'SiteCounter')
+    Item = apps.get_model('items', 'Item')
+    ItemRequest = apps.get_model('request_app', 'ItemRequest')
+
+    values = {
+        'items': Item.objects.count(),
+        'requests': ItemRequest.objects.count(),
+        'item_owners': Item.objects.values('owner').distinct().count(),
+    }
+    for name, value in values.items():
+        SiteCounter.objects.update_or_create(name=name, defaults={'value': value})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_location_gazetteer'),
+        ('items', '0010_search_terms'),
+        ('request_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Site Counter',
+                'verbose_name_plural': 'Site Counters',
+            },
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
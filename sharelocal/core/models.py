@@ -1,6 +1,16 @@
 from django.db import models
 from django.utils import timezone
 
+from .geocoding import forget, normalize_query
+
+
+# Geocoding state of a model with a free-text location (Item, UserProfile)
+GEOCODE_STATUS_CHOICES = [
+    ('', 'No location'),
+    ('pending', 'Pending geocode'),
+    ('resolved', 'Resolved'),
+    ('failed', 'Not found'),
+]
 
 class Category(models.Model):
     """
@@ -23,11 +33,17 @@ class Category(models.Model):
 class Location(models.Model):
     """
     Location/Area model for better location management.
+
+    Locations with coordinates double as a local gazetteer: the
+    GazetteerGeocoder answers from them before asking the network provider.
     """
     name = models.CharField(max_length=100, unique=True)
     city = models.CharField(max_length=100)
     state = models.CharField(max_length=100, blank=True)
     zip_code = models.CharField(max_length=20, blank=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    normalized_name = models.CharField(max_length=100, db_index=True, editable=False, default='')
     created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
@@ -35,7 +51,99 @@ class Location(models.Model):
         verbose_name = 'Location'
         verbose_name_plural = 'Locations'
 
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_query(self.name)
+        super().save(*args, **kwargs)
+        # Earlier answers for this name may now be wrong
+        forget(self.normalized_name)
+
     def __str__(self):
         if self.state:
             return f"{self.name}, {self.city}, {self.state}"
-        return f"{self.name}, {self.city}"
\ No newline at end of file
+        return f"{self.name}, {self.city}"
+
+
+class GeocodeCache(models.Model):
+    """
+    Persistent cache of geocoding results keyed by the normalized query.
+
+    Rows without coordinates record that the provider found nothing, so
+    unresolvable locations are not looked up again until they expire.
+    """
+    query = models.CharField(max_length=255, unique=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Geocode Cache Entry'
+        verbose_name_plural = 'Geocode Cache'
+
+    @property
+    def found(self):
+        return self.latitude is not None and self.longitude is not None
+
+    def __str__(self):
+        if self.found:
+            return f"{self.query} ({self.latitude}, {self.longitude})"
+        return f"{self.query} (not found)"
+
+
+class GeocodeJob(models.Model):
+    """
+    Queued geocoding work for an Item or UserProfile.
+
+    Saves enqueue a job instead of calling the provider inline; the
+    geocode_worker management command drains the queue.
+    """
+    TARGET_CHOICES = [
+        ('item', 'Item'),
+        ('profile', 'User profile'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    target = models.CharField(max_length=20, choices=TARGET_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    location = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['available_at', 'id']
+        verbose_name = 'Geocode Job'
+        verbose_name_plural = 'Geocode Jobs'
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='core_geojob_status_avail_idx'),
+            models.Index(fields=['target', 'object_id'], name='core_geojob_target_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.target}#{self.object_id}: {self.location} ({self.status})"
+
+
+class SiteCounter(models.Model):
+    """
+    A named site-wide count kept up to date by core.counters.
+
+    Saves the home page from counting whole tables on every hit.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Site Counter'
+        verbose_name_plural = 'Site Counters'
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
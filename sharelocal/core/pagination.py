@@ -0,0 +1,395 @@
+"""
+Keyset (cursor) pagination.
+
+Paginator pages with OFFSET: page N reads and discards the N-1 pages
+before it, and every page also runs a COUNT(*). KeysetPaginator orders
+by a sort key ending in a unique column (e.g. ('-created_at', '-id'))
+and fetches the page after (or before) a boundary row with
+
+    WHERE (created_at, id) < (boundary) ORDER BY created_at DESC, id DESC LIMIT n + 1
+
+An index on the same columns serves every page with one range scan, so
+page 5,000 costs what page 1 does. There are no page numbers: pages link
+to each other with cursors, opaque signed tokens holding the direction
+and the boundary row's key. A tampered or stale token reads as the first
+page.
+
+NULL sort keys (e.g. the price of give-away items) are ordered where the
+database puts them, first or last according to nulls_order_largest.
+
+Listings that keep page numbers use EstimatedCountPaginator, which only
+counts small results exactly; see estimated_count().
+"""
+import bisect
+import hashlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+
+SALT = 'core.pagination.cursor'
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+# Cursor of the last page: the rows before the end
+LAST = signing.dumps([PREVIOUS, None], salt=SALT)
+
+
+def _json_value(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, Decimal):
+        return str(value)
+    # Dates and datetimes; parsed back by the model field
+    return value.isoformat(sep=' ') if hasattr(value, 'isoformat') else str(value)
+
+
+class KeysetPage:
+    """One page of a KeysetPaginator; iterates like a Paginator page."""
+
+    def __init__(self, object_list, paginator, has_previous, has_next):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return self.paginator.cursor(PREVIOUS, self.object_list[0])
+
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return self.paginator.cursor(NEXT, self.object_list[-1])
+
+
+class SortedKeys:
+    """A list of key tuples in ascending order, as a KeysetPaginator source."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def after(self, key, n):
+        start = 0 if key is None else bisect.bisect_right(self.rows, key)
+        return self.rows[start:start + n]
+
+    def before(self, key, n):
+        end = len(self.rows) if key is None else bisect.bisect_left(self.rows, key)
+        return self.rows[max(end - n, 0):end]
+
+
+class KeysetPaginator:
+    """
+    Page through object_list in ordering, per_page rows at a time.
+
+    object_list is a queryset, a list of key tuples already sorted in
+    ascending order, or an object reading such keys on demand through
+    after(key, n) and before(key, n) (e.g. the spatial index's
+    Neighbours). The last field of ordering must be unique so every row
+    has its own position.
+    """
+
+    def __init__(self, object_list, ordering, per_page):
+        if isinstance(object_list, list):
+            object_list = SortedKeys(object_list)
+        self.object_list = object_list
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = [name.lstrip('-') for name in self.ordering]
+
+    def key(self, row):
+        if isinstance(row, tuple):
+            return row
+        return tuple(getattr(row, field) for field in self.fields)
+
+    def cursor(self, direction, row):
+        return signing.dumps([direction, [_json_value(value) for value in self.key(row)]], salt=SALT)
+
+    def _decode(self, cursor):
+        """(direction, key) of a cursor token; (NEXT, None) for the first page."""
+        if not cursor:
+            return NEXT, None
+        try:
+            direction, key = signing.loads(cursor, salt=SALT)
+        except (signing.BadSignature, TypeError, ValueError):
+            return NEXT, None
+        if direction not in (NEXT, PREVIOUS) or (key is not None and len(key) != len(self.fields)):
+            return NEXT, None
+        if key is not None and isinstance(self.object_list, QuerySet):
+            try:
+                key = [self._to_python(field, value) for field, value in zip(self.fields, key)]
+            except Exception:
+                return NEXT, None
+        return direction, key
+
+    def _to_python(self, field, value):
+        if value is None:
+            return None
+        try:
+            return self.object_list.model._meta.get_field(field).to_python(value)
+        except FieldDoesNotExist:
+            # An annotation, e.g. distance_km
+            return value
+
+    def page(self, cursor=None):
+        direction, key = self._decode(cursor)
+        if isinstance(self.object_list, QuerySet):
+            return self._queryset_page(direction, key)
+        return self._keys_page(direction, key)
+
+    def _keys_page(self, direction, key):
+        key = None if key is None else tuple(key)
+        if direction == NEXT:
+            rows = self.object_list.after(key, self.per_page + 1)
+            return KeysetPage(rows[:self.per_page], self, key is not None, len(rows) > self.per_page)
+        rows = self.object_list.before(key, self.per_page + 1)
+        return KeysetPage(rows[-self.per_page:], self, len(rows) > self.per_page, key is not None)
+
+    def _queryset_page(self, direction, key):
+        ordering = self.ordering
+        if direction == PREVIOUS:
+            # Walk backwards from the boundary, then restore the order
+            ordering = tuple(name[1:] if name.startswith('-') else f'-{name}' for name in ordering)
+        queryset = self.object_list.order_by(*ordering)
+        limit = self.per_page + 1
+        if key is None:
+            rows = list(queryset[:limit])
+        else:
+            rows = []
+            for condition in self._after(ordering, key):
+                rows += queryset.filter(condition)[:limit - len(rows)]
+                if len(rows) == limit:
+                    break
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == PREVIOUS:
+            rows.reverse()
+            return KeysetPage(rows, self, more, key is not None)
+        return KeysetPage(rows, self, key is not None, more)
+
+    def _nullable(self, field):
+        try:
+            return self.object_list.model._meta.get_field(field).null
+        except FieldDoesNotExist:
+            return False
+
+    def _after(self, ordering, key):
+        """
+        The rows after key in ordering, as conditions to query in turn.
+
+        Comparisons are OR-ed into one condition, which an index range scan
+        serves; IS [NOT] NULL tests in the same OR would make it a full scan,
+        so the NULL rows of a nullable sort key get conditions of their own,
+        only queried once the page reaches them.
+        """
+        nulls_largest = connections[self.object_list.db].features.nulls_order_largest
+        parts = []  # (condition, plain comparison?) in sort order
+        for i in reversed(range(len(ordering))):
+            equal, plain = Q(), True
+            for name, value in zip(ordering[:i], key[:i]):
+                if value is None:
+                    equal &= Q(**{f'{name.lstrip("-")}__isnull': True})
+                    plain = False
+                else:
+                    equal &= Q(**{name.lstrip('-'): value})
+            field, value = ordering[i].lstrip('-'), key[i]
+            ascending = not ordering[i].startswith('-')
+            # NULLs come after every value when walking this way
+            nulls_after = ascending == nulls_largest
+            if value is None:
+                if not nulls_after:
+                    parts.append((equal & Q(**{f'{field}__isnull': False}), False))
+            else:
+                parts.append((equal & Q(**{f'{field}__{"gt" if ascending else "lt"}': value}), plain))
+                if nulls_after and self._nullable(field):
+                    parts.append((equal & Q(**{f'{field}__isnull': True}), False))
+
+        conditions = []
+        for condition, plain in parts:
+            if plain and conditions and conditions[-1][1]:
+                conditions[-1] = (conditions[-1][0] | condition, True)
+            else:
+                conditions.append((condition, plain))
+        if key[0] is not None:
+            # Every comparison keeps the first column at or beyond its key
+            # value. Saying so outright gives SQLite the range to seek: it
+            # only derives one from the OR when the values are literals,
+            # not bound parameters
+            first = ordering[0]
+            bound = Q(**{f'{first.lstrip("-")}__{"lte" if first.startswith("-") else "gte"}': key[0]})
+            conditions = [(bound & condition if plain else condition, plain) for condition, plain in conditions]
+        return [condition for condition, _ in conditions]
+
+
+# Results up to this size are counted exactly on every request
+EXACT_COUNT_LIMIT = 1000
+# How long the count of a larger result is reused
+COUNT_CACHE_TTL = 300
+
+
+def _generation_key(model):
+    return f'pagination:generation:{model._meta.label_lower}'
+
+
+def count_cache_key(queryset, kind='count'):
+    """
+    Cache key for the count of queryset: its filters only, so the sort
+    order and the selected columns share one count, plus the model's
+    generation (see invalidate_counts()). Other counts over the same
+    filters (items.facets) pass their own kind.
+    """
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    digest = hashlib.md5(f'{queryset.db}:{sql}:{params!r}'.encode()).hexdigest()
+    generation = cache.get(_generation_key(queryset.model), 0)
+    return f'pagination:{kind}:{generation}:{digest}'
+
+
+def invalidate_counts(model):
+    """
+    Retire the cached counts of every queryset over model, for writes
+    that move many rows in or out of a listing at once.
+    """
+    key = _generation_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def planner_estimate(queryset):
+    """
+    The number of rows the database's statistics give for queryset, or
+    None when they have nothing to say: PostgreSQL's planner estimate, or
+    the row count ANALYZE stored in sqlite_stat1 for an unfiltered table.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        return int(plan[0]['Plan']['Plan Rows'])
+    if connection.vendor == 'sqlite' and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [queryset.model._meta.db_table])
+            # The first number is the rows in the index; partial indexes hold fewer
+            counts = [int(stat.split()[0]) for stat, in cursor.fetchall()]
+        return max(counts, default=None)
+    return None
+
+
+def estimated_count(queryset, exact_limit=None, ttl=None):
+    """
+    (count, estimated) for queryset.
+
+    Counting stops after exact_limit + 1 rows, so a small result is
+    counted exactly on every call. Past that the count is an estimate:
+    the database statistics when they have one, otherwise an exact count
+    cached for ttl seconds per filter set.
+    """
+    if exact_limit is None:
+        exact_limit = getattr(settings, 'PAGINATION_EXACT_COUNT_LIMIT', EXACT_COUNT_LIMIT)
+    count = queryset.order_by()[:exact_limit + 1].count()
+    if count <= exact_limit:
+        return count, False
+
+    key = count_cache_key(queryset)
+    count = cache.get(key)
+    if count is None:
+        count = planner_estimate(queryset)
+        if count is None or count <= exact_limit:
+            # No statistics, or stale ones that contradict the capped count
+            count = queryset.count()
+        if ttl is None:
+            ttl = getattr(settings, 'PAGINATION_COUNT_CACHE_TTL', COUNT_CACHE_TTL)
+        cache.set(key, count, ttl)
+    return count, True
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A Paginator whose count of a large queryset is an estimate (see
+    estimated_count()); estimated tells templates to say "about N".
+    Page numbers past the real end give an empty page.
+    """
+
+    def __init__(self, *args, exact_limit=None, ttl=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.exact_limit = exact_limit
+        self.ttl = ttl
+
+    @cached_property
+    def counted(self):
+        if isinstance(self.object_list, QuerySet):
+            return estimated_count(self.object_list, self.exact_limit, self.ttl)
+        return Paginator.count.func(self), False
+
+    @property
+    def count(self):
+        return self.counted[0]
+
+    @property
+    def estimated(self):
+        return self.counted[1]
+
+
+def page_links(request, page):
+    """
+    Querystrings for the first/previous/next/last links of page (a
+    KeysetPage or a Paginator page), keeping the other GET parameters.
+    """
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    params.pop('page', None)
+
+    def link(**changes):
+        query = params.copy()
+        for name, value in changes.items():
+            query[name] = value
+        return query.urlencode()
+
+    if isinstance(page, KeysetPage):
+        return {
+            'first': link(),
+            'previous': link(cursor=page.previous_cursor()) if page.has_previous() else None,
+            'next': link(cursor=page.next_cursor()) if page.has_next() else None,
+            'last': link(cursor=LAST),
+        }
+    return {
+        'first': link(page=1),
+        'previous': link(page=page.previous_page_number()) if page.has_previous() else None,
+        'next': link(page=page.next_page_number()) if page.has_next() else None,
+        'last': link(page=page.paginator.num_pages),
+    }
@@ -0,0 +1,138 @@
+"""
+Per-view SQL query budgets.
+
+QueryRecorder wraps a database connection (connection.execute_wrapper)
+and records every query run inside it: the SQL, its duration, a
+fingerprint (the SQL with literals and IN lists collapsed, so the same
+query with different parameters matches) and the template line that
+triggered it, if any. A fingerprint seen more than once is a duplicate:
+usually an N+1 loop in a template.
+
+Budgets are checked in to query_budgets.json (QUERY_BUDGETS_FILE), keyed
+by URL name:
+
+    {"item_list": {"queries": 8, "duplicates": 0}}
+
+QueryBudgetTests in core.tests requests every URL of the project's apps
+on a seeded data set and fails when a view goes over its budget;
+core.middleware.QueryBudgetMiddleware applies the same checks to live
+requests when it is enabled.
+"""
+import json
+import re
+import sys
+import time
+from collections import Counter, defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+QueryRecord = namedtuple('QueryRecord', 'sql params duration fingerprint origin')
+
+_IN_LIST = re.compile(r'\bIN \((?:\s*%s\s*,?)+\)', re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """SQL with parameters, literals and IN lists normalized away."""
+    sql = _NUMBER.sub('%s', _STRING.sub('%s', sql))
+    return _SPACE.sub(' ', _IN_LIST.sub('IN (...)', sql)).strip()
+
+
+def template_origin():
+    """'template_name:line' of the innermost template node being rendered, or None."""
+    from django.template.base import Node
+
+    frame = sys._getframe(2)
+    while frame is not None:
+        node = frame.f_locals.get('self')
+        # type(), not isinstance(): 'self' may be a lazy object (request.user)
+        # whose evaluation would run a query and re-enter here
+        if issubclass(type(node), Node) and getattr(node, 'token', None) is not None:
+            origin = getattr(node, 'origin', None)
+            name = (origin.template_name or origin.name) if origin else '<unknown>'
+            return f'{name}:{node.token.lineno}'
+        frame = frame.f_back
+    return None
+
+
+class QueryRecorder:
+    """Context manager recording the queries run on one connection."""
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.connection = connections[using]
+        self.queries = []
+        self._wrapper = None
+
+    def __call__(self, execute, sql, params, many, context):
+        origin = template_origin()
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(
+                QueryRecord(sql, params, time.perf_counter() - start, fingerprint(sql), origin)
+            )
+
+    def __enter__(self):
+        self._wrapper = self.connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(query.duration for query in self.queries)
+
+    def duplicates(self):
+        """{fingerprint: Counter(origin: times)} for fingerprints run more than once."""
+        by_fingerprint = defaultdict(Counter)
+        for query in self.queries:
+            by_fingerprint[query.fingerprint][query.origin] += 1
+        return {
+            sql: origins for sql, origins in by_fingerprint.items()
+            if sum(origins.values()) > 1
+        }
+
+    def report(self, name='', budget=None):
+        """Human-readable summary, duplicates first with the template lines that ran them."""
+        limit = f' (budget {budget["queries"]})' if budget and 'queries' in budget else ''
+        duplicates = self.duplicates()
+        lines = [
+            f'{name or "request"}: {self.count} queries{limit}, '
+            f'{self.total_time * 1000:.1f} ms, {len(duplicates)} duplicated'
+        ]
+        for sql, origins in sorted(duplicates.items(), key=lambda pair: -sum(pair[1].values())):
+            lines.append(f'  {sum(origins.values())}x {sql[:200]}')
+            for origin, times in origins.most_common():
+                lines.append(f'      {times}x from {origin or "view code"}')
+        return '\n'.join(lines)
+
+
+def load_budgets(path=None):
+    """The checked-in budgets as {url_name: {'queries': n, 'duplicates': n}}."""
+    path = path or getattr(settings, 'QUERY_BUDGETS_FILE', settings.BASE_DIR / 'query_budgets.json')
+    try:
+        with open(path) as budgets:
+            return json.load(budgets)
+    except FileNotFoundError:
+        return {}
+
+
+def violations(recorder, budget):
+    """Descriptions of the ways recorder exceeds budget (empty if within it)."""
+    problems = []
+    if 'queries' in budget and recorder.count > budget['queries']:
+        problems.append(f'{recorder.count} queries > {budget["queries"]}')
+    duplicated = len(recorder.duplicates())
+    if 'duplicates' in budget and duplicated > budget['duplicates']:
+        problems.append(f'{duplicated} duplicated queries > {budget["duplicates"]}')
+    return problems
@@ -0,0 +1,90 @@
+"""
+EXPLAIN QUERY PLAN checks for the queries the views run (SQLite).
+
+check() requests every app URL as one user (see core.benchmark), then
+asks SQLite for the plan of each distinct SELECT it ran. Two plan steps
+are reported as problems:
+
+- "SCAN <table>" without an index: the whole table is read;
+- "USE TEMP B-TREE": rows are sorted (or grouped) after being read,
+  so the work grows with every matching row instead of stopping at the
+  LIMIT.
+
+Index scans ("SCAN t USING INDEX", e.g. walking created_at for a
+LIMIT 6), virtual tables (the FTS index) and subqueries, including
+reading back a derived table such as the capped count of
+core.pagination.estimated_count(), are fine. Tables
+small by nature are listed in SMALL_TABLES and never reported. The
+check_query_plans command runs this against the configured (seeded)
+database; QueryPlanTests runs it in the test suite.
+"""
+import re
+from collections import namedtuple
+
+from django.db import connection
+
+from .benchmark import client_hosts, sample, view_urls
+
+# Reference data with a few dozen rows: scanning or sorting it is cheaper than an index
+SMALL_TABLES = {'core_category', 'core_sitecounter'}
+
+PlanProblem = namedtuple('PlanProblem', 'view sql step')
+
+
+class UnsupportedDatabase(Exception):
+    """Raised by check() on a database other than SQLite."""
+
+_TABLE_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+_SORT = re.compile(r'^USE TEMP B-TREE FOR')
+_SELECT_FROM = re.compile(r'\bFROM "?(\w+)"?', re.IGNORECASE)
+
+
+def explain(sql, params=()):
+    """The detail column of EXPLAIN QUERY PLAN for sql, one string per step."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(steps, sql=''):
+    """The full-scan and temp B-tree steps of a plan."""
+    problems = []
+    for step in steps:
+        match = _TABLE_SCAN.match(step)
+        if match and match.group(1) not in SMALL_TABLES:
+            # Derived tables ("SCAN subquery") only hold what the inner query read
+            if match.group(1) in connection.introspection.table_names():
+                problems.append(step)
+        elif _SORT.match(step):
+            # The sort belongs to the query's main table
+            table = _SELECT_FROM.search(sql)
+            if not (table and table.group(1) in SMALL_TABLES):
+                problems.append(step)
+    return problems
+
+
+def check(user, names=None):
+    """
+    Run every app URL (or only names) as user and return
+    ({url_name: status}, [PlanProblem]) for the SELECTs they ran.
+    """
+    if connection.vendor != 'sqlite':
+        raise UnsupportedDatabase('Query plans are only checked on SQLite.')
+
+    from django.test import Client
+
+    client = Client()
+    statuses, problems, seen = {}, [], set()
+    with client_hosts():
+        for name, url in view_urls(user, names):
+            if url is None:
+                continue
+            status, _, recorder = sample(client, user, url)
+            statuses[name] = status
+            for query in recorder.queries:
+                if not query.sql.lstrip().upper().startswith('SELECT') or (name, query.fingerprint) in seen:
+                    continue
+                seen.add((name, query.fingerprint))
+                for step in plan_problems(explain(query.sql, query.params), query.sql):
+                    problems.append(PlanProblem(name, query.sql, step))
+    return statuses, problems
@@ -0,0 +1,78 @@
+import threading
+
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import counters
+
+# Items of each owner a deletion in progress takes: {(id(origin), owner_id): [origin, remaining]}
+_deleting = threading.local()
+
+
+def _deleting_owners():
+    if not hasattr(_deleting, 'owners'):
+        _deleting.owners = {}
+    return _deleting.owners
+
+
+@receiver(post_save, sender='items.Item')
+def count_new_item(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    counters.adjust(counters.ITEMS)
+    # First item of this owner
+    if not sender.objects.filter(owner_id=instance.owner_id).exclude(pk=instance.pk).exists():
+        counters.adjust(counters.ITEM_OWNERS)
+
+
+@receiver(post_save, sender='items.Item')
+def count_moved_item(sender, instance, created, raw=False, **kwargs):
+    """An item given to another owner may drop the old owner and add the new one."""
+    old_owner_id = getattr(instance, '_stored_owner_id', instance.owner_id)
+    if created or raw or old_owner_id is None or old_owner_id == instance.owner_id:
+        return
+    if not sender.objects.filter(owner_id=old_owner_id).exists():
+        counters.adjust(counters.ITEM_OWNERS, -1)
+    if not sender.objects.filter(owner_id=instance.owner_id).exclude(pk=instance.pk).exists():
+        counters.adjust(counters.ITEM_OWNERS)
+
+
+@receiver(pre_delete, sender='items.Item')
+def note_deleted_item(sender, instance, origin=None, **kwargs):
+    """
+    Count the items a deletion takes from each owner.
+
+    post_delete fires after the whole batch is gone, so every item of an
+    owner deleted together would see no remaining items; the count lets
+    only the owner's last one check. origin (the object or queryset
+    delete() was called on) is kept with it so its id stays unique
+    until the deletion is done.
+    """
+    entry = _deleting_owners().setdefault((id(origin), instance.owner_id), [origin, 0])
+    entry[1] += 1
+
+
+@receiver(post_delete, sender='items.Item')
+def count_deleted_item(sender, instance, origin=None, **kwargs):
+    counters.adjust(counters.ITEMS, -1)
+    owners = _deleting_owners()
+    key = (id(origin), instance.owner_id)
+    entry = owners.get(key)
+    if entry is not None:
+        entry[1] -= 1
+        if entry[1]:
+            return
+        del owners[key]
+    if not sender.objects.filter(owner_id=instance.owner_id).exists():
+        counters.adjust(counters.ITEM_OWNERS, -1)
+
+
+@receiver(post_save, sender='request_app.ItemRequest')
+def count_new_request(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.adjust(counters.REQUESTS)
+
+
+@receiver(post_delete, sender='request_app.ItemRequest')
+def count_deleted_request(sender, instance, **kwargs):
+    counters.adjust(counters.REQUESTS, -1)
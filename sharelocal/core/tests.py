@@ -1,3 +1,901 @@
-from django.test import TestCase
+import json
+import pickle
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+from importlib.util import find_spec
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, models
+from django.db.migrations.loader import MigrationLoader
+from django.test import LiveServerTestCase, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import UserProfile
+from items.models import Item, SearchTerm
+from request_app.models import ItemRequest
+from . import counters
+from . import geocode_queue
+from . import geocoding
+from . import loadtest
+from . import pagination
+from . import queryplan
+from .benchmark import app_urls
+from .geocode_queue import requeue_stale, run_pending
+from .geocoder_client import CircuitOpenError, GeocoderClient
+from .models import Category, GeocodeCache, GeocodeJob, Location, SiteCounter
+from .pagination import EstimatedCountPaginator, KeysetPaginator
+from .querybudget import QueryRecorder, fingerprint, load_budgets, violations
+
+
+class GeocodingCacheTests(TestCase):
+    def setUp(self):
+        geocoding.memory_cache.clear()
+        self.addCleanup(geocoding.memory_cache.clear)
+
+    def test_same_location_is_fetched_once(self):
+        with mock.patch.object(geocoding, 'fetch_coordinates', return_value=(23.02, 72.57)) as fetch:
+            self.assertEqual(geocoding.geocode_location('Ahmedabad, Gujarat'), (23.02, 72.57))
+            self.assertEqual(geocoding.geocode_location('  ahmedabad ,GUJARAT '), (23.02, 72.57))
+        fetch.assert_called_once_with('ahmedabad, gujarat')
+        self.assertTrue(GeocodeCache.objects.filter(query='ahmedabad, gujarat').exists())
+
+    def test_database_cache_survives_memory_eviction(self):
+        with mock.patch.object(geocoding, 'fetch_coordinates', return_value=(23.02, 72.57)) as fetch:
+            geocoding.geocode_location('Ahmedabad')
+            geocoding.memory_cache.clear()
+            self.assertEqual(geocoding.geocode_location('Ahmedabad'), (23.02, 72.57))
+        self.assertEqual(fetch.call_count, 1)
+
+    def test_not_found_is_cached_but_errors_are_not(self):
+        with mock.patch.object(geocoding, 'fetch_coordinates', return_value=(None, None)) as fetch:
+            geocoding.geocode_location('Nowhere')
+            geocoding.geocode_location('Nowhere')
+        self.assertEqual(fetch.call_count, 1)
+
+        with mock.patch.object(geocoding, 'fetch_coordinates', side_effect=geocoding.GeocodingError) as fetch:
+            self.assertEqual(geocoding.geocode_location('Offline'), (None, None))
+            geocoding.geocode_location('Offline')
+        self.assertEqual(fetch.call_count, 2)
+        self.assertFalse(GeocodeCache.objects.filter(query='offline').exists())
+
+    def test_expired_entries_are_refreshed(self):
+        with mock.patch.object(geocoding, 'fetch_coordinates', return_value=(1.0, 2.0)) as fetch:
+            with self.settings(GEOCODE_CACHE_TTL=0):
+                geocoding.geocode_location('Stale')
+                geocoding.memory_cache.clear()
+                geocoding.geocode_location('Stale')
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_memory_cache_expires_before_the_database_cache(self):
+        with mock.patch.object(geocoding, 'fetch_coordinates', return_value=(1.0, 2.0)) as fetch:
+            geocoding.geocode_location('Anand')
+            # Another worker's forget() cannot reach this process's LRU
+            GeocodeCache.objects.filter(query='anand').update(latitude=3.0, longitude=4.0)
+            self.assertEqual(geocoding.geocode_location('Anand'), (1.0, 2.0))
+            later = geocoding.time.monotonic() + geocoding.MEMORY_CACHE_TTL + 1
+            with mock.patch.object(geocoding.time, 'monotonic', return_value=later):
+                self.assertEqual(geocoding.geocode_location('Anand'), (3.0, 4.0))
+        self.assertEqual(fetch.call_count, 1)
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = geocoding.LRUCache(maxsize=2)
+        cache.set('a', 1, 60)
+        cache.set('b', 2, 60)
+        cache.get('a')
+        cache.set('c', 3, 60)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+
+
+@override_settings(
+    GEOCODE_ASYNC=True,
+    GEOCODER_BACKEND='core.geocoding.StubGeocoder',
+    GEOCODER_STUB_RESULTS={'Ahmedabad': (23.02, 72.57), 'Surat': (21.17, 72.83), 'Flaky': None},
+)
+class AsyncGeocodingTests(TestCase):
+    def setUp(self):
+        geocoding.memory_cache.clear()
+        self.addCleanup(geocoding.memory_cache.clear)
+        self.owner = User.objects.create_user(username='owner', password='pass123')
+
+    def make_item(self, location):
+        return Item.objects.create(owner=self.owner, title='Drill', description='desc', location=location)
+
+    def test_item_save_queues_geocode_instead_of_blocking(self):
+        item = self.make_item('Ahmedabad')
+        self.assertEqual(item.geocode_status, 'pending')
+        self.assertIsNone(item.latitude)
+        self.assertTrue(GeocodeJob.objects.filter(target='item', object_id=item.pk, status='queued').exists())
+
+        self.assertEqual(run_pending(), 1)
+        item.refresh_from_db()
+        self.assertEqual((item.latitude, item.longitude), (23.02, 72.57))
+        self.assertEqual(item.geocode_status, 'resolved')
+        self.assertTrue(item.geohash)
+
+    def test_cached_location_resolves_without_a_job(self):
+        geocoding.resolve('Ahmedabad')
+        item = self.make_item('ahmedabad')
+        self.assertEqual(item.geocode_status, 'resolved')
+        self.assertEqual(item.latitude, 23.02)
+        self.assertFalse(GeocodeJob.objects.exists())
+
+    def test_unknown_location_is_marked_failed(self):
+        item = self.make_item('Atlantis')
+        run_pending()
+        item.refresh_from_db()
+        self.assertEqual(item.geocode_status, 'failed')
+        self.assertEqual(GeocodeJob.objects.get().status, 'done')
+
+    def test_provider_error_is_retried_later(self):
+        self.make_item('Flaky')
+        run_pending()
+        job = GeocodeJob.objects.get()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertTrue(job.last_error)
+        # Backed off: nothing is due right now
+        self.assertEqual(run_pending(), 0)
+
+    def test_profile_coordinates_propagate_to_items(self):
+        profile = UserProfile.objects.create(user=self.owner, phone='1234567890', location='Ahmedabad')
+        run_pending()
+        item = self.make_item(None)
+        self.assertEqual(item.latitude, 23.02)
+
+        profile.location = 'Surat'
+        profile.save()
+        item.refresh_from_db()
+        self.assertEqual((item.location, item.geocode_status), ('Surat', 'pending'))
+
+        run_pending()
+        profile.refresh_from_db()
+        item.refresh_from_db()
+        self.assertEqual((profile.latitude, profile.longitude), (21.17, 72.83))
+        self.assertEqual((item.latitude, item.longitude, item.geocode_status), (21.17, 72.83, 'resolved'))
+
+    def test_results_only_apply_to_pending_profiles(self):
+        profile = UserProfile.objects.create(user=self.owner, phone='1234567890', location='Ahmedabad')
+        self.assertEqual(profile.geocode_status, 'pending')
+        # Coordinates set some other way before the worker ran
+        UserProfile.objects.filter(pk=profile.pk).update(latitude=1.0, longitude=2.0, geocode_status='resolved')
+        run_pending()
+        profile.refresh_from_db()
+        self.assertEqual((profile.latitude, profile.longitude), (1.0, 2.0))
+
+    def test_stale_job_is_ignored_after_location_change(self):
+        item = self.make_item('Ahmedabad')
+        item.location = 'Surat'
+        item.latitude = item.longitude = None
+        item.save()
+        self.assertEqual(GeocodeJob.objects.filter(status='queued').count(), 1)
+        run_pending()
+        item.refresh_from_db()
+        self.assertEqual(item.latitude, 21.17)
+
+    @override_settings(GEOCODE_JOB_MAX_ATTEMPTS=2)
+    def test_jobs_of_dead_workers_are_requeued(self):
+        item = self.make_item('Ahmedabad')
+        job = GeocodeJob.objects.get()
+        # Claimed by a worker that died before finishing
+        claimed = timezone.now() - timedelta(seconds=geocode_queue.LEASE + 1)
+        GeocodeJob.objects.filter(pk=job.pk).update(status='running', updated_at=claimed)
+        self.assertEqual(requeue_stale(lease=3600), 0)
+
+        out = StringIO()
+        call_command('geocode_worker', once=True, stdout=out)
+        self.assertIn('Took back 1 stale geocoding job(s)', out.getvalue())
+        job.refresh_from_db()
+        item.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('done', 2))
+        self.assertEqual(item.latitude, 23.02)
+
+        # A job whose runs keep dying fails once out of attempts
+        GeocodeJob.objects.filter(pk=job.pk).update(status='running', attempts=1, updated_at=claimed)
+        self.assertEqual(requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), ('failed', 'worker lease expired'))
+
+
+@override_settings(
+    GEOCODE_ASYNC=True,
+    GEOCODER_BACKEND='core.geocoding.StubGeocoder',
+    GEOCODER_STUB_RESULTS={'Ahmedabad': (23.02, 72.57), 'Surat': (21.17, 72.83), 'Flaky': None},
+)
+class GeocodeBackfillTests(TestCase):
+    def setUp(self):
+        geocoding.memory_cache.clear()
+        self.addCleanup(geocoding.memory_cache.clear)
+        owner = User.objects.create_user(username='owner', password='pass123')
+        neighbour = User.objects.create_user(username='neighbour', password='pass123')
+        UserProfile.objects.create(user=neighbour, phone='1234567890', location='Surat')
+        for location in ['Ahmedabad', 'ahmedabad ', 'AHMEDABAD', 'Surat', 'Flaky', 'Atlantis']:
+            Item.objects.create(owner=owner, title='Drill', description='desc', location=location)
+
+    def backfill(self):
+        target = 'core.management.commands.geocode_backfill.fetch_coordinates'
+        with mock.patch(target, wraps=geocoding.fetch_coordinates) as fetch:
+            call_command('geocode_backfill', rate=1000, stdout=StringIO(), stderr=StringIO())
+        return fetch
+
+    def test_each_distinct_location_is_fetched_once(self):
+        fetch = self.backfill()
+        self.assertEqual(sorted(call.args[0] for call in fetch.call_args_list), ['ahmedabad', 'atlantis', 'flaky', 'surat'])
+        self.assertEqual(Item.objects.filter(latitude=23.02, geocode_status='resolved').count(), 3)
+        self.assertEqual(UserProfile.objects.get().latitude, 21.17)
+        self.assertEqual(Item.objects.get(location='Atlantis').geocode_status, 'failed')
+        # Provider errors leave the row pending for the next run
+        self.assertEqual(Item.objects.get(location='Flaky').geocode_status, 'pending')
+
+    def test_rerun_resumes_without_refetching(self):
+        self.backfill()
+        fetch = self.backfill()
+        self.assertEqual([call.args[0] for call in fetch.call_args_list], ['flaky'])
+
+    def test_profile_coordinates_reach_its_items(self):
+        neighbour = User.objects.get(username='neighbour')
+        item = Item.objects.create(owner=neighbour, title='Ladder', description='desc', location='Surat')
+        Item.objects.filter(pk=item.pk).update(location='Sura')
+        self.backfill()
+        item.refresh_from_db()
+        self.assertEqual((item.location, item.latitude, item.geocode_status), ('Surat', 21.17, 'resolved'))
+        self.assertTrue(item.geohash)
+
+
+@override_settings(
+    GEOCODE_ASYNC=True,
+    GEOCODER_BACKEND='core.geocoding.GazetteerGeocoder',
+    GEOCODER_FALLBACK_BACKEND='core.geocoding.StubGeocoder',
+    GEOCODER_STUB_RESULTS={'Paris': (48.85, 2.35)},
+)
+class GazetteerTests(TestCase):
+    def setUp(self):
+        geocoding.memory_cache.clear()
+        self.addCleanup(geocoding.memory_cache.clear)
+        Location.objects.create(name='Navrangpura', city='Ahmedabad', state='Gujarat', latitude=23.03, longitude=72.56)
+        Location.objects.create(name='Satellite', city='Ahmedabad', state='Gujarat', latitude=23.02, longitude=72.52)
+        Location.objects.create(name='Satellite Town', city='Rawalpindi', latitude=33.63, longitude=73.07)
+        Location.objects.create(name='Unmapped', city='Nowhere')
+        self.geocoder = geocoding.GazetteerGeocoder()
+
+    def test_matches_normalized_name_and_qualifiers(self):
+        self.assertEqual(self.geocoder.geocode('navrangpura'), (23.03, 72.56))
+        self.assertEqual(self.geocoder.geocode('navrangpura, ahmedabad, gujarat, india'), (23.03, 72.56))
+        self.assertEqual(self.geocoder.geocode('satellite'), (23.02, 72.52))
+        # A qualifier that contradicts the gazetteer is a miss
+        self.assertIsNone(self.geocoder.lookup_local('navrangpura, mumbai'))
+
+    def test_unique_prefix_matches(self):
+        self.assertEqual(self.geocoder.lookup_local('navrang'), (23.03, 72.56))
+        # "satellite" prefixes two names, but matches one exactly
+        self.assertIsNone(self.geocoder.lookup_local('sate'))
+        self.assertEqual(self.geocoder.lookup_local('sate, rawalpindi'), (33.63, 73.07))
+
+    def test_miss_falls_back_to_configured_backend(self):
+        self.assertEqual(self.geocoder.geocode('paris'), (48.85, 2.35))
+        self.assertEqual(self.geocoder.geocode('unmapped'), (None, None))
+        with self.settings(GEOCODER_FALLBACK_BACKEND=None):
+            self.assertEqual(self.geocoder.geocode('paris'), (None, None))
+
+    def test_item_save_resolves_from_gazetteer_without_a_job(self):
+        owner = User.objects.create_user(username='owner', password='pass123')
+        item = Item.objects.create(owner=owner, title='Drill', description='desc', location='Navrangpura, Ahmedabad')
+        self.assertEqual((item.latitude, item.geocode_status), (23.03, 'resolved'))
+        self.assertFalse(GeocodeJob.objects.exists())
+
+    def test_location_changes_invalidate_cached_answers(self):
+        self.assertEqual(geocoding.resolve('Unmapped'), (None, None))
+        location = Location.objects.get(name='Unmapped')
+        location.latitude, location.longitude = 1.5, 2.5
+        location.save()
+        self.assertEqual(geocoding.resolve('Unmapped'), (1.5, 2.5))
+
+    def test_backfill_migrations_resolve_from_cache_and_gazetteer(self):
+        GeocodeCache.objects.create(query='paris, france', latitude=48.85, longitude=2.35)
+        for name in ('items.migrations.0006_geocode_existing_items', 'accounts.migrations.0004_geocode_existing_profiles'):
+            known_coordinates = import_module(name).known_coordinates
+            with self.subTest(migration=name):
+                self.assertEqual(known_coordinates(apps, 'Paris,  France'), (48.85, 2.35))
+                self.assertEqual(known_coordinates(apps, 'Navrangpura, Ahmedabad'), (23.03, 72.56))
+                self.assertIsNone(known_coordinates(apps, 'Unmapped'))
+                # Never the provider, which knows Paris
+                self.assertIsNone(known_coordinates(apps, 'Paris'))
+                # A state from before the cache table and gazetteer columns
+                old_apps = MigrationLoader(connection).project_state(
+                    ('core', '0002_location_alter_category_options_category_created_at_and_more'),
+                ).apps
+                self.assertIsNone(known_coordinates(old_apps, 'Navrangpura, Ahmedabad'))
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    """Answers from the server's queue of (status, payload) responses."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.seen.append((self.path, self.client_address[1]))
+        status, payload = self.server.responses.pop(0) if self.server.responses else (200, [])
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@skipUnless(find_spec('requests'), 'requests is not installed')
+class GeocoderClientTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubProviderHandler)
+        self.server.responses = []
+        self.server.seen = []
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.client = GeocoderClient(
+            url=f'http://127.0.0.1:{self.server.server_port}/search',
+            rate=1000, timeout=2, max_retries=2, backoff=0, circuit_threshold=2, circuit_cooldown=60,
+        )
+        self.addCleanup(self.client.close)
+        geocoding.stats.reset()
+
+    def geocoder(self):
+        geocoder = geocoding.NominatimGeocoder()
+        geocoder.client = self.client
+        return geocoder
+
+    def test_lookups_share_one_connection(self):
+        self.server.responses = [(200, [{'lat': '23.02', 'lon': '72.57'}]), (200, [])]
+        geocoder = self.geocoder()
+        self.assertEqual(geocoder.geocode('ahmedabad'), (23.02, 72.57))
+        self.assertEqual(geocoder.geocode('nowhere'), (None, None))
+        self.assertIn('q=ahmedabad', self.server.seen[0][0])
+        self.assertEqual(len({port for _, port in self.server.seen}), 1)
+        self.assertEqual(geocoding.stats['requests'], 2)
+
+    def test_transient_errors_are_retried(self):
+        self.server.responses = [(503, {}), (429, {}), (200, [{'lat': '1', 'lon': '2'}])]
+        self.assertEqual(self.geocoder().geocode('flaky'), (1.0, 2.0))
+        self.assertEqual(len(self.server.seen), 3)
+        self.assertEqual(geocoding.stats['retries'], 2)
+        self.assertEqual(self.client.breaker.state, 'closed')
+
+    def test_client_errors_are_not_retried(self):
+        self.server.responses = [(400, {})]
+        with self.assertRaises(geocoding.GeocodingError):
+            self.geocoder().geocode('bad')
+        self.assertEqual(len(self.server.seen), 1)
+
+    def test_client_errors_do_not_reset_the_circuit(self):
+        self.server.responses = [(500, {})] * 3 + [(400, {}), (404, {})]
+        geocoder = self.geocoder()
+        for query in ('down', 'bad', 'missing'):
+            with self.assertRaises(geocoding.GeocodingError):
+                geocoder.geocode(query)
+        self.assertEqual(self.client.breaker.failures, 1)
+
+    def test_refused_requests_open_the_circuit(self):
+        self.server.responses = [(403, {}), (401, {})]
+        geocoder = self.geocoder()
+        for _ in range(2):
+            with self.assertRaises(geocoding.GeocodingError):
+                geocoder.geocode('blocked')
+        self.assertEqual(len(self.server.seen), 2)
+        self.assertEqual(self.client.breaker.state, 'open')
+
+    def test_other_request_errors_become_geocoding_errors(self):
+        import requests
+
+        # A truncated body is retried
+        error = requests.exceptions.ChunkedEncodingError('connection broken')
+        with mock.patch.object(self.client.session, 'get', side_effect=error) as get:
+            with self.assertRaises(geocoding.GeocodingError):
+                self.geocoder().geocode('broken')
+        self.assertEqual(get.call_count, 3)
+        # A redirect loop is not
+        with mock.patch.object(self.client.session, 'get', side_effect=requests.TooManyRedirects) as get:
+            with self.assertRaises(geocoding.GeocodingError):
+                self.geocoder().geocode('loop')
+        self.assertEqual(get.call_count, 1)
+        # Both count against the circuit
+        self.assertEqual(self.client.breaker.state, 'open')
+
+    def test_circuit_opens_after_repeated_failures(self):
+        self.server.responses = [(500, {})] * 6
+        geocoder = self.geocoder()
+        for _ in range(2):
+            with self.assertRaises(geocoding.GeocodingError):
+                geocoder.geocode('down')
+        self.assertEqual(self.client.breaker.state, 'open')
+
+        with self.assertRaises(CircuitOpenError):
+            geocoder.geocode('down')
+        self.assertEqual(len(self.server.seen), 6)
+        self.assertEqual(geocoding.stats['short_circuits'], 1)
+
+        # After the cooldown a single trial call closes the circuit again
+        self.client.breaker.opened_at -= 60
+        self.server.responses = [(200, [{'lat': '1', 'lon': '2'}])]
+        self.assertEqual(geocoder.geocode('up'), (1.0, 2.0))
+        self.assertEqual(self.client.breaker.state, 'closed')
+
+
+class SiteCounterTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='pass123')
+        self.bob = User.objects.create_user(username='bob', password='pass123')
+
+    def make_item(self, owner, title='Ladder'):
+        return Item.objects.create(owner=owner, title=title, description='desc')
+
+    def test_counters_follow_items_and_requests(self):
+        first = self.make_item(self.alice)
+        self.make_item(self.alice, 'Tent')
+        self.make_item(self.bob)
+        ItemRequest.objects.create(item=first, requested_by=self.bob)
+        self.assertEqual(counters.read(), {'items': 3, 'requests': 1, 'item_owners': 2})
+
+        first.delete()
+        self.assertEqual(counters.read(), {'items': 2, 'requests': 0, 'item_owners': 2})
+
+    def test_owner_is_uncounted_once_when_items_go_together(self):
+        self.make_item(self.alice)
+        self.make_item(self.alice, 'Tent')
+        self.make_item(self.bob)
+        self.alice.delete()
+        self.assertEqual(counters.read(), {'items': 1, 'requests': 0, 'item_owners': 1})
+        Item.objects.all().delete()
+        self.assertEqual(counters.read(), {'items': 0, 'requests': 0, 'item_owners': 0})
+
+    def test_deleting_the_same_queryset_again_uncounts_the_owner_again(self):
+        alices = Item.objects.filter(owner=self.alice)
+        for _ in range(2):
+            self.make_item(self.alice)
+            self.make_item(self.alice, 'Tent')
+            with CaptureQueriesContext(connection) as queries:
+                alices.delete()
+            self.assertEqual(counters.read()['item_owners'], 0)
+            # One remaining-items check for the owner, not one per item
+            self.assertEqual(sum('SELECT 1 AS "a"' in query['sql'] for query in queries), 1)
+        self.assertEqual(counters.reconcile(), {})
+
+    def test_owner_count_follows_item_owner_changes(self):
+        ladder = self.make_item(self.alice)
+        tent = self.make_item(self.alice, 'Tent')
+        carol = User.objects.create_user(username='carol', password='pass123')
+
+        ladder = Item.objects.get(pk=ladder.pk)
+        ladder.owner = self.bob
+        ladder.save(update_fields=['owner'])
+        self.assertEqual(counters.read()['item_owners'], 2)
+
+        tent = Item.objects.get(pk=tent.pk)
+        tent.owner = carol
+        tent.save()
+        # alice has nothing left, carol is new
+        self.assertEqual(counters.read()['item_owners'], 2)
+        tent.owner = self.bob
+        tent.save()
+        self.assertEqual(counters.read()['item_owners'], 1)
+        self.assertEqual(counters.reconcile(), {})
+
+    def test_home_reads_counters_in_one_query(self):
+        self.make_item(self.alice)
+        with self.assertNumQueries(2):  # counters + featured items
+            response = self.client.get('/')
+        self.assertEqual(response.context['total_items'], 1)
+        self.assertEqual(response.context['total_users'], 1)
+
+    def test_reconcile_fixes_drift(self):
+        self.make_item(self.alice)
+        Item.objects.bulk_create([Item(owner=self.bob, title='Bulk', description='desc')])
+        SiteCounter.objects.filter(name='requests').update(value=7)
+
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('items: 1 -> 2', out.getvalue())
+        self.assertEqual(counters.read(), {'items': 2, 'requests': 0, 'item_owners': 2})
+        self.assertEqual(counters.reconcile(), {})
+
+
+class AutoPrefetchTests(TestCase):
+    def setUp(self):
+        self.viewer = User.objects.create_user(username='viewer', password='pass123')
+
+    def add_rows(self, count):
+        for i in range(count):
+            user = User.objects.create_user(username=f'user{count}-{i}', password='pass123')
+            category = Category.objects.create(name=f'Category {count}-{i}')
+            item = Item.objects.create(owner=user, title=f'Item {i}', description='desc', category=category)
+            ItemRequest.objects.create(item=item, requested_by=self.viewer)
+
+    def test_first_access_loads_the_relation_for_all_peers(self):
+        self.add_rows(4)
+        with self.assertNumQueries(3):
+            for item in Item.objects.all():
+                item.owner.username, item.category.name
+
+    def test_nested_relations_are_batched_too(self):
+        self.add_rows(4)
+        with self.assertNumQueries(4):
+            for request in ItemRequest.objects.all():
+                request.item.owner.username, request.requested_by.username
+
+    def test_select_related_is_not_reloaded(self):
+        self.add_rows(3)
+        with self.assertNumQueries(2):
+            for item in Item.objects.select_related('owner'):
+                item.owner.username, item.category.name
+
+    def test_instances_still_pickle(self):
+        self.add_rows(2)
+        item = list(Item.objects.all())[0]
+        self.assertEqual(pickle.loads(pickle.dumps(item)).pk, item.pk)
+
+    def test_list_views_run_a_constant_number_of_queries(self):
+        self.client.force_login(self.viewer)
+        urls = [reverse('item_list'), reverse('my-requests'), reverse('request-history')]
+
+        def queries():
+            counts = []
+            for url in urls:
+                cache.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    self.client.get(url)
+                counts.append(len(captured))
+            return counts
+
+        self.add_rows(2)
+        few = queries()
+        self.add_rows(6)
+        self.assertEqual(queries(), few)
+
+
+class QueryBudgetTests(TestCase):
+    """Every app URL stays within its checked-in budget (query_budgets.json)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Roughly a busy neighbourhood: 30 users, 150 items, 300 requests
+        from request_app import counters as request_counters
+
+        users = User.objects.bulk_create(User(username=f'member{i}') for i in range(30))
+        UserProfile.objects.bulk_create(UserProfile(user=user, phone='555-0100', location='Springfield') for user in users)
+        categories = Category.objects.bulk_create(Category(name=f'Category {i}') for i in range(6))
+        Item.objects.bulk_create(
+            Item(
+                owner=users[i % 10], category=categories[i % 6], title=f'Item {i}',
+                description='A useful thing to share', location='Springfield', price=i,
+            )
+            for i in range(150)
+        )
+        items = list(Item.objects.order_by('pk'))
+        ItemRequest.objects.bulk_create(
+            ItemRequest(item=items[i % 150], item_owner_id=items[i % 150].owner_id, requested_by=users[10 + i % 20],
+                        status=('Pending', 'Accepted', 'Rejected')[i % 3])
+            for i in range(300)
+        )
+        request_counters.reconcile()
+        counters.reconcile()
+
+        cls.user = users[0]
+        cls.kwargs = {
+            'item_id': items[0].pk,
+            'request_id': ItemRequest.objects.filter(item_owner=cls.user).first().pk,
+        }
+        # Requesting one's own item only redirects: measure the request form
+        cls.kwargs_for = {'create-request': {'item_id': items[1].pk}}
+
+    def setUp(self):
+        cache.clear()
+
+    def record(self, url):
+        self.client.force_login(self.user)
+        with QueryRecorder() as recorder:
+            self.client.get(url)
+        return recorder
+
+    def test_views_stay_within_budget(self):
+        budgets = load_budgets()
+        for name, pattern in app_urls():
+            with self.subTest(url=name):
+                self.assertIn(name, budgets, f'No query budget for {name}')
+                kwargs = self.kwargs_for.get(name) or {key: self.kwargs[key] for key in pattern.pattern.converters}
+                recorder = self.record(reverse(name, kwargs=kwargs))
+                problems = violations(recorder, budgets[name])
+                self.assertFalse(problems, recorder.report(name, budgets[name]))
+
+    def test_report_points_at_the_template_line(self):
+        # A template loop without batching: one user query per row
+        from django.template import engines
+
+        template = engines['django'].from_string(
+            '{% for request in requests %}\n{{ request.requested_by.username }}\n{% endfor %}'
+        )
+        requests = list(ItemRequest.objects.values_list('pk', flat=True)[:5])
+        with QueryRecorder() as recorder:
+            template.render({'requests': [ItemRequest.objects.get(pk=pk) for pk in requests]})
+
+        ((sql, origins),) = [
+            (sql, origins) for sql, origins in recorder.duplicates().items() if 'auth_user' in sql
+        ]
+        self.assertEqual(sum(origins.values()), 5)
+        self.assertEqual([origin.rsplit(':', 1)[1] for origin in origins], ['2'])
+        self.assertIn('from <unknown source>:2', recorder.report())
+
+    def test_middleware_reports_requests_over_budget(self):
+        from django.conf import settings
+
+        middleware = settings.MIDDLEWARE + ['core.middleware.QueryBudgetMiddleware']
+        self.client.force_login(self.user)
+        with override_settings(MIDDLEWARE=middleware, QUERY_BUDGET_ENABLED=True), \
+                mock.patch('core.middleware.load_budgets', return_value={'home': {'queries': 1}}), \
+                self.assertLogs('sharelocal.querybudget', 'WARNING') as logs:
+            response = self.client.get(reverse('home'))
+
+        self.assertGreater(int(response['X-Query-Count']), 1)
+        self.assertIn('over query budget', logs.output[0])
+
+    def test_fingerprint_ignores_parameters(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = \'x\' LIMIT 21'),
+            fingerprint('SELECT * FROM t WHERE id IN (%s) AND name = \'y\' LIMIT 5'),
+        )
+
+
+class SeedBenchTests(TestCase):
+    def seed(self, **volumes):
+        options = {'users': 12, 'items': 40, 'requests': 150, 'batch_size': 16, **volumes}
+        call_command('seed_bench', stdout=StringIO(), **options)
+
+    def test_creates_geolocated_data_without_geocoding(self):
+        self.seed()
+
+        self.assertEqual(User.objects.filter(username__startswith='bench-').count(), 12)
+        self.assertEqual(UserProfile.objects.count(), 12)
+        self.assertEqual(Item.objects.count(), 40)
+        self.assertFalse(Item.objects.filter(models.Q(latitude__isnull=True) | models.Q(geohash='')).exists())
+        self.assertFalse(GeocodeJob.objects.exists())
+        self.assertEqual(ItemRequest.objects.count(), 150)
+        # Searchable, and the title words are in the suggestion vocabulary
+        item = Item.objects.first()
+        self.assertIn(item, Item.objects.search(item.title))
+        self.assertTrue(SearchTerm.objects.filter(word=item.title.split()[-1].lower()).exists())
+
+    def test_requests_are_unique_and_not_for_own_items(self):
+        self.seed()
+
+        pairs = list(ItemRequest.objects.values_list('item_id', 'requested_by_id'))
+        self.assertEqual(len(set(pairs)), len(pairs))
+        self.assertFalse(ItemRequest.objects.filter(requested_by=models.F('item_owner')).exists())
+        self.assertFalse(ItemRequest.objects.exclude(item_owner=models.F('item__owner')).exists())
+
+    def test_counters_match_the_seeded_rows(self):
+        from request_app import counters as request_counters
+
+        self.seed()
+
+        self.assertEqual(counters.reconcile(), {})
+        self.assertEqual(request_counters.reconcile(), (0, 0))
+
+    def test_refuses_to_seed_twice_with_one_prefix(self):
+        self.seed()
+        with self.assertRaises(CommandError):
+            self.seed()
+
+
+class BenchViewsTests(TestCase):
+    def test_times_every_view_and_leaves_data_unchanged(self):
+        call_command('seed_bench', users=6, items=20, requests=40, stdout=StringIO())
+        available = Item.objects.filter(is_available=True).count()
+        out = StringIO()
+
+        call_command('bench_views', repeat=2, warmup=0, stdout=out)
+
+        results = json.loads(out.getvalue())
+        self.assertEqual(set(results['results']), {name for name, _ in app_urls()})
+        self.assertEqual(results['data']['items'], 20)
+        item_list = results['results']['item_list']
+        self.assertEqual(item_list['status'], 200)
+        self.assertGreater(item_list['queries'], 0)
+        self.assertLessEqual(item_list['min_ms'], item_list['p50_ms'])
+        # toggle_availability writes on GET; every sample is rolled back
+        self.assertEqual(Item.objects.filter(is_available=True).count(), available)
+        self.assertEqual(results['results']['logout']['status'], 302)
+
+
+class LoadTestTests(LiveServerTestCase):
+    def setUp(self):
+        call_command('seed_bench', users=4, items=12, requests=12, stdout=StringIO())
+        self.data = loadtest.TrafficData.from_database()
+
+    def run_mix(self, mix, duration=1.0):
+        summary, _ = loadtest.run(self.live_server_url, self.data, 1, duration, 'bench-password', mix=mix)
+        return summary
+
+    def test_default_mix_runs_without_errors(self):
+        summary = self.run_mix(None, duration=2.0)
+
+        self.assertGreater(summary['total']['requests'], 0)
+        self.assertEqual(summary['total']['errors'], 0, summary)
+        self.assertLessEqual(summary['total']['p50_ms'], summary['total']['p99_ms'])
+
+    def test_request_flows_write_through_the_server(self):
+        pending = ItemRequest.objects.filter(status='Pending').count()
+
+        summary = self.run_mix({'create_request': 1})
+
+        self.assertEqual(summary['login']['statuses'].get('302'), 1)
+        self.assertIn('302', summary['create_request POST']['statuses'])
+        self.assertGreater(ItemRequest.objects.filter(status='Pending').count(), pending)
+
+    def test_owner_accepts_pending_requests(self):
+        owner = max(self.data.pending, key=lambda username: len(self.data.pending[username]))
+        self.data.users = [owner]
+        accepted = ItemRequest.objects.filter(status='Accepted').count()
+
+        summary = self.run_mix({'accept_request': 1})
+
+        self.assertIn('302', summary['accept_request POST']['statuses'])
+        self.assertGreater(ItemRequest.objects.filter(status='Accepted').count(), accepted)
+        self.assertEqual(self.data.pending[owner], [])
+
+
+class SaturationPointTests(SimpleTestCase):
+    def test_first_level_where_throughput_stops_growing(self):
+        levels = [(1, {'rps': 50}), (2, {'rps': 95}), (4, {'rps': 101}), (8, {'rps': 99})]
+        self.assertEqual(loadtest.saturation_point(levels), 2)
+        self.assertIsNone(loadtest.saturation_point(levels[:2]))
+
+
+class QueryPlanTests(TestCase):
+    def test_views_use_indexes(self):
+        call_command('seed_bench', users=6, items=30, requests=40, stdout=StringIO())
+        user = User.objects.annotate(n=models.Count('items')).order_by('-n').first()
+
+        statuses, problems = queryplan.check(user)
+
+        self.assertEqual(statuses['item_list'], 200)
+        self.assertEqual(problems, [])
+
+    def test_plan_problems(self):
+        self.assertEqual(queryplan.plan_problems(['SCAN items_item']), ['SCAN items_item'])
+        self.assertEqual(queryplan.plan_problems(['SCAN subquery']), [])
+        self.assertEqual(queryplan.plan_problems(
+            ['SCAN items_item USING INDEX items_item_avail_created_idx', 'SEARCH auth_user USING INTEGER PRIMARY KEY (rowid=?)']
+        ), [])
+        self.assertEqual(queryplan.plan_problems(
+            ['SEARCH items_item USING INDEX items_item_owner_id (owner_id=?)', 'USE TEMP B-TREE FOR ORDER BY'],
+            'SELECT * FROM "items_item" WHERE owner_id = 1 ORDER BY created_at',
+        ), ['USE TEMP B-TREE FOR ORDER BY'])
+        # Small reference tables may be scanned and sorted
+        self.assertEqual(queryplan.plan_problems(
+            ['SCAN core_category', 'USE TEMP B-TREE FOR ORDER BY'], 'SELECT * FROM "core_category" ORDER BY name',
+        ), [])
+
+    def test_command_fails_on_problems(self):
+        call_command('seed_bench', users=4, items=10, requests=10, stdout=StringIO())
+        with mock.patch.object(queryplan, 'plan_problems', return_value=['SCAN items_item']):
+            with self.assertRaises(CommandError):
+                call_command('check_query_plans', view=['home'], stdout=StringIO())
+        call_command('check_query_plans', view=['home', 'item_list'], stdout=StringIO())
+
+    def test_other_databases_are_refused(self):
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            with self.assertRaisesMessage(CommandError, 'only checked on SQLite'):
+                call_command('check_query_plans', stdout=StringIO())
+            with self.assertRaises(queryplan.UnsupportedDatabase):
+                queryplan.check(User(username='nobody'))
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(username='owner')
+        # Repeated prices and give-away items without one, to cross ties and NULLs
+        prices = [None, 5, 5, None, 20, 5, 1, None, 20, 7, 5, 3, None, 9]
+        Item.objects.bulk_create(
+            Item(owner=owner, title=f'Item {i}', description='Desc', price=price)
+            for i, price in enumerate(prices)
+        )
+        cls.items = Item.objects.all()
+
+    def walk(self, paginator, cursor=None, backwards=False):
+        pages = []
+        while True:
+            page = paginator.page(cursor)
+            pages.append([getattr(row, 'pk', row) for row in page])
+            cursor = page.previous_cursor() if backwards else page.next_cursor()
+            if cursor is None:
+                return pages[::-1] if backwards else pages
+
+    def test_pages_cover_every_row_once_in_order(self):
+        for ordering in (('price', 'id'), ('-price', '-id'), ('-created_at', '-id')):
+            with self.subTest(ordering=ordering):
+                expected = list(self.items.order_by(*ordering).values_list('pk', flat=True))
+                paginator = KeysetPaginator(self.items, ordering, 4)
+                forwards = self.walk(paginator)
+                self.assertEqual(sum(forwards, []), expected)
+                self.assertEqual([len(page) for page in forwards], [4, 4, 4, 2])
+                backwards = self.walk(paginator, pagination.LAST, backwards=True)
+                self.assertEqual(sum(backwards, []), expected)
+
+    def test_deep_pages_run_one_query(self):
+        paginator = KeysetPaginator(self.items, ('-created_at', '-id'), 4)
+        cursor = paginator.page().next_cursor()
+        with self.assertNumQueries(1):
+            paginator.page(cursor)
+
+    def test_sorted_lists(self):
+        rows = [(0.5, 3), (1.0, 1), (1.0, 2), (2.5, 7), (3.0, 4)]
+        paginator = KeysetPaginator(rows, ('distance_km', 'id'), 2)
+        self.assertEqual(self.walk(paginator), [rows[0:2], rows[2:4], rows[4:]])
+        self.assertEqual(self.walk(paginator, pagination.LAST, backwards=True), [rows[0:1], rows[1:3], rows[3:]])
+
+    def test_bad_cursors_read_as_the_first_page(self):
+        paginator = KeysetPaginator(self.items, ('price', 'id'), 4)
+        first = [item.pk for item in paginator.page()]
+        cursor = paginator.page().next_cursor()
+        for bad in (cursor[:-2] + 'xx', 'garbage', KeysetPaginator(self.items, ('-id',), 4).page().next_cursor()):
+            self.assertEqual([item.pk for item in paginator.page(bad)], first)
+
+
+@override_settings(PAGINATION_EXACT_COUNT_LIMIT=5)
+class EstimatedCountPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner')
+        Item.objects.bulk_create(
+            Item(owner=cls.owner, title=f'Item {i}', description='Desc', price=i, is_available=i < 8)
+            for i in range(10)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_small_results_are_counted_exactly(self):
+        paginator = EstimatedCountPaginator(Item.objects.filter(price__lt=4), 2)
+        self.assertEqual(paginator.count, 4)
+        self.assertFalse(paginator.estimated)
+        Item.objects.create(owner=self.owner, title='New', description='Desc', price=0)
+        self.assertEqual(EstimatedCountPaginator(Item.objects.filter(price__lt=4), 2).count, 5)
+
+    def test_large_counts_are_cached_per_filter_set(self):
+        available = Item.objects.filter(is_available=True)
+        paginator = EstimatedCountPaginator(available.order_by('-created_at'), 3)
+        self.assertEqual((paginator.count, paginator.num_pages), (8, 3))
+        self.assertTrue(paginator.estimated)
+
+        Item.objects.create(owner=self.owner, title='New', description='Desc')
+        # Another order of the same filters reuses the count: the capped
+        # count and the cache lookup, no full COUNT(*)
+        paginator = EstimatedCountPaginator(available.order_by('price'), 3)
+        with self.assertNumQueries(1):
+            self.assertEqual(paginator.count, 8)
+        self.assertEqual(EstimatedCountPaginator(Item.objects.all(), 3).count, 11)
+        cache.clear()
+        self.assertEqual(EstimatedCountPaginator(available, 3).count, 9)
+
+    def test_lists_are_counted(self):
+        paginator = EstimatedCountPaginator(list(range(12)), 5)
+        self.assertEqual((paginator.count, paginator.estimated), (12, False))
+
+    def test_item_admin_changelist(self):
+        admin = User.objects.create_superuser(username='admin', password='pw')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:items_item_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.context['cl'].paginator, EstimatedCountPaginator)
+        self.assertEqual(response.context['cl'].result_count, 10)
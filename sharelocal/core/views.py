@@ -1,7 +1,7 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from items.models import Item
-from request_app.models import ItemRequest
+from . import counters
 
 def home(request):
     """
@@ -10,24 +10,16 @@ def home(request):
     # Get featured items (latest 6 available items)
     featured_items = Item.objects.filter(is_available=True).order_by('-created_at')[:6]
     
-    # Get statistics
-    total_items = Item.objects.count()
-    total_requests = ItemRequest.objects.count()
-    total_users = Item.objects.values('owner').distinct().count()
-    
-    # Get pending count for logged-in users
-    pending_count = 0
-    if request.user.is_authenticated:
-        pending_count = ItemRequest.objects.filter(
-            item__owner=request.user,
-            status='Pending'
-        ).count()
+    # Get statistics (materialized counters, one indexed lookup)
+    stats = counters.read(counters.ITEMS, counters.REQUESTS, counters.ITEM_OWNERS)
+    total_items = stats[counters.ITEMS]
+    total_requests = stats[counters.REQUESTS]
+    total_users = stats[counters.ITEM_OWNERS]
     
     context = {
         'featured_items': featured_items,
         'total_items': total_items,
         'total_requests': total_requests,
         'total_users': total_users,
-        'pending_count': pending_count,
     }
     return render(request, 'core/home.html', context)
\ No newline at end of file
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from core.pagination import EstimatedCountPaginator
 from .models import Item
 
 
@@ -11,6 +12,10 @@ class ItemAdmin(admin.ModelAdmin):
     list_filter = ('category', 'item_type', 'is_available', 'created_at')
     search_fields = ('title', 'description', 'owner__username')
     readonly_fields = ('created_at', 'updated_at')
+    # Large changelists show an estimated count instead of running COUNT(*)
+    # for the filtered and the unfiltered total on every page
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = (
         ('Item Information', {
             'fields': ('title', 'description', 'category', 'image'),
@@ -0,0 +1,224 @@
+"""
+In-process prefix index for search-as-you-type over item titles and
+category names.
+
+Each distinct title (case-folded) and each category is an entry weighted
+by how many available items carry it. Every word of an entry starts a
+key ("folding pressure washer", "pressure washer", "washer") in one
+sorted list, so the entries matching a prefix are a bisected slice of
+it. A slice too long to rank whole (a one-letter prefix) is answered
+from the entries in popularity order instead, stopping once enough
+match.
+
+Item and Category signals adjust weights in place; entries new since the
+last build sit in a small overlay scanned on every query and are folded
+into the sorted list once it grows. Once start_refresh() is called, a
+background thread reloads the index from the database every
+ITEMS_AUTOCOMPLETE_INDEX_TTL seconds so workers converge on changes
+made without signals (bulk updates), without a keystroke waiting on the
+reload.
+"""
+import bisect
+import heapq
+import re
+import threading
+
+from django.conf import settings
+from django.db.models import Count
+
+from .indexes import ReloadableIndex
+
+TITLE = 'item'
+CATEGORY = 'category'
+
+# Suggestions returned when the caller does not ask for a number
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+
+# Longest slice of matching keys ranked in full
+SCAN_LIMIT = 2000
+
+# Overlay entries that trigger folding them into the sorted keys
+OVERLAY_REBUILD_MIN = 256
+OVERLAY_REBUILD_RATIO = 0.05
+
+_LAST = '\U0010ffff'
+
+
+def normalize(text):
+    """Case-folded words of text joined by single spaces."""
+    return ' '.join(re.findall(r'\w+', (text or '').casefold()))
+
+
+def _matches(key, prefix):
+    return key.startswith(prefix) or f' {prefix}' in key
+
+
+class AutocompleteIndex(ReloadableIndex):
+    """Thread-safe sorted prefix keys plus weights and an overlay of new entries."""
+
+    label = 'Autocomplete index'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = None  # (kind, key) -> [label, value, weight]
+        self._category_keys = {}  # category id -> entry key of its name
+        self._keys = []  # word-start suffixes of the entry keys, sorted
+        self._owners = []  # the entry of each suffix
+        self._popular = []  # entries by weight at the last build, heaviest first
+        self._overlay = set()  # entries added since the last build
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'ITEMS_AUTOCOMPLETE_INDEX_TTL', 600)
+
+    def reset(self):
+        """Drop the index; it is reloaded from the database on next use."""
+        with self._lock:
+            self._entries = None
+            self._category_keys = {}
+            self._keys, self._owners, self._popular = [], [], []
+            self._overlay = set()
+
+    def rebuild(self):
+        """Load the titles and categories of available items from the database."""
+        self._reload(self._load, self._install)
+
+    def _load(self):
+        from core.models import Category
+        from .models import Item
+
+        available = Item.objects.filter(is_available=True).order_by()
+        entries = {}
+        for title, n in available.values_list('title').annotate(n=Count('id')).iterator():
+            key = normalize(title)
+            if not key:
+                continue
+            entry = entries.setdefault((TITLE, key), [title, title, 0])
+            entry[2] += n
+        counts = dict(available.filter(category__isnull=False).values_list('category_id').annotate(n=Count('id')))
+        category_keys = {}
+        for category_id, name in Category.objects.values_list('id', 'name'):
+            key = normalize(name)
+            if key:
+                entries[(CATEGORY, key)] = [name, category_id, counts.get(category_id, 0)]
+                category_keys[category_id] = key
+        return entries, category_keys
+
+    def _install(self, loaded, pending):
+        self._entries, self._category_keys = loaded
+        self._build()
+        # A change committed just before the scan but signalled after it
+        # starts is counted twice; the next reload evens it out
+        for method, args in pending:
+            method(*args)
+
+    def _ensure_loaded(self):
+        self._ensure_refresher()
+        if self._entries is None:
+            self.rebuild()
+
+    def _build(self):
+        """Sort the keys of every entry still in use."""
+        self._entries = {entry: value for entry, value in self._entries.items() if value[2] > 0 or entry[0] == CATEGORY}
+        pairs = []
+        for entry in self._entries:
+            key = entry[1]
+            pairs.append((key, entry))
+            pairs.extend((key[i + 1:], entry) for i, char in enumerate(key) if char == ' ')
+        pairs.sort()
+        self._keys = [key for key, _ in pairs]
+        self._owners = [entry for _, entry in pairs]
+        self._popular = sorted(self._entries, key=lambda entry: -self._entries[entry][2])
+        self._overlay = set()
+
+    def _add(self, entry, label, value, delta):
+        current = self._entries.get(entry)
+        if current is None:
+            if delta <= 0 and entry[0] == TITLE:
+                return
+            self._entries[entry] = [label, value, delta]
+            self._overlay.add(entry)
+            if len(self._overlay) > max(OVERLAY_REBUILD_MIN, OVERLAY_REBUILD_RATIO * len(self._entries)):
+                self._build()
+        else:
+            current[2] += delta
+
+    def move(self, old, new):
+        """
+        Record an item changing from old to new, each a (title,
+        category_id, is_available) tuple or None when it did not exist.
+        """
+        with self._lock:
+            self._record(self.move, old, new)
+            if self._entries is None:
+                # Nothing loaded yet; the next query reads fresh data anyway
+                return
+            for listing, delta in ((old, -1), (new, 1)):
+                if not listing or not listing[2]:
+                    continue
+                title, category_id, _ = listing
+                key = normalize(title)
+                if key:
+                    self._add((TITLE, key), title, title, delta)
+                category_key = self._category_keys.get(category_id)
+                if category_key is not None:
+                    self._entries[(CATEGORY, category_key)][2] += delta
+
+    def rename_category(self, category_id, name):
+        """Index a new or renamed category under name, keeping its item count."""
+        with self._lock:
+            self._record(self.rename_category, category_id, name)
+            if self._entries is None:
+                return
+            old_key = self._category_keys.pop(category_id, None)
+            entry = self._entries.pop((CATEGORY, old_key), None) if old_key is not None else None
+            key = normalize(name)
+            if key:
+                self._category_keys[category_id] = key
+                self._add((CATEGORY, key), name, category_id, entry[2] if entry else 0)
+
+    def discard_category(self, category_id):
+        with self._lock:
+            self._record(self.discard_category, category_id)
+            if self._entries is None:
+                return
+            key = self._category_keys.pop(category_id, None)
+            if key is not None:
+                self._entries.pop((CATEGORY, key), None)
+
+    def suggest(self, text, limit=DEFAULT_LIMIT):
+        """
+        Up to limit (kind, label, value) entries with a word starting with
+        text, most items first. kind is TITLE (value: the title) or
+        CATEGORY (value: the category id).
+        """
+        prefix = normalize(text)
+        if not prefix or limit <= 0:
+            return []
+        with self._lock:
+            self._ensure_loaded()
+            entries = self._entries
+            lo = bisect.bisect_left(self._keys, prefix)
+            hi = bisect.bisect_left(self._keys, prefix + _LAST, lo)
+            if hi - lo <= SCAN_LIMIT:
+                candidates = set(self._owners[lo:hi])
+            else:
+                # Popular entries first; the order is the last build's, so
+                # take some slack before ranking by the current weights
+                candidates = set()
+                for entry in self._popular:
+                    if _matches(entry[1], prefix):
+                        candidates.add(entry)
+                        if len(candidates) == 2 * limit:
+                            break
+            candidates.update(entry for entry in self._overlay if _matches(entry[1], prefix))
+            ranked = heapq.nsmallest(
+                limit,
+                (entry for entry in candidates if entry in entries and entries[entry][2] > 0),
+                key=lambda entry: (-entries[entry][2], entry[1]),
+            )
+            return [(entry[0], entries[entry][0], entries[entry][1]) for entry in ranked]
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,61 @@
+"""
+Facet counts for item_list: how many items each category and item type
+would show for the current search and location.
+
+All counts come from one GROUP BY (category, item_type) query over the
+listing's other filters, cached per filter set. Category counts are read
+under the selected item type and type counts under the selected
+category, so each dropdown says what picking an option would return.
+The cache keys are core.pagination's, so invalidate_counts(Item)
+retires these counts with the paginators' ones.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from core.pagination import count_cache_key
+from .models import Item
+
+# Seconds a filter set's counts are reused
+FACET_CACHE_TTL = 60
+
+
+def facet_counts(queryset):
+    """{(category_id, item_type): number of items} for queryset."""
+    if queryset.query.is_empty():
+        return {}
+    key = count_cache_key(queryset, 'facets')
+    counts = cache.get(key)
+    if counts is None:
+        grouped = queryset.order_by().values_list('category_id', 'item_type').annotate(n=Count('pk'))
+        counts = {(category_id, item_type): n for category_id, item_type, n in grouped}
+        cache.set(key, counts, getattr(settings, 'ITEMS_FACET_CACHE_TTL', FACET_CACHE_TTL))
+    return counts
+
+
+def item_facets(queryset, categories, category_filter='', item_type_filter=''):
+    """
+    Counts for the item_list filter dropdowns.
+
+    queryset holds the items matching every filter but the category and
+    the item type. Returns a dict with the categories (each given an
+    item_count), the (value, label, count) item types, and the totals of
+    both dropdowns' "All" options.
+    """
+    by_category, by_type = Counter(), Counter()
+    for (category_id, item_type), n in facet_counts(queryset).items():
+        if not item_type_filter or item_type == item_type_filter:
+            by_category[category_id] += n
+        if not category_filter or str(category_id) == category_filter:
+            by_type[item_type] += n
+    categories = list(categories)
+    for category in categories:
+        category.item_count = by_category[category.id]
+    return {
+        'categories': categories,
+        'category_total': sum(by_category.values()),
+        'item_types': [(value, label, by_type[value]) for value, label in Item.ITEM_TYPE_CHOICES],
+        'item_type_total': sum(by_type.values()),
+    }
@@ -0,0 +1,198 @@
+"""
+Geographic helpers for the nearest-item search.
+
+Items store a geohash of their coordinates so that a radius search can be
+narrowed down in SQL (indexed geohash ranges plus a latitude/longitude
+bounding box) before the exact haversine distance is computed.
+"""
+import math
+
+from django.db.models import FloatField, Func, Q, Value
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371
+
+# Precision stored on Item.geohash (~5m cells)
+GEOHASH_PRECISION = 9
+
+# Upper bound on the number of geohash cells used to cover a search box
+MAX_PREFILTER_CELLS = 16
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Return distance in kilometers between two lat/lon points."""
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def sqlite_haversine(lat1, lon1, lat2, lon2):
+    """SQLite user function wrapping haversine(); NULL in, NULL out."""
+    if lat1 is None or lon1 is None or lat2 is None or lon2 is None:
+        return None
+    return haversine(lat1, lon1, lat2, lon2)
+
+
+class Haversine(Func):
+    """
+    Great-circle distance in km between two coordinate columns/values.
+
+    SQLite calls the haversine() user function registered on every new
+    connection; other backends get the same formula spelled out with their
+    native trigonometric functions.
+    """
+    function = 'SHARELOCAL_HAVERSINE'
+    output_field = FloatField()
+
+    def __init__(self, lat1, lon1, lat2, lon2, **extra):
+        super().__init__(lat1, lon1, lat2, lon2, **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        lat1, lon1, lat2, lon2 = (Radians(expr) for expr in self.get_source_expressions())
+        a = (
+            Power(Sin((lat2 - lat1) / Value(2.0)), Value(2.0))
+            + Cos(lat1) * Cos(lat2) * Power(Sin((lon2 - lon1) / Value(2.0)), Value(2.0))
+        )
+        distance = Value(2.0 * EARTH_RADIUS_KM) * ASin(Sqrt(a), output_field=FloatField())
+        return compiler.compile(distance)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, **extra_context)
+
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode a coordinate pair as a geohash string."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits <<= 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def geohash_cell_size(precision):
+    """Return the (lat, lon) size in degrees of a geohash cell."""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    Return the lat/lon box enclosing a circle of radius_km.
+
+    The result is (min_lat, max_lat, lon_ranges) where lon_ranges is a list
+    of (min_lon, max_lon) tuples; boxes crossing the antimeridian are split
+    in two and boxes touching a pole span every longitude.
+    """
+    latitude = min(max(latitude, -90.0), 90.0)
+    longitude = min(max(longitude, -180.0), 180.0)
+    radius_km = max(radius_km, 0.0)
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat = latitude - dlat
+    max_lat = latitude + dlat
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90.0), min(max_lat, 90.0), [(-180.0, 180.0)]
+
+    dlon = math.degrees(
+        math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(latitude))))
+    )
+    min_lon = longitude - dlon
+    max_lon = longitude + dlon
+    if max_lon - min_lon >= 360:
+        lon_ranges = [(-180.0, 180.0)]
+    elif min_lon < -180:
+        lon_ranges = [(min_lon + 360, 180.0), (-180.0, max_lon)]
+    elif max_lon > 180:
+        lon_ranges = [(min_lon, 180.0), (-180.0, max_lon - 360)]
+    else:
+        lon_ranges = [(min_lon, max_lon)]
+    return min_lat, max_lat, lon_ranges
+
+
+def _frange(start, stop, step):
+    """Yield start, start+step, ... and always finish with stop."""
+    value = start
+    while value < stop:
+        yield value
+        value += step
+    yield stop
+
+
+def geohash_cells(min_lat, max_lat, lon_ranges, max_cells=MAX_PREFILTER_CELLS):
+    """
+    Return the geohash prefixes covering a bounding box.
+
+    The finest precision whose covering stays within max_cells is used; an
+    empty set means the box is too large for the geohash to narrow it down.
+    """
+    # Inverted or nan boxes would give no (or negative) rows and columns
+    if not min_lat <= max_lat or not all(lo <= hi for lo, hi in lon_ranges):
+        return set()
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_step, lon_step = geohash_cell_size(precision)
+        rows = math.ceil((max_lat - min_lat) / lat_step) + 1
+        cols = sum(math.ceil((hi - lo) / lon_step) + 1 for lo, hi in lon_ranges)
+        if rows * cols > max_cells:
+            continue
+        cells = set()
+        for lat in _frange(min_lat, max_lat, lat_step):
+            for lo, hi in lon_ranges:
+                for lon in _frange(lo, hi, lon_step):
+                    cells.add(geohash_encode(lat, lon, precision))
+        return cells
+    return set()
+
+
+def radius_prefilter(latitude, longitude, radius_km):
+    """
+    Build an indexable Q narrowing items to the bounding box of a radius.
+
+    Candidates still need an exact haversine check; the filter only
+    guarantees that no item within radius_km is excluded.
+    """
+    min_lat, max_lat, lon_ranges = bounding_box(latitude, longitude, radius_km)
+    box = Q(latitude__gte=min_lat, latitude__lte=max_lat)
+    lon_q = Q()
+    for lo, hi in lon_ranges:
+        lon_q |= Q(longitude__gte=lo, longitude__lte=hi)
+    box &= lon_q
+
+    cells = geohash_cells(min_lat, max_lat, lon_ranges)
+    if cells:
+        # Prefix ranges instead of LIKE so the geohash index is usable on every backend
+        cell_q = Q()
+        for cell in sorted(cells):
+            cell_q |= Q(geohash__gte=cell, geohash__lt=cell + '~')
+        box &= cell_q
+    return box
@@ -0,0 +1,102 @@
+"""
+Loading and periodic reloading shared by the in-process item indexes
+(items.spatial, items.autocomplete).
+
+Subclasses provide rebuild(), a ttl property and a _lock, and call
+_ensure_refresher() from their _ensure_loaded(). Queries never reload:
+an index past its ttl is rebuilt by a background thread while requests
+keep reading the loaded one.
+
+A rebuild reads the database without holding the lock, so changes
+keep arriving from signals meanwhile. _reload() records them (_record())
+and replays them onto the new data before swapping it in; otherwise a
+change committed during the scan would be lost until the next reload.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.db import DatabaseError, connection
+
+logger = logging.getLogger(__name__)
+
+
+class ReloadableIndex:
+    # Used in log messages and the refresh thread's name
+    label = 'Index'
+
+    _refresh = False
+    _refresher_pid = None  # process running the refresh thread
+    _generation = 0  # rebuilds started
+    _pending = None  # (method, args) changes seen by the rebuild in progress
+
+    def warm(self):
+        """Build the index at worker start; a failure falls back to lazy loading."""
+        try:
+            self.rebuild()
+        except DatabaseError:
+            logger.warning('%s warm-up failed; it will be built on first use', self.label, exc_info=True)
+
+    def start_refresh(self):
+        """
+        Reload the index every ttl seconds on a daemon thread.
+
+        The thread is started by the next query, in the process serving
+        it: a server that imports the application before forking workers
+        (gunicorn --preload) gets one per worker, not one in the master
+        that the workers would not inherit.
+        """
+        self._refresh = True
+
+    def _ensure_refresher(self):
+        pid = os.getpid()
+        with self._lock:
+            # Claimed under the lock so concurrent first queries start one thread
+            if not self._refresh or self._refresher_pid == pid or not self.ttl:
+                return
+            self._refresher_pid = pid
+        name = self.label.lower().replace(' ', '-') + '-refresh'
+        threading.Thread(target=self._refresh_forever, name=name, daemon=True).start()
+
+    def _reload(self, load, install):
+        """
+        Run load() outside the lock, then install(loaded, pending) under it.
+
+        pending lists the changes recorded while load() ran, for install()
+        to replay once the loaded data is in place. When another rebuild
+        started in the meantime this one is dropped: the later scan is
+        fresher.
+        """
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            self._pending = []
+        try:
+            loaded = load()
+        except BaseException:
+            with self._lock:
+                if generation == self._generation:
+                    self._pending = None
+            raise
+        with self._lock:
+            if generation != self._generation:
+                return
+            pending, self._pending = self._pending, None
+            install(loaded, pending)
+
+    def _record(self, method, *args):
+        """Keep a change for the rebuild in progress, if any; call under the lock."""
+        if self._pending is not None:
+            self._pending.append((method, args))
+
+    def _refresh_forever(self):
+        while True:
+            time.sleep(self.ttl)
+            try:
+                self.rebuild()
+            except DatabaseError:
+                logger.warning('%s refresh failed; keeping the loaded one', self.label, exc_info=True)
+            finally:
+                # This thread's own connection; don't hold it between reloads
+                connection.close()
@@ -0,0 +1,81 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.benchmark import BOUNDS, Rollback, percentile
+from items.geo import geohash_encode, haversine, radius_prefilter
+from items.models import Item
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the nearest-item search with and without the geohash/bounding-box prefilter.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000],
+                            help='Catalogue sizes to benchmark')
+        parser.add_argument('--queries', type=int, default=50, help='Queries per size and strategy')
+        parser.add_argument('--radius', type=float, default=10.0, help='Search radius in km')
+        parser.add_argument('--skip-full-scan', action='store_true',
+                            help='Only time the prefiltered search (the full scan is slow on large sizes)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        points = [
+            (rng.uniform(BOUNDS[0], BOUNDS[1]), rng.uniform(BOUNDS[2], BOUNDS[3]))
+            for _ in range(options['queries'])
+        ]
+
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    # Discarded once the size has been measured
+                    self._seed(size, BOUNDS, rng)
+                    self._report(size, 'prefilter', self._time(points, options['radius'], prefilter=True))
+                    if not options['skip_full_scan']:
+                        self._report(size, 'full scan', self._time(points, options['radius'], prefilter=False))
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def _seed(self, size, bounds, rng):
+        owner = User.objects.create(username=f'bench-nearest-{size}')
+        batch = []
+        for i in range(size):
+            lat = rng.uniform(bounds[0], bounds[1])
+            lon = rng.uniform(bounds[2], bounds[3])
+            batch.append(Item(
+                owner=owner, title=f'Bench item {i}', description='Benchmark item',
+                latitude=lat, longitude=lon, geohash=geohash_encode(lat, lon),
+            ))
+            if len(batch) >= 5000:
+                Item.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Item.objects.bulk_create(batch)
+
+    def _time(self, points, radius_km, prefilter):
+        timings = []
+        for lat, lon in points:
+            start = time.perf_counter()
+            items = Item.objects.filter(is_available=True, latitude__isnull=False, longitude__isnull=False)
+            if prefilter:
+                items = items.filter(radius_prefilter(lat, lon, radius_km))
+            nearby = []
+            for item in items.only('id', 'latitude', 'longitude'):
+                distance = haversine(lat, lon, item.latitude, item.longitude)
+                if distance <= radius_km:
+                    nearby.append((distance, item.id))
+            nearby.sort()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def _report(self, size, label, timings):
+        self.stdout.write(
+            f'{size:>9} items  {label:<10} p50={percentile(timings, 50):8.2f}ms  '
+            f'p99={percentile(timings, 99):8.2f}ms  mean={statistics.mean(timings):8.2f}ms'
+        )
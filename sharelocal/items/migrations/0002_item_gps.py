@@ -1,21 +0,0 @@
-from django.db import migrations, models
-
-
-class Migration(migrations.Migration):
-
-    dependencies = [
-        ('items', '0001_initial'),
-    ]
-
-    operations = [
-        migrations.AddField(
-            model_name='item',
-            name='latitude',
-            field=models.FloatField(blank=True, null=True),
-        ),
-        migrations.AddField(
-            model_name='item',
-            name='longitude',
-            field=models.FloatField(blank=True, null=True),
-        ),
-    ]
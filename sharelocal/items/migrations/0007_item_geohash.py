@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_encode(latitude, longitude, precision=9):
+    """items.geo.geohash_encode as of this migration."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits <<= 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def backfill_geohashes(apps, schema_editor):
+    """Compute geohashes for items that already have coordinates."""
+    Item = apps.get_model('items', 'Item')
+
+    batch = []
+    items = Item.objects.filter(latitude__isnull=False, longitude__isnull=False).only('id', 'latitude', 'longitude')
+    for item in items.iterator(chunk_size=2000):
+        item.geohash = geohash_encode(item.latitude, item.longitude)
+        batch.append(item)
+        if len(batch) >= 2000:
+            Item.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    if batch:
+        Item.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_location_alter_category_options_category_created_at_and_more'),
+        ('items', '0006_geocode_existing_items'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Geohash of the coordinates, used to prefilter nearest search', max_length=12),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['latitude', 'longitude'], name='items_item_lat_lon_idx'),
+        ),
+        migrations.RunPython(backfill_geohashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:31
+
+from django.db import migrations, models
+
+
+def mark_geocoded_rows(apps, schema_editor):
+    """Rows that already have coordinates count as resolved."""
+    Item = apps.get_model('items', 'Item')
+    Item.objects.filter(latitude__isnull=False, longitude__isnull=False).update(geocode_status='resolved')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0007_item_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='geocode_status',
+            field=models.CharField(blank=True, choices=[('', 'No location'), ('pending', 'Pending geocode'), ('resolved', 'Resolved'), ('failed', 'Not found')], default='', max_length=20),
+        ),
+        migrations.RunPython(mark_geocoded_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:39
+
+import django.db.models.deletion
+import items.search
+from django.db import migrations, models
+
+
+def create_search_index(apps, schema_editor):
+    """Create the FTS5 table and triggers (SQLite only) and index existing items."""
+    items.search.install_search_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    items.search.uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0008_item_geocode_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemSearchEntry',
+            fields=[
+                ('item', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='items.item')),
+                ('title', models.TextField()),
+                ('description', models.TextField()),
+                ('category', models.TextField()),
+                ('document', items.search.SearchDocumentField(db_column='items_item_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'items_item_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
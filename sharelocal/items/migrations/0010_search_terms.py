@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:17
+
+import re
+
+import django.db.models.deletion
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def words(text):
+    """items.trigram.words as of this migration."""
+    return {word for word in re.findall(r'\w+', (text or '').casefold()) if 1 < len(word) <= 100}
+
+
+def trigrams(word):
+    """items.trigram.trigrams as of this migration."""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def build_vocabulary(apps, schema_editor):
+    """Index the words of existing item titles and category names."""
+    Item = apps.get_model('items', 'Item')
+    Category = apps.get_model('core', 'Category')
+    SearchTerm = apps.get_model('items', 'SearchTerm')
+    SearchTrigram = apps.get_model('items', 'SearchTrigram')
+
+    counts = Counter()
+    for title in Item.objects.values_list('title', flat=True).iterator(chunk_size=2000):
+        counts.update(words(title))
+    for name in Category.objects.values_list('name', flat=True):
+        counts.update(words(name))
+
+    vocabulary = sorted(counts)
+    for start in range(0, len(vocabulary), 1000):
+        SearchTerm.objects.bulk_create([
+            SearchTerm(word=word, frequency=counts[word], trigram_count=len(trigrams(word)))
+            for word in vocabulary[start:start + 1000]
+        ])
+    batch = []
+    for term_id, word in SearchTerm.objects.values_list('id', 'word').iterator(chunk_size=2000):
+        batch.extend(SearchTrigram(trigram=trigram, term_id=term_id) for trigram in trigrams(word))
+        if len(batch) >= 5000:
+            SearchTrigram.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        SearchTrigram.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_location_gazetteer'),
+        ('items', '0009_item_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('word', models.CharField(max_length=100, unique=True)),
+                ('frequency', models.IntegerField(default=0)),
+                ('trigram_count', models.PositiveSmallIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='items.searchterm')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('trigram', 'term'), name='items_searchtrigram_trigram_term_uniq')],
+            },
+        ),
+        migrations.RunPython(build_vocabulary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_sitecounter'),
+        ('items', '0010_search_terms'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['-created_at'], name='items_item_avail_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['category', '-created_at'], name='items_item_cat_avail_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['owner', '-created_at'], name='items_item_owner_created_idx'),
+        ),
+    ]
@@ -1,37 +1,52 @@
-from django.db import models
+from django.db import connections, models
 from django.contrib.auth.models import User
-from core.models import Category
+from core.models import Category, GEOCODE_STATUS_CHOICES
+from core.geocode_queue import GeocodedLocationMixin, enqueue_geocode
+from core import prefetch
+from .geo import Haversine, geohash_encode, radius_prefilter
+from .search import FTS_TABLE, SearchDocumentField, fts_available, match_expression
+
+
+class ItemQuerySet(prefetch.AutoPrefetchQuerySetMixin, models.QuerySet):
+    def nearest(self, latitude, longitude, radius_km=None):
+        """
+        Annotate distance_km from (latitude, longitude) in SQL and order by it.
+
+        With a radius, rows are narrowed by the indexed geohash/bounding-box
+        prefilter first and then by the exact distance, so the queryset stays
+        lazy and pagination only fetches the rows it shows.
+        """
+        items = self.filter(latitude__isnull=False, longitude__isnull=False)
+        if radius_km is not None:
+            items = items.filter(radius_prefilter(latitude, longitude, radius_km))
+        items = items.annotate(distance_km=Haversine(
+            'latitude', 'longitude', models.Value(latitude), models.Value(longitude),
+        ))
+        if radius_km is not None:
+            items = items.filter(distance_km__lte=radius_km)
+        return items.order_by('distance_km', 'id')
+
+    def search(self, text):
+        """
+        Filter to items whose title, description or category match text.
+
+        On SQLite this is an FTS5 match ordered by bm25 relevance; elsewhere
+        an icontains fallback. Chain nearest() afterwards to order by
+        distance instead.
+        """
+        if not fts_available(connections[self.db]):
+            return self.filter(
+                models.Q(title__icontains=text)
+                | models.Q(description__icontains=text)
+                | models.Q(category__name__icontains=text)
+            )
+        expression = match_expression(text)
+        if not expression:
+            return self.none()
+        return self.filter(search_entry__document__match=expression).order_by('search_entry__rank', '-created_at')
 
-def geocode_location(location):
-    """Geocode a location string to get latitude and longitude."""
-    if not location:
-        return None, None
-    
-    try:
-        import requests
-        # Using Nominatim API (OpenStreetMap) - free and no API key required
-        url = f"https://nominatim.openstreetmap.org/search"
-        params = {
-            'q': location,
-            'format': 'json',
-            'limit': 1
-        }
-        headers = {
-            'User-Agent': 'ShareLocal/1.0'
-        }
-        response = requests.get(url, params=params, headers=headers, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        
-        if data:
-            return float(data[0]['lat']), float(data[0]['lon'])
-    except Exception:
-        # Gracefully handle any errors (including missing requests library)
-        pass
-    
-    return None, None
 
-class Item(models.Model):
+class Item(prefetch.AutoPrefetchModelMixin, GeocodedLocationMixin, models.Model):
     """
     Model for items that users can share on the platform.
     """
@@ -42,13 +57,15 @@ class Item(models.Model):
         ('Rent', 'Rent'),
     ]
 
-    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="items")
+    owner = prefetch.ForeignKey(User, on_delete=models.CASCADE, related_name="items")
     title = models.CharField(max_length=200)
     description = models.TextField()
-    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    category = prefetch.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
     location = models.CharField(max_length=100, null=True, blank=True, help_text='Location inherited from owner profile')
     latitude = models.FloatField(null=True, blank=True, help_text='Item latitude for nearest search')
     longitude = models.FloatField(null=True, blank=True, help_text='Item longitude for nearest search')
+    geocode_status = models.CharField(max_length=20, choices=GEOCODE_STATUS_CHOICES, blank=True, default='')
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False, help_text='Geohash of the coordinates, used to prefilter nearest search')
     
     item_type = models.CharField(max_length=20, choices=ITEM_TYPE_CHOICES, default='Share')
     price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
@@ -58,10 +75,66 @@ class Item(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ItemQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Item'
         verbose_name_plural = 'Items'
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='items_item_lat_lon_idx'),
+            # Listings: available items, newest first (home, item_list). Partial
+            # rather than led by is_available: filter(is_available=True) is
+            # rendered as a bare boolean test, which matches the index condition
+            # but cannot seek an is_available column. Every listing index ends
+            # in id, the tie-breaker of keyset pagination (core.pagination)
+            models.Index(
+                fields=['-created_at', '-id'], condition=models.Q(is_available=True),
+                name='items_item_avail_created_idx',
+            ),
+            # item_list sorted by price, either way (scanned backwards for descending)
+            models.Index(
+                fields=['price', 'id'], condition=models.Q(is_available=True),
+                name='items_item_avail_price_idx',
+            ),
+            # Related items in item_detail, category filter in item_list
+            models.Index(
+                fields=['category', '-created_at', '-id'], condition=models.Q(is_available=True),
+                name='items_item_cat_avail_idx',
+            ),
+            models.Index(
+                fields=['category', 'price', 'id'], condition=models.Q(is_available=True),
+                name='items_item_cat_price_idx',
+            ),
+            # Filter counts of item_list (items.facets): grouped straight
+            # from the index, without reading the table
+            models.Index(
+                fields=['category', 'item_type'], condition=models.Q(is_available=True),
+                name='items_item_avail_facet_idx',
+            ),
+            # Title popularity for the autocomplete index (items.autocomplete),
+            # grouped in title order from the index alone
+            models.Index(fields=['title'], condition=models.Q(is_available=True), name='items_item_avail_title_idx'),
+            # An owner's items, newest first (my_items, profile)
+            models.Index(fields=['owner', '-created_at', '-id'], name='items_item_owner_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_stored()
+        return instance
+
+    def _remember_stored(self):
+        """
+        Note the owner as stored, so post_save can move the item's requests
+        (ItemRequest.item_owner) and owner count when it changes, and the
+        listing, so it can move it in the autocomplete index
+        (items.autocomplete). None for what was deferred.
+        """
+        self._stored_owner_id = self.__dict__.get('owner_id')
+        listing = tuple(self.__dict__.get(field, models.DEFERRED) for field in ('title', 'category_id', 'is_available'))
+        self._stored_listing = None if models.DEFERRED in listing else listing
 
     def save(self, *args, **kwargs):
         """Auto-populate location from owner's profile if not set."""
@@ -77,14 +150,41 @@ class Item(models.Model):
             except:
                 pass
         
-        # Geocode location to get coordinates if not set
-        if self.location and (not self.latitude or not self.longitude):
-            lat, lon = geocode_location(self.location)
-            if lat is not None and lon is not None:
-                self.latitude = lat
-                self.longitude = lon
+        # Geocode location to get coordinates if not set. Only when the
+        # location is being written, so partial saves never trigger it.
+        update_fields = kwargs.get('update_fields')
+        queue_geocode = False
+        if update_fields is None or 'location' in update_fields:
+            if self.location and (not self.latitude or not self.longitude):
+                queue_geocode = self._geocode_location()
+            elif self.latitude is not None and self.longitude is not None:
+                self.geocode_status = 'resolved'
+            elif not self.location:
+                self.geocode_status = ''
+
+        # Keep the geohash in sync with the coordinates
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geohash_encode(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if {'latitude', 'longitude'} & update_fields:
+                update_fields |= {'geohash'}
+            if 'location' in update_fields:
+                update_fields |= {'geocode_status'}
+            kwargs['update_fields'] = update_fields
         
         super().save(*args, **kwargs)
+        # post_save receivers have compared against the stored state; it is
+        # now what was just written
+        self._remember_stored()
+
+        if queue_geocode:
+            enqueue_geocode('item', self.pk, self.location)
+
+    def _store_geocode(self):
+        self.save(update_fields=['latitude', 'longitude', 'geocode_status'])
 
     def clean(self):
         """Ensure price rules are followed depending on item type."""
@@ -98,3 +198,47 @@ class Item(models.Model):
         return self.title
 
 
+class ItemSearchEntry(models.Model):
+    """
+    Row of the items_item_fts full-text table (see items.search).
+
+    Unmanaged: the FTS5 table and the triggers filling it are created by a
+    migration on SQLite only. document is the table's hidden column named
+    after the table, the left operand of MATCH; rank is FTS5's bm25 score.
+    """
+    item = models.OneToOneField(Item, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid', related_name='search_entry')
+    title = models.TextField()
+    description = models.TextField()
+    category = models.TextField()
+    document = SearchDocumentField(db_column=FTS_TABLE)
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = FTS_TABLE
+
+
+class SearchTerm(models.Model):
+    """
+    A word used in item titles or category names (see items.trigram).
+
+    frequency counts the titles and names containing the word and breaks
+    ties between equally similar suggestions.
+    """
+    word = models.CharField(max_length=100, unique=True)
+    frequency = models.IntegerField(default=0)
+    trigram_count = models.PositiveSmallIntegerField()
+
+    def __str__(self):
+        return self.word
+
+
+class SearchTrigram(models.Model):
+    """One trigram of a SearchTerm; the unique index drives similarity lookups."""
+    trigram = models.CharField(max_length=3)
+    term = models.ForeignKey(SearchTerm, on_delete=models.CASCADE, related_name='trigrams')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['trigram', 'term'], name='items_searchtrigram_trigram_term_uniq'),
+        ]
@@ -0,0 +1,135 @@
+"""
+Full-text search over item titles, descriptions and category names.
+
+On SQLite the text lives in an FTS5 virtual table (items_item_fts, one row
+per item, rowid = item id) that triggers keep in sync with items_item and
+core_category, so queryset.update() and bulk_update() are covered too.
+ItemQuerySet.search() joins it through the unmanaged ItemSearchEntry model
+and orders by bm25. Other backends fall back to icontains.
+"""
+import re
+
+from django.db import connections, models
+
+FTS_TABLE = 'items_item_fts'
+
+# bm25 weights for the title, description and category columns
+RANK_FUNCTION = 'bm25(10.0, 1.0, 4.0)'
+
+_CATEGORY_NAME = 'COALESCE((SELECT name FROM core_category WHERE id = new.category_id), \'\')'
+
+TRIGGERS = {
+    'items_item_fts_insert': f'''
+        CREATE TRIGGER IF NOT EXISTS items_item_fts_insert AFTER INSERT ON items_item BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, title, description, category)
+            VALUES (new.id, new.title, new.description, {_CATEGORY_NAME});
+        END
+    ''',
+    'items_item_fts_update': f'''
+        CREATE TRIGGER IF NOT EXISTS items_item_fts_update
+        AFTER UPDATE OF title, description, category_id ON items_item BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+            INSERT INTO {FTS_TABLE}(rowid, title, description, category)
+            VALUES (new.id, new.title, new.description, {_CATEGORY_NAME});
+        END
+    ''',
+    'items_item_fts_delete': f'''
+        CREATE TRIGGER IF NOT EXISTS items_item_fts_delete AFTER DELETE ON items_item BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        END
+    ''',
+    'items_item_fts_category': f'''
+        CREATE TRIGGER IF NOT EXISTS items_item_fts_category AFTER UPDATE OF name ON core_category BEGIN
+            UPDATE {FTS_TABLE} SET category = new.name
+            WHERE rowid IN (SELECT id FROM items_item WHERE category_id = new.id);
+        END
+    ''',
+}
+
+
+class SearchDocumentField(models.TextField):
+    """The FTS5 hidden column named after its table; supports __match."""
+
+
+@SearchDocumentField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+def fts_available(connection):
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(text):
+    """
+    Turn free text into an FTS5 query: every word must match, as a prefix.
+
+    Words are quoted so operators and punctuation typed by users are never
+    interpreted; returns '' when the text has no searchable words.
+    """
+    words = re.findall(r'\w+', text.casefold())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _installed(cursor):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+    return {row[0] for row in cursor.fetchall()} & {FTS_TABLE, *TRIGGERS}
+
+
+def rebuild_search_index(connection):
+    """Repopulate the FTS table from items_item."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(f'''
+            INSERT INTO {FTS_TABLE}(rowid, title, description, category)
+            SELECT item.id, item.title, item.description, COALESCE(category.name, '')
+            FROM items_item item LEFT JOIN core_category category ON category.id = item.category_id
+        ''')
+
+
+def install_search_index(connection):
+    """
+    Create the FTS table and its triggers if missing, rebuilding the index
+    when anything had to be (re)created.
+
+    SQLite migrations that remake items_item or core_category drop their
+    triggers, so this also runs after every migrate (see ItemsConfig).
+    Returns True when the index was rebuilt.
+    """
+    if not fts_available(connection):
+        return False
+    with connection.cursor() as cursor:
+        if _installed(cursor) == {FTS_TABLE, *TRIGGERS}:
+            return False
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "title, description, category, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', %s)", [RANK_FUNCTION])
+        for sql in TRIGGERS.values():
+            cursor.execute(sql)
+    rebuild_search_index(connection)
+    return True
+
+
+def uninstall_search_index(connection):
+    if not fts_available(connection):
+        return
+    with connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def repair_search_index(sender, using, **kwargs):
+    """post_migrate handler restoring triggers dropped by table remakes."""
+    connection = connections[using]
+    # Only repair an index the items migrations already created
+    if fts_available(connection) and FTS_TABLE in connection.introspection.table_names():
+        install_search_index(connection)
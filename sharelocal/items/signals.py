@@ -0,0 +1,108 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.models import Category
+from .autocomplete import autocomplete_index
+from .geo import sqlite_haversine
+from .models import Item
+from .spatial import spatial_index
+from .trigram import reindex_text
+
+
+@receiver(post_save, sender=Item)
+def update_spatial_index(sender, instance, **kwargs):
+    """Patch the in-process spatial index once the item is committed."""
+    transaction.on_commit(lambda: spatial_index.upsert(
+        instance.id, instance.latitude, instance.longitude, instance.is_available,
+    ))
+
+
+@receiver(post_delete, sender=Item)
+def remove_from_spatial_index(sender, instance, **kwargs):
+    item_id = instance.id
+    transaction.on_commit(lambda: spatial_index.discard(item_id))
+
+
+def _listing(item):
+    return item.title, item.category_id, item.is_available
+
+
+@receiver(post_save, sender=Item)
+def update_autocomplete_index(sender, instance, created, raw=False, **kwargs):
+    """Move the item's title and category counts once it is committed."""
+    if raw:
+        return
+    old = None if created else getattr(instance, '_stored_listing', None)
+    new = _listing(instance)
+    if old is None and not created:
+        # Saved without being loaded: the previous listing is unknown and
+        # the next reload of the index catches up
+        return
+    if old != new:
+        transaction.on_commit(lambda: autocomplete_index.move(old, new))
+
+
+@receiver(post_delete, sender=Item)
+def remove_from_autocomplete_index(sender, instance, **kwargs):
+    old = getattr(instance, '_stored_listing', None) or _listing(instance)
+    transaction.on_commit(lambda: autocomplete_index.move(old, None))
+
+
+@receiver(post_save, sender=Category)
+def update_autocomplete_category(sender, instance, raw=False, **kwargs):
+    if not raw:
+        category_id, name = instance.id, instance.name
+        transaction.on_commit(lambda: autocomplete_index.rename_category(category_id, name))
+
+
+@receiver(post_delete, sender=Category)
+def remove_autocomplete_category(sender, instance, **kwargs):
+    category_id = instance.id
+    transaction.on_commit(lambda: autocomplete_index.discard_category(category_id))
+
+
+@receiver(connection_created)
+def register_sqlite_functions(sender, connection, **kwargs):
+    """Expose haversine() to SQLite so Item.objects.nearest() runs in SQL."""
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function(
+            'SHARELOCAL_HAVERSINE', 4, sqlite_haversine, deterministic=True,
+        )
+
+
+def _writes(update_fields, field):
+    return update_fields is None or field in update_fields
+
+
+@receiver(pre_save, sender=Item)
+@receiver(pre_save, sender=Category)
+def remember_indexed_text(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Note the stored title/name so post_save can diff the vocabulary."""
+    field = 'title' if sender is Item else 'name'
+    if raw or not _writes(update_fields, field):
+        return
+    old = None
+    stored_listing = getattr(instance, '_stored_listing', None) if sender is Item else None
+    if stored_listing is not None:
+        # Loaded items already note their stored title (Item._remember_stored)
+        old = stored_listing[0]
+    elif instance.pk is not None:
+        old = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+    instance._indexed_text = old
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=Category)
+def update_search_terms(sender, instance, update_fields=None, raw=False, **kwargs):
+    field = 'title' if sender is Item else 'name'
+    if raw or not _writes(update_fields, field):
+        return
+    reindex_text(instance.__dict__.pop('_indexed_text', None), getattr(instance, field))
+
+
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=Category)
+def remove_search_terms(sender, instance, **kwargs):
+    reindex_text(getattr(instance, 'title' if sender is Item else 'name'), None)
@@ -0,0 +1,359 @@
+"""
+In-process spatial index over available, geolocated items.
+
+Points are kept as unit vectors in flat arrays laid out as an implicit
+KD-tree, so a radius or k-nearest query touches only a handful of nodes
+instead of every row. Changes arriving from Item signals and from bulk
+updates are held in a small overlay and folded into the tree once it
+grows past a threshold. Once start_refresh() is called, a background
+thread of the serving process also reloads the whole index every
+ITEMS_SPATIAL_INDEX_TTL seconds so workers that missed a signal
+converge, without a request waiting on the reload.
+
+Nearest search pages through the tree with (distance_km, item_id) keys:
+a page asks for the points just after (or before) the previous page's
+boundary, so it never collects and sorts every point in the radius.
+"""
+import heapq
+import math
+import threading
+from array import array
+
+from django.conf import settings
+
+from .geo import EARTH_RADIUS_KM
+from .indexes import ReloadableIndex
+
+# Overlay entries that trigger folding them into the tree
+OVERLAY_REBUILD_MIN = 512
+OVERLAY_REBUILD_RATIO = 0.05
+
+
+def _to_xyz(latitude, longitude):
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    cos_lat = math.cos(lat)
+    return cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat)
+
+
+def _chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def _km_to_chord(km):
+    return 2 * math.sin(min(km, math.pi * EARTH_RADIUS_KM) / (2 * EARTH_RADIUS_KM))
+
+
+def _key_band(key):
+    """
+    Squared chords (floor, ceiling) around a (distance_km, item_id) key.
+
+    A point nearer than floor comes before the key and one farther than
+    ceiling after it. Between the two the distances are compared in km,
+    as the key was computed, so a chord that does not survive the round
+    trip through km still lands on the right side.
+    """
+    if key is None:
+        return -1.0, -1.0
+    chord = _km_to_chord(key[0])
+    return (chord * (1 - 1e-9)) ** 2, (chord * (1 + 1e-9)) ** 2
+
+
+def _distance_key(chord, item_id):
+    return _chord_to_km(chord), item_id
+
+
+class KDTree:
+    """
+    Static 3-d tree over unit vectors.
+
+    The node covering the slice [lo, hi) sits at (lo + hi) // 2 and splits
+    on axis depth % 3, so no child pointers are stored.
+    """
+
+    def __init__(self, rows):
+        # rows: iterable of (item_id, x, y, z)
+        rows = list(rows)
+        stack = [(0, len(rows), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo <= 1:
+                continue
+            axis = 1 + depth % 3
+            rows[lo:hi] = sorted(rows[lo:hi], key=lambda row: row[axis])
+            mid = (lo + hi) // 2
+            stack.append((lo, mid, depth + 1))
+            stack.append((mid + 1, hi, depth + 1))
+
+        self.ids = array('q', (row[0] for row in rows))
+        self.coords = (
+            array('d', (row[1] for row in rows)),
+            array('d', (row[2] for row in rows)),
+            array('d', (row[3] for row in rows)),
+        )
+
+    @classmethod
+    def from_coordinates(cls, points):
+        """Build a tree from (item_id, latitude, longitude) triples."""
+        return cls((item_id,) + _to_xyz(lat, lon) for item_id, lat, lon in points)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def points(self):
+        """Yield (item_id, x, y, z) for every stored point."""
+        xs, ys, zs = self.coords
+        for i, item_id in enumerate(self.ids):
+            yield item_id, xs[i], ys[i], zs[i]
+
+    def within(self, query, max_chord):
+        """Yield (chord, item_id) for every point within max_chord of query."""
+        xs, ys, zs = self.coords
+        qx, qy, qz = query
+        limit = max_chord * max_chord
+        stack = [(0, len(self.ids), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            dx = qx - xs[mid]
+            dy = qy - ys[mid]
+            dz = qz - zs[mid]
+            dist2 = dx * dx + dy * dy + dz * dz
+            if dist2 <= limit:
+                yield math.sqrt(dist2), self.ids[mid]
+            diff = (dx, dy, dz)[depth % 3]
+            if diff <= 0 or diff * diff <= limit:
+                stack.append((lo, mid, depth + 1))
+            if diff >= 0 or diff * diff <= limit:
+                stack.append((mid + 1, hi, depth + 1))
+
+    def nearest(self, query, k, max_chord, after=None):
+        """
+        Return up to k (chord, item_id) pairs closest to query, nearest
+        first. after, a (distance_km, item_id) key, leaves out every point
+        up to and including it.
+        """
+        xs, ys, zs = self.coords
+        qx, qy, qz = query
+        heap = []  # max-heap of (-dist2, -item_id)
+        limit = max_chord * max_chord
+        floor, ceiling = _key_band(after)
+        stack = [(0, len(self.ids), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            dx = qx - xs[mid]
+            dy = qy - ys[mid]
+            dz = qz - zs[mid]
+            dist2 = dx * dx + dy * dy + dz * dz
+            item_id = self.ids[mid]
+            if floor <= dist2 <= limit and (
+                dist2 > ceiling or _distance_key(math.sqrt(dist2), item_id) > tuple(after)
+            ):
+                if len(heap) < k:
+                    heapq.heappush(heap, (-dist2, -item_id))
+                elif (dist2, item_id) < (-heap[0][0], -heap[0][1]):
+                    heapq.heapreplace(heap, (-dist2, -item_id))
+                if len(heap) == k:
+                    limit = -heap[0][0]
+            diff = (dx, dy, dz)[depth % 3]
+            near, far = ((lo, mid), (mid + 1, hi)) if diff <= 0 else ((mid + 1, hi), (lo, mid))
+            # Push the far side first so the near side is explored first
+            if diff * diff <= limit:
+                stack.append(far + (depth + 1,))
+            stack.append(near + (depth + 1,))
+        return sorted((math.sqrt(-neg), -item_id) for neg, item_id in heap)
+
+    def farthest(self, query, k, max_chord, before=None):
+        """
+        Return up to k (chord, item_id) pairs farthest from query within
+        max_chord, nearest first. before, a (distance_km, item_id) key,
+        leaves out every point from it on.
+        """
+        if before is None:
+            matches = self.within(query, max_chord)
+        else:
+            floor, ceiling = _key_band(before)
+            matches = (
+                (chord, item_id) for chord, item_id in self.within(query, min(max_chord, math.sqrt(ceiling)))
+                if chord * chord < floor or _distance_key(chord, item_id) < tuple(before)
+            )
+        return sorted(heapq.nlargest(k, matches))
+
+
+class SpatialIndex(ReloadableIndex):
+    """Thread-safe KD-tree plus an overlay of changes since the last build."""
+
+    label = 'Spatial index'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tree = None
+        self._overlay = {}  # item_id -> (x, y, z), or None when removed
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'ITEMS_SPATIAL_INDEX_TTL', 300)
+
+    def reset(self):
+        """Drop the index; it is reloaded from the database on next use."""
+        with self._lock:
+            self._tree = None
+            self._overlay = {}
+
+    def rebuild(self):
+        """Load every available, geolocated item from the database."""
+        self._reload(self._load, self._install)
+
+    def _load(self):
+        from .models import Item
+
+        points = Item.objects.filter(
+            is_available=True, latitude__isnull=False, longitude__isnull=False,
+        ).values_list('id', 'latitude', 'longitude').iterator(chunk_size=5000)
+        return KDTree.from_coordinates(points)
+
+    def _install(self, tree, pending):
+        self._tree = tree
+        self._overlay = {}
+        for method, args in pending:
+            method(*args)
+
+    def _ensure_loaded(self):
+        self._ensure_refresher()
+        if self._tree is None:
+            self.rebuild()
+
+    def upsert(self, item_id, latitude, longitude, is_available=True):
+        """Record the current position/availability of an item."""
+        if is_available and latitude is not None and longitude is not None:
+            self._patch(item_id, _to_xyz(latitude, longitude))
+        else:
+            self._patch(item_id, None)
+
+    def upsert_many(self, rows):
+        """Apply upsert() to (item_id, latitude, longitude, is_available) rows."""
+        with self._lock:
+            for item_id, latitude, longitude, is_available in rows:
+                self.upsert(item_id, latitude, longitude, is_available)
+
+    def discard(self, item_id):
+        self._patch(item_id, None)
+
+    def _patch(self, item_id, point):
+        with self._lock:
+            self._record(self._patch, item_id, point)
+            if self._tree is None:
+                # Nothing loaded yet; the next query reads fresh data anyway
+                return
+            self._overlay[item_id] = point
+            if len(self._overlay) > max(OVERLAY_REBUILD_MIN, OVERLAY_REBUILD_RATIO * len(self._tree)):
+                self._fold_overlay()
+
+    def _fold_overlay(self):
+        overlay = self._overlay
+        rows = [row for row in self._tree.points() if row[0] not in overlay]
+        rows.extend((item_id,) + point for item_id, point in overlay.items() if point is not None)
+        self._tree = KDTree(rows)
+        self._overlay = {}
+
+    def within(self, latitude, longitude, radius_km=None):
+        """Return [(distance_km, item_id)] inside radius_km, nearest first."""
+        query = _to_xyz(latitude, longitude)
+        max_chord = _km_to_chord(radius_km) if radius_km is not None else 2.0
+        with self._lock:
+            self._ensure_loaded()
+            overlay = self._overlay
+            matches = [m for m in self._tree.within(query, max_chord) if m[1] not in overlay]
+            matches.extend(self._overlay_matches(query, max_chord))
+        matches.sort()
+        return [(_chord_to_km(chord), item_id) for chord, item_id in matches]
+
+    def nearest(self, latitude, longitude, k, radius_km=None, after=None):
+        """
+        Return up to k [(distance_km, item_id)] pairs, nearest first,
+        starting after the (distance_km, item_id) key after if given.
+        """
+        query = _to_xyz(latitude, longitude)
+        max_chord = _km_to_chord(radius_km) if radius_km is not None else 2.0
+        with self._lock:
+            self._ensure_loaded()
+            matches = self._tree_matches(query, k, max_chord, after)
+            matches.extend(
+                m for m in self._overlay_matches(query, max_chord)
+                if after is None or _distance_key(*m) > tuple(after)
+            )
+        matches.sort()
+        return [_distance_key(chord, item_id) for chord, item_id in matches[:k]]
+
+    def preceding(self, latitude, longitude, k, radius_km=None, before=None):
+        """
+        Return the k [(distance_km, item_id)] pairs just before the key
+        before (the k farthest without one), nearest first.
+        """
+        query = _to_xyz(latitude, longitude)
+        max_chord = _km_to_chord(radius_km) if radius_km is not None else 2.0
+        with self._lock:
+            self._ensure_loaded()
+            matches = self._tree_matches(query, k, max_chord, before, forward=False)
+            matches.extend(
+                m for m in self._overlay_matches(query, max_chord)
+                if before is None or _distance_key(*m) < tuple(before)
+            )
+        matches.sort()
+        return [_distance_key(chord, item_id) for chord, item_id in matches[-k:]]
+
+    def around(self, latitude, longitude, radius_km=None):
+        """The items within radius_km of a point, for KeysetPaginator to page through."""
+        return Neighbours(self, latitude, longitude, radius_km)
+
+    def _tree_matches(self, query, k, max_chord, key, forward=True):
+        """
+        Up to k tree points not shadowed by the overlay, read k at a time
+        after key (KDTree.nearest) or, not forward, before it
+        (KDTree.farthest).
+        """
+        overlay = self._overlay
+        walk = self._tree.nearest if forward else self._tree.farthest
+        matches = []
+        while True:
+            candidates = walk(query, k, max_chord, key)
+            matches.extend(m for m in candidates if m[1] not in overlay)
+            if len(candidates) < k or len(matches) >= k:
+                return matches
+            # Some were shadowed: the next page starts past this one
+            key = _distance_key(*candidates[-1 if forward else 0])
+
+    def _overlay_matches(self, query, max_chord):
+        qx, qy, qz = query
+        for item_id, point in self._overlay.items():
+            if point is None:
+                continue
+            chord = math.sqrt((qx - point[0]) ** 2 + (qy - point[1]) ** 2 + (qz - point[2]) ** 2)
+            if chord <= max_chord:
+                yield chord, item_id
+
+
+class Neighbours:
+    """
+    (distance_km, item_id) keys around a point, nearest first, read from
+    a SpatialIndex a page at a time (see KeysetPaginator).
+    """
+
+    def __init__(self, index, latitude, longitude, radius_km=None):
+        self.index = index
+        self.point = (latitude, longitude)
+        self.radius_km = radius_km
+
+    def after(self, key, n):
+        return self.index.nearest(*self.point, n, self.radius_km, after=key)
+
+    def before(self, key, n):
+        return self.index.preceding(*self.point, n, self.radius_km, before=key)
+
+
+spatial_index = SpatialIndex()
@@ -1,10 +1,23 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Value
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from unittest import mock
 from django.contrib.auth.models import User
 from accounts.models import UserProfile
-from .models import Item
+from . import autocomplete
+from .autocomplete import CATEGORY, TITLE, autocomplete_index
+from .facets import facet_counts
+from .models import Item, SearchTerm
 from .forms import ItemForm
+from .geo import Haversine, bounding_box, geohash_cells, geohash_encode, haversine, radius_prefilter
+from .search import install_search_index, match_expression
+from .spatial import KDTree, SpatialIndex, spatial_index
+from .trigram import similar_terms, similarity, suggest
 from core.models import Category
+from core.pagination import LAST, KeysetPaginator
 
 
 class ItemViewTests(TestCase):
@@ -74,3 +87,516 @@ class ItemViewTests(TestCase):
         form2 = ItemForm(data=form_data)
         self.assertFalse(form2.is_valid())
         self.assertIn('price', form2.errors)
+
+    def test_item_list_sorts_by_price(self):
+        for price in (50, 300, 10):
+            Item.objects.create(owner=self.owner, title=f'Priced {price}', description='Desc',
+                                item_type='Sell', price=price)
+        response = self.client.get(reverse('item_list'), {'sort': 'price_desc'})
+        self.assertEqual([item.price for item in response.context['items']], [300, 100, 50, 10])
+        response = self.client.get(reverse('item_list'), {'sort': 'price_asc', 'item_type': 'Sell'})
+        self.assertEqual([item.price for item in response.context['items']], [10, 50, 300])
+
+
+
+class ItemFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='facets', password='pass123')
+        self.tools = Category.objects.create(name='Tools')
+        self.bikes = Category.objects.create(name='Bikes')
+        self.empty = Category.objects.create(name='Empty')
+        for title, category, item_type in [
+            ('Cordless drill', self.tools, 'Share'),
+            ('Hammer drill', self.tools, 'Rent'),
+            ('Saw', self.tools, 'Rent'),
+            ('Mountain bike', self.bikes, 'Rent'),
+            ('Drill bits', None, 'Sell'),
+        ]:
+            Item.objects.create(owner=self.owner, title=title, description='Desc', category=category,
+                                item_type=item_type, price=None if item_type == 'Share' else 5)
+        Item.objects.create(owner=self.owner, title='Old drill', description='Desc', category=self.tools,
+                            is_available=False)
+
+    def facets(self, **params):
+        facets = self.client.get(reverse('item_list'), params).context['facets']
+        categories = {category.name: category.item_count for category in facets['categories']
+                      if category in (self.tools, self.bikes, self.empty)}
+        types = {value: count for value, _, count in facets['item_types']}
+        return facets['category_total'], categories, facets['item_type_total'], types
+
+    def test_counts_for_all_available_items(self):
+        self.assertEqual(self.facets(), (
+            5, {'Tools': 3, 'Bikes': 1, 'Empty': 0}, 5, {'Share': 1, 'Sell': 1, 'Rent': 3},
+        ))
+
+    def test_each_dropdown_counts_under_the_other_filter(self):
+        self.assertEqual(self.facets(category=str(self.tools.id), item_type='Rent'), (
+            3, {'Tools': 2, 'Bikes': 1, 'Empty': 0}, 3, {'Share': 1, 'Sell': 0, 'Rent': 2},
+        ))
+
+    def test_counts_follow_the_search(self):
+        self.assertEqual(self.facets(search='drill'), (
+            3, {'Tools': 2, 'Bikes': 0, 'Empty': 0}, 3, {'Share': 1, 'Sell': 1, 'Rent': 1},
+        ))
+
+    def test_empty_categories_are_not_offered(self):
+        response = self.client.get(reverse('item_list'))
+        self.assertContains(response, 'Tools (3)')
+        self.assertNotContains(response, 'Empty (0)')
+
+    def test_one_grouped_query_cached_per_filter_set(self):
+        items = Item.objects.filter(is_available=True)
+        with self.assertNumQueries(1):
+            counts = facet_counts(items)
+        self.assertEqual(counts[(self.tools.id, 'Rent')], 2)
+        Item.objects.create(owner=self.owner, title='Wrench', description='Desc', category=self.tools, item_type='Rent', price=1)
+        with self.assertNumQueries(0):
+            self.assertEqual(facet_counts(items.order_by('price'))[(self.tools.id, 'Rent')], 2)
+        self.assertEqual(facet_counts(items.filter(title__startswith='W')), {(self.tools.id, 'Rent'): 1})
+
+
+class NearestSearchTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='geo', password='pass123')
+        spatial_index.reset()
+        self.addCleanup(spatial_index.reset)
+
+    def make_item(self, title, lat, lon):
+        return Item.objects.create(
+            owner=self.owner, title=title, description='desc',
+            item_type='Share', latitude=lat, longitude=lon,
+        )
+
+    def test_geohash_kept_in_sync_on_save(self):
+        item = self.make_item('Drill', 23.0225, 72.5714)
+        self.assertEqual(item.geohash, geohash_encode(23.0225, 72.5714))
+        item.latitude = None
+        item.save()
+        self.assertEqual(item.geohash, '')
+
+    def test_profile_location_change_updates_item_geohash(self):
+        profile = UserProfile.objects.create(user=self.owner, phone='1234567890', latitude=23.0225, longitude=72.5714)
+        item = self.make_item('Drill', 10.0, 10.0)
+        profile.location = 'Elsewhere'
+        profile.save()
+        item.refresh_from_db()
+        self.assertEqual(item.geohash, geohash_encode(23.0225, 72.5714))
+
+    def test_radius_search_uses_exact_distance(self):
+        near = self.make_item('Near', 23.03, 72.58)
+        edge = self.make_item('Edge', 23.0225, 72.66)  # ~9 km east
+        self.make_item('Far', 23.5, 73.5)
+        response = self.client.get(reverse('item_list'), {'lat': 23.0225, 'lon': 72.5714, 'radius': 10})
+        titles = [item.title for item in response.context['items']]
+        self.assertEqual(titles, [near.title, edge.title])
+
+    def test_prefilter_never_drops_items_inside_radius(self):
+        center = (51.5, -0.12)
+        for i in range(40):
+            lat = center[0] + (i - 20) * 0.004
+            lon = center[1] + (i % 7 - 3) * 0.01
+            self.make_item(f'Item {i}', lat, lon)
+        for radius in (0.5, 2, 5, 25):
+            expected = {
+                item.id for item in Item.objects.all()
+                if haversine(center[0], center[1], item.latitude, item.longitude) <= radius
+            }
+            found = set(Item.objects.filter(radius_prefilter(center[0], center[1], radius)).values_list('id', flat=True))
+            self.assertTrue(expected <= found, radius)
+
+    def test_bounding_box_splits_at_antimeridian(self):
+        min_lat, max_lat, lon_ranges = bounding_box(0.0, 179.99, 10)
+        self.assertEqual(len(lon_ranges), 2)
+        self.assertEqual(lon_ranges[0][1], 180.0)
+        self.assertEqual(lon_ranges[1][0], -180.0)
+
+    def test_out_of_range_input_never_builds_a_huge_covering(self):
+        min_lat, max_lat, lon_ranges = bounding_box(1000.0, 10.0, 50)
+        self.assertTrue(min_lat < max_lat == 90.0)
+        self.assertEqual(lon_ranges, [(-180.0, 180.0)])
+        self.assertEqual(geohash_cells(10.0, 5.0, [(0.0, 1.0)]), set())
+        self.assertEqual(geohash_cells(float('nan'), 5.0, [(0.0, 1.0)]), set())
+
+    def test_invalid_coordinates_are_ignored(self):
+        self.make_item('Drill', 23.03, 72.58)
+        for params in (
+            {'lat': 95, 'lon': 10}, {'lat': 1000, 'lon': 10}, {'lat': 10, 'lon': 181},
+            {'lat': 'nan', 'lon': 10}, {'lat': 'inf', 'lon': 10},
+        ):
+            response = self.client.get(reverse('item_list'), params)
+            self.assertEqual(response.status_code, 200, params)
+            self.assertFalse(response.context['nearest_search'], params)
+
+    def test_invalid_radius_means_no_radius(self):
+        self.make_item('Far', 30.0, 80.0)
+        for radius in ('nan', 'inf', '-5'):
+            response = self.client.get(reverse('item_list'), {'lat': 23.0225, 'lon': 72.5714, 'radius': radius})
+            self.assertEqual(response.status_code, 200, radius)
+            self.assertEqual([item.title for item in response.context['items']], ['Far'], radius)
+
+    def test_radius_search_combines_with_filters(self):
+        self.make_item('Near drill', 23.03, 72.58)
+        self.make_item('Near chair', 23.03, 72.59)
+        response = self.client.get(reverse('item_list'), {'lat': 23.0225, 'lon': 72.5714, 'radius': 10, 'search': 'drill'})
+        self.assertEqual([item.title for item in response.context['items']], ['Near drill'])
+
+    def test_spatial_index_follows_item_signals(self):
+        item = self.make_item('Drill', 23.03, 72.58)
+        self.assertEqual([i for _, i in spatial_index.within(23.0225, 72.5714, 5)], [item.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            moved = self.make_item('Chair', 23.025, 72.575)
+            item.is_available = False
+            item.save()
+        self.assertEqual([i for _, i in spatial_index.within(23.0225, 72.5714, 5)], [moved.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.delete()
+        self.assertEqual(spatial_index.within(23.0225, 72.5714, 5), [])
+
+    def test_spatial_index_follows_profile_location_change(self):
+        profile = UserProfile.objects.create(user=self.owner, phone='1234567890', latitude=23.0225, longitude=72.5714)
+        item = self.make_item('Drill', 10.0, 10.0)
+        spatial_index.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.location = 'Elsewhere'
+            profile.save()
+        self.assertEqual([i for _, i in spatial_index.nearest(23.0225, 72.5714, 1, 1)], [item.id])
+
+    def test_nearest_search_paginates_ids(self):
+        for i in range(15):
+            self.make_item(f'Item {i}', 23.0 + i * 0.001, 72.5)
+        params = {'lat': 23.0, 'lon': 72.5, 'radius': 10}
+        first = self.client.get(reverse('item_list'), params).context['items']
+        self.assertEqual([item.title for item in first], [f'Item {i}' for i in range(12)])
+        response = self.client.get(reverse('item_list'), {**params, 'cursor': first.next_cursor()})
+        page = response.context['items']
+        self.assertEqual([item.title for item in page], [f'Item {i}' for i in range(12, 15)])
+        self.assertTrue(all(hasattr(item, 'distance_km') for item in page))
+        self.assertFalse(page.has_next())
+        self.assertContains(response, 'lat=23.0')
+
+    def test_index_pages_follow_the_cursor_both_ways(self):
+        # Items sharing a position are ordered by id, across page boundaries
+        for i in range(11):
+            self.make_item(f'Item {i}', 23.0 + (i // 3) * 0.001, 72.5)
+        spatial_index.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_item('New', 23.001, 72.5)
+            self.make_item('Outside', 24.0, 72.5)
+        expected = spatial_index.within(23.0, 72.5, 10)
+        self.assertEqual(len(expected), 12)
+        paginator = KeysetPaginator(spatial_index.around(23.0, 72.5, 10), ('distance_km', 'id'), 5)
+
+        pages, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            pages.append(list(page))
+            cursor = page.next_cursor()
+            if cursor is None:
+                break
+        self.assertEqual(pages, [expected[0:5], expected[5:10], expected[10:]])
+        self.assertEqual(list(paginator.page(page.previous_cursor())), expected[5:10])
+        last = paginator.page(LAST)
+        self.assertEqual(list(last), expected[7:])
+        self.assertEqual(list(paginator.page(last.previous_cursor())), expected[2:7])
+
+    @override_settings(ITEMS_SPATIAL_INDEX_TTL=0.001)
+    def test_queries_never_reload_the_index(self):
+        item = self.make_item('Drill', 23.03, 72.58)
+        spatial_index.rebuild()
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.assertEqual(spatial_index.nearest(23.0225, 72.5714, 5, 10), spatial_index.within(23.0225, 72.5714, 10))
+        self.assertEqual([i for _, i in spatial_index.nearest(23.0225, 72.5714, 5, 10)], [item.id])
+
+    def test_pages_skip_shadowed_points_without_reading_the_overlay_size(self):
+        items = [self.make_item(f'Item {i}', 23.0 + i * 0.001, 72.5) for i in range(6)]
+        spatial_index.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            # The two nearest move away
+            for item in items[:2]:
+                item.latitude = 30.0
+                item.save()
+        spatial_index.upsert_many((-i, 40.0, 40.0, True) for i in range(1, 50))
+        ids = [item.id for item in items]
+        with mock.patch.object(KDTree, 'nearest', autospec=True, side_effect=KDTree.nearest) as nearest:
+            self.assertEqual([i for _, i in spatial_index.nearest(23.0, 72.5, 2, 10)], ids[2:4])
+        self.assertEqual([call.args[2] for call in nearest.call_args_list], [2, 2])
+        self.assertEqual([i for _, i in spatial_index.preceding(23.0, 72.5, 2, 10, before=(0.4, ids[4]))], ids[2:4])
+        self.assertEqual([i for _, i in spatial_index.preceding(23.0, 72.5, 2, 10, before=(0.3, ids[3]))], ids[2:3])
+
+    def test_changes_during_a_rebuild_are_kept(self):
+        kept = self.make_item('Drill', 23.03, 72.58)
+        moved = self.make_item('Chair', 23.031, 72.581)
+        load = spatial_index._load
+
+        def load_while_items_change():
+            tree = load()
+            # Committed after the scan read the rows
+            spatial_index.upsert(moved.id, 10.0, 10.0)
+            spatial_index.upsert(-1, 23.0225, 72.5714)
+            return tree
+
+        with mock.patch.object(spatial_index, '_load', load_while_items_change):
+            spatial_index.rebuild()
+        self.assertEqual(sorted(i for _, i in spatial_index.within(23.0225, 72.5714, 5)), [-1, kept.id])
+
+    def test_refresh_thread_starts_in_the_serving_process(self):
+        index = SpatialIndex()
+        index.warm()
+        with mock.patch('items.indexes.threading.Thread') as thread:
+            index.start_refresh()
+            thread.assert_not_called()
+            index.within(23.0, 72.5, 5)
+            index.within(23.0, 72.5, 5)
+            self.assertEqual(thread.call_count, 1)
+            # A forked worker inherits the flag but not the thread
+            with mock.patch('items.indexes.os.getpid', return_value=-1):
+                index.within(23.0, 72.5, 5)
+            self.assertEqual(thread.call_count, 2)
+
+    def test_nearest_queryset_computes_distance_in_sql(self):
+        near = self.make_item('Near', 23.03, 72.58)
+        edge = self.make_item('Edge', 23.0225, 72.66)
+        self.make_item('Far', 23.5, 73.5)
+        items = Item.objects.nearest(23.0225, 72.5714, 10)
+        self.assertEqual([item.id for item in items], [near.id, edge.id])
+        self.assertAlmostEqual(items[1].distance_km, haversine(23.0225, 72.5714, 23.0225, 72.66), places=6)
+        # Without a radius every geolocated item is returned, nearest first
+        self.assertEqual(Item.objects.nearest(23.0225, 72.5714).count(), 3)
+
+    def test_haversine_expression_matches_python_formula(self):
+        class PortableHaversine(Haversine):
+            # Force the trigonometric spelling used on non-SQLite backends
+            as_sqlite = Haversine.as_sql
+
+        item = self.make_item('Drill', 23.03, 72.58)
+        expected = haversine(23.03, 72.58, 19.076, 72.8777)
+        for expression in (Haversine, PortableHaversine):
+            annotated = Item.objects.annotate(
+                distance=expression('latitude', 'longitude', Value(19.076), Value(72.8777)),
+            ).get(pk=item.pk)
+            self.assertAlmostEqual(annotated.distance, expected, places=6)
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='fts', password='pass123')
+        self.tools = Category.objects.create(name='Power Tools')
+        self.drill = self.make_item('Cordless drill', 'Bosch 18V with two batteries', category=self.tools)
+        self.saw = self.make_item('Circular saw', 'Cuts wood, ideal next to a drill', category=self.tools)
+        self.bike = self.make_item('Mountain bike', 'Front suspension', item_type='Rent', price=50)
+
+    def make_item(self, title, description, **kwargs):
+        return Item.objects.create(owner=self.owner, title=title, description=description, **kwargs)
+
+    def search(self, text):
+        return list(Item.objects.search(text))
+
+    def test_title_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search('drill'), [self.drill, self.saw])
+
+    def test_words_match_as_prefixes_in_any_order(self):
+        self.assertEqual(self.search('batt bosch'), [self.drill])
+        self.assertEqual(self.search('power'), [self.drill, self.saw])
+
+    def test_user_input_is_never_fts_syntax(self):
+        self.assertEqual(match_expression('drill" OR *'), '"drill"* "or"*')
+        self.assertEqual(self.search('drill" OR *'), [])
+        self.assertEqual(self.search('!!!'), [])
+
+    def test_index_follows_updates_deletes_and_category_renames(self):
+        Item.objects.filter(pk=self.bike.pk).update(title='Road bicycle')
+        self.assertEqual(self.search('bicycle'), [self.bike])
+        self.assertEqual(self.search('mountain'), [])
+
+        self.tools.name = 'Workshop'
+        self.tools.save()
+        self.assertEqual(len(self.search('workshop')), 2)
+
+        self.saw.delete()
+        self.assertEqual(self.search('drill'), [self.drill])
+
+    def test_search_combines_with_filters_in_view(self):
+        response = self.client.get(reverse('item_list'), {'search': 'bike', 'item_type': 'Rent'})
+        self.assertEqual(list(response.context['items']), [self.bike])
+        response = self.client.get(reverse('item_list'), {'search': 'drill', 'category': self.tools.id})
+        self.assertEqual(list(response.context['items']), [self.drill, self.saw])
+        response = self.client.get(reverse('item_list'), {'search': 'bike', 'item_type': 'Sell'})
+        self.assertEqual(list(response.context['items']), [])
+
+    def test_missing_triggers_are_restored_with_a_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER items_item_fts_insert')
+        lamp = self.make_item('Desk lamp', 'LED')
+        self.assertEqual(self.search('lamp'), [])
+
+        self.assertTrue(install_search_index(connection))
+        self.assertEqual(self.search('lamp'), [lamp])
+        self.assertFalse(install_search_index(connection))
+
+
+class TypoTolerantSearchTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='typo', password='pass123')
+        self.tools = Category.objects.create(name='Garden Tools')
+        self.bicycle = self.make_item('Kids bicycle')
+        self.drills = self.make_item('Two drills', category=self.tools)
+
+    def make_item(self, title, **kwargs):
+        return Item.objects.create(owner=self.owner, title=title, description='desc', **kwargs)
+
+    def test_vocabulary_follows_titles_and_category_names(self):
+        self.assertEqual(SearchTerm.objects.get(word='drills').frequency, 1)
+        self.make_item('Drills for rent')
+        self.assertEqual(SearchTerm.objects.get(word='drills').frequency, 2)
+
+        self.bicycle.title = 'Kids scooter'
+        self.bicycle.save()
+        self.assertFalse(SearchTerm.objects.filter(word='bicycle').exists())
+        self.assertTrue(SearchTerm.objects.filter(word='scooter').exists())
+
+        self.tools.name = 'Workshop'
+        self.tools.save()
+        self.assertFalse(SearchTerm.objects.filter(word='garden').exists())
+
+        self.drills.delete()
+        self.assertEqual(SearchTerm.objects.get(word='drills').frequency, 1)
+
+    def test_loaded_items_are_diffed_without_reading_the_title(self):
+        bicycle = Item.objects.get(pk=self.bicycle.pk)
+        bicycle.title = 'Kids scooter'
+        with CaptureQueriesContext(connection) as queries:
+            bicycle.save()
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT "items_item"."title" AS')])
+        self.assertFalse(SearchTerm.objects.filter(word='bicycle').exists())
+
+    def test_partial_saves_leave_vocabulary_alone(self):
+        self.bicycle.is_available = False
+        self.bicycle.save(update_fields=['is_available'])
+        self.assertEqual(SearchTerm.objects.get(word='bicycle').frequency, 1)
+
+    def test_similar_terms_are_ranked_by_similarity(self):
+        matches = similar_terms('bycicle')
+        self.assertEqual(matches[0][0], 'bicycle')
+        self.assertAlmostEqual(matches[0][1], similarity('bycicle', 'bicycle'))
+        self.assertEqual(similar_terms('zzzz'), [])
+        self.assertEqual(matches[0][2], 1)
+
+    def test_suggest_only_corrects_unknown_words(self):
+        self.assertEqual(suggest('kids bycicle'), 'kids bicycle')
+        self.assertEqual(suggest('gardn drils'), 'garden drills')
+        self.assertIsNone(suggest('bicycle'))
+
+    def test_list_falls_back_to_the_suggestion(self):
+        response = self.client.get(reverse('item_list'), {'search': 'bycicle'})
+        self.assertEqual(response.context['suggestion'], 'bicycle')
+        self.assertTrue(response.context['showing_suggestion'])
+        self.assertEqual(list(response.context['items']), [self.bicycle])
+        self.assertContains(response, 'Showing results for')
+
+    def test_list_offers_did_you_mean_for_few_hits(self):
+        self.make_item('Two drills')
+        self.make_item('Drils sold here')
+        response = self.client.get(reverse('item_list'), {'search': 'drils'})
+        self.assertFalse(response.context['showing_suggestion'])
+        self.assertEqual(response.context['suggestion'], 'drills')
+        self.assertContains(response, 'Did you mean')
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        autocomplete_index.reset()
+        self.addCleanup(autocomplete_index.reset)
+        self.owner = User.objects.create_user(username='typist', password='pass123')
+        self.tools = Category.objects.create(name='Power Tools')
+        for title in ['Cordless drill', 'Cordless drill', 'Drill press', 'Garden hose', 'cordless DRILL']:
+            self.make_item(title, category=self.tools)
+        self.make_item('Drill bits', is_available=False)
+
+    def make_item(self, title, **kwargs):
+        return Item.objects.create(owner=self.owner, title=title, description='Desc', **kwargs)
+
+    def labels(self, text, limit=8):
+        return [label for _, label, _ in autocomplete_index.suggest(text, limit)]
+
+    def test_word_prefixes_ranked_by_listed_items(self):
+        self.assertEqual(self.labels('dri'), ['Cordless drill', 'Drill press'])
+        self.assertEqual(self.labels('PRESS'), ['Drill press'])
+        self.assertEqual(self.labels('to'), ['Power Tools'])
+        self.assertEqual(self.labels('po'), ['Power Tools'])
+        self.assertEqual(self.labels('cordless d'), ['Cordless drill'])
+        self.assertEqual(self.labels('ordless'), [])
+        self.assertEqual(self.labels(''), [])
+        self.assertEqual(autocomplete_index.suggest('g'), [(TITLE, 'Garden hose', 'Garden hose')])
+
+    def test_long_matches_are_taken_in_popularity_order(self):
+        self.assertEqual(self.labels('d', 1), ['Cordless drill'])
+        with mock.patch.object(autocomplete, 'SCAN_LIMIT', 1):
+            self.assertEqual(self.labels('d', 1), ['Cordless drill'])
+            self.assertEqual(self.labels('d'), ['Cordless drill', 'Drill press'])
+
+    def test_item_changes_update_the_loaded_index(self):
+        autocomplete_index.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_item('Drum kit')
+            press = Item.objects.get(title='Drill press')
+            press.title = 'Dremel'
+            press.save()
+            hose = Item.objects.get(title='Garden hose')
+            hose.is_available = False
+            hose.save()
+            Item.objects.filter(title='Cordless drill').first().delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels('dr'), ['Cordless drill', 'Dremel', 'Drum kit'])
+            self.assertEqual(self.labels('garden'), [])
+            self.assertEqual(autocomplete_index.suggest('power'), [(CATEGORY, 'Power Tools', self.tools.id)])
+        # Every drill gone: the category follows its items
+        with self.captureOnCommitCallbacks(execute=True):
+            for item in Item.objects.filter(category=self.tools):
+                item.delete()
+        self.assertEqual(self.labels('po'), [])
+
+    def test_changes_during_a_rebuild_are_kept(self):
+        load = autocomplete_index._load
+
+        def load_while_items_change():
+            loaded = load()
+            # Committed after the scan read the rows
+            autocomplete_index.move(None, ('Drum kit', self.tools.id, True))
+            autocomplete_index.move(('Garden hose', None, True), None)
+            return loaded
+
+        with mock.patch.object(autocomplete_index, '_load', load_while_items_change):
+            autocomplete_index.rebuild()
+        self.assertEqual(self.labels('dru'), ['Drum kit'])
+        self.assertEqual(self.labels('garden'), [])
+
+    @override_settings(ITEMS_AUTOCOMPLETE_INDEX_TTL=1)
+    def test_keystrokes_never_reload_the_index(self):
+        autocomplete_index.rebuild()
+        self.addCleanup(setattr, autocomplete_index, '_refresh', False)
+        autocomplete_index.start_refresh()
+        with mock.patch('items.indexes.threading.Thread') as thread, mock.patch('time.monotonic', return_value=1e12):
+            with self.assertNumQueries(0):
+                self.assertEqual(self.labels('dri'), ['Cordless drill', 'Drill press'])
+        # The reload is left to the background thread
+        self.assertEqual(thread.call_count, 1)
+
+    def test_category_renames(self):
+        autocomplete_index.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tools.name = 'Workshop'
+            self.tools.save()
+        self.assertEqual(self.labels('wor'), ['Workshop'])
+        self.assertEqual(self.labels('power'), [])
+
+    def test_endpoint(self):
+        response = self.client.get(reverse('item_autocomplete'), {'q': 'po'})
+        self.assertEqual(response.json(), {'query': 'po', 'results': [
+            {'label': 'Power Tools', 'type': 'category', 'url': f'/items/?category={self.tools.id}'},
+        ]})
+        results = self.client.get(reverse('item_autocomplete'), {'q': 'c', 'limit': 'x'}).json()['results']
+        self.assertEqual(results[0], {'label': 'Cordless drill', 'type': 'item', 'url': '/items/?search=Cordless+drill'})
+        with self.assertNumQueries(0):
+            self.client.get(reverse('item_autocomplete'), {'q': 'dri'})
@@ -0,0 +1,148 @@
+"""
+Typo-tolerant search: trigram similarity over the words used in item
+titles and category names.
+
+Every distinct word is a SearchTerm with one SearchTrigram row per
+trigram, maintained incrementally from Item and Category signals. A
+misspelled word is compared with the vocabulary by counting shared
+trigrams in SQL (an indexed lookup per trigram), so the cost depends on
+the vocabulary's trigram postings rather than on the number of items.
+"""
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Count, ExpressionWrapper, F, FloatField
+
+# Minimum trigram similarity for a word to count as a match; lower than
+# pg_trgm's 0.3 because short words lose many trigrams to one typo
+# ("bycicle" / "bicycle" share 0.23)
+SIMILARITY_THRESHOLD = 0.2
+
+# Exact searches returning fewer hits than this get a "did you mean"
+SUGGESTION_THRESHOLD = 3
+
+MAX_WORD_LENGTH = 100
+
+
+def words(text):
+    """The distinct searchable words of text, case-folded."""
+    return {word for word in re.findall(r'\w+', (text or '').casefold()) if 1 < len(word) <= MAX_WORD_LENGTH}
+
+
+def trigrams(word):
+    """Trigrams of a word padded like pg_trgm: two spaces before, one after."""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    """Jaccard similarity of the trigram sets of two words."""
+    ta, tb = trigrams(a), trigrams(b)
+    return len(ta & tb) / len(ta | tb)
+
+
+def add_words(counts):
+    """Add a Counter of {word: documents} to the vocabulary."""
+    from .models import SearchTerm, SearchTrigram
+
+    if not counts:
+        return
+    known = set(SearchTerm.objects.filter(word__in=counts).values_list('word', flat=True))
+    new = [word for word in counts if word not in known]
+    if new:
+        SearchTerm.objects.bulk_create(
+            [SearchTerm(word=word, trigram_count=len(trigrams(word))) for word in new],
+            ignore_conflicts=True,
+        )
+        SearchTrigram.objects.bulk_create(
+            [
+                SearchTrigram(trigram=trigram, term_id=term_id)
+                for term_id, word in SearchTerm.objects.filter(word__in=new).values_list('id', 'word')
+                for trigram in trigrams(word)
+            ],
+            ignore_conflicts=True,
+        )
+    _add_frequency(counts, 1)
+
+
+def remove_words(counts):
+    """Remove a Counter of {word: documents}; unused words are dropped."""
+    from .models import SearchTerm
+
+    if not counts:
+        return
+    _add_frequency(counts, -1)
+    SearchTerm.objects.filter(word__in=counts, frequency__lte=0).delete()
+
+
+def _add_frequency(counts, sign):
+    from .models import SearchTerm
+
+    by_amount = {}
+    for word, amount in counts.items():
+        by_amount.setdefault(amount, []).append(word)
+    for amount, group in by_amount.items():
+        SearchTerm.objects.filter(word__in=group).update(frequency=F('frequency') + sign * amount)
+
+
+def reindex_text(old, new):
+    """Move one document's words in the vocabulary from old text to new."""
+    old_words, new_words = words(old), words(new)
+    remove_words(Counter(old_words - new_words))
+    add_words(Counter(new_words - old_words))
+
+
+def similar_terms(word, limit=5, threshold=None):
+    """
+    Vocabulary words most similar to word, best first, as
+    [(word, similarity, frequency)].
+
+    Candidates share at least one trigram; a length bound derived from the
+    threshold discards words too short or too long to qualify before the
+    similarity is computed.
+    """
+    from .models import SearchTerm
+
+    if threshold is None:
+        threshold = getattr(settings, 'ITEMS_SIMILARITY_THRESHOLD', SIMILARITY_THRESHOLD)
+    query = trigrams(word)
+    size = len(query)
+    # Filtering on the relation before annotating makes Count() see only
+    # the matching trigram rows, found through the trigram index
+    candidates = SearchTerm.objects.filter(
+        trigrams__trigram__in=query,
+        trigram_count__gte=size * threshold,
+        trigram_count__lte=size / threshold,
+    ).annotate(
+        shared=Count('trigrams'),
+    ).annotate(
+        similarity=ExpressionWrapper(
+            F('shared') * 1.0 / (size + F('trigram_count') - F('shared')),
+            output_field=FloatField(),
+        ),
+    ).filter(similarity__gte=threshold).order_by('-similarity', '-frequency', 'word')
+    return list(candidates.values_list('word', 'similarity', 'frequency')[:limit])
+
+
+def suggest(text):
+    """
+    Return text with each word replaced by the most similar vocabulary word
+    that is used more often than the word itself, or None when nothing
+    changes. Unknown words thus get their closest match, and rare
+    spellings (a typo in a single title) their common form.
+    """
+    from .models import SearchTerm
+
+    typed = re.findall(r'\w+', (text or '').casefold())
+    known = dict(SearchTerm.objects.filter(word__in=typed).values_list('word', 'frequency'))
+    corrected = []
+    for word in typed:
+        if len(word) > 1:
+            for candidate, _, frequency in similar_terms(word):
+                if candidate != word and frequency > known.get(word, 0):
+                    word = candidate
+                    break
+        corrected.append(word)
+    corrected = ' '.join(corrected)
+    return corrected if corrected != ' '.join(typed) else None
@@ -3,6 +3,7 @@ from . import views
 
 urlpatterns = [
     path('', views.item_list, name='item_list'),
+    path('autocomplete/', views.autocomplete, name='item_autocomplete'),
     path('add/', views.add_item, name='add_item'),
     path('my/', views.my_items, name='my_items'),
     path('<int:item_id>/', views.item_detail, name='item_detail'),
@@ -1,24 +1,30 @@
+import math
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.db.models import Q
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.views.decorators.http import require_GET
 from .models import Item
 from .forms import ItemForm
 from core.models import Category
-import math
-
-
-def haversine(lat1, lon1, lat2, lon2):
-    """Return distance in kilometers between two lat/lon points."""
-    R = 6371  # Earth radius in km
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+from core.pagination import EstimatedCountPaginator, KeysetPaginator, page_links
+from .autocomplete import CATEGORY, DEFAULT_LIMIT, MAX_LIMIT, autocomplete_index
+from .facets import item_facets
+from .spatial import spatial_index
+from .trigram import SUGGESTION_THRESHOLD, suggest
 
+# item_list sort orders (?sort=), each ending in the unique id for keyset
+# pagination and served by an index on the same columns
+SORTS = {
+    'newest': ('-created_at', '-id'),
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+    'nearest': ('distance_km', 'id'),
+}
 
 def item_list(request):
     """
@@ -27,14 +33,6 @@ def item_list(request):
     items = Item.objects.filter(is_available=True)
     categories = Category.objects.all()
     
-    # Search functionality
-    search_query = request.GET.get('search', '')
-    if search_query:
-        items = items.filter(
-            Q(title__icontains=search_query) | 
-            Q(description__icontains=search_query)
-        )
-    
     # Filter by category
     category_filter = request.GET.get('category')
     if category_filter:
@@ -45,6 +43,22 @@ def item_list(request):
     if item_type_filter:
         items = items.filter(item_type=item_type_filter)
 
+    # Search functionality (full-text, ranked by relevance)
+    search_query = request.GET.get('search', '')
+    suggestion = None
+    showing_suggestion = False
+    if search_query:
+        filtered = items
+        items = filtered.search(search_query)
+        threshold = getattr(settings, 'ITEMS_SUGGESTION_THRESHOLD', SUGGESTION_THRESHOLD)
+        # Only counts up to the threshold, however many items match
+        if items[:threshold].count() < threshold:
+            suggestion = suggest(search_query)
+            if suggestion and not items.exists():
+                # Nothing matched as typed: show results for the correction
+                items = filtered.search(suggestion)
+                showing_suggestion = True
+
     # Location-based nearest search
     user_lat = request.GET.get('lat')
     user_lon = request.GET.get('lon')
@@ -54,6 +68,9 @@ def item_list(request):
         try:
             user_lat = float(user_lat)
             user_lon = float(user_lon)
+            if not (-90 <= user_lat <= 90 and -180 <= user_lon <= 180):
+                # Also rejects nan, which fails every comparison
+                raise ValueError('coordinates out of range')
             nearest_search = True
             # Default radius to 50km if not specified
             if not radius_km:
@@ -61,43 +78,102 @@ def item_list(request):
         except ValueError:
             user_lat = user_lon = None
 
-    if nearest_search:
-        items = items.filter(latitude__isnull=False, longitude__isnull=False)
-        item_list = []
-        for item in items:
-            item.distance_km = haversine(user_lat, user_lon, item.latitude, item.longitude)
-            item_list.append(item)
+    # Sort order: relevance for searches and distance for nearest search
+    # unless another one is picked
+    sort = request.GET.get('sort', '')
+    if sort not in SORTS or (sort == 'nearest' and not nearest_search):
+        sort = ''
+    order = sort or ('nearest' if nearest_search else '' if search_query else 'newest')
 
+    index_matches = None
+    if nearest_search:
+        max_distance = None
         if radius_km:
             try:
-                radius_km = float(radius_km)
-                item_list = [item for item in item_list if item.distance_km <= radius_km]
+                radius = float(radius_km)
+                if not (math.isfinite(radius) and radius >= 0):
+                    raise ValueError('radius out of range')
+                radius_km = max_distance = radius
             except ValueError:
                 pass
 
-        item_list.sort(key=lambda i: i.distance_km)
-        items = item_list
-    
-    # Pagination
-    paginator = Paginator(items, 12)
-    page = request.GET.get('page')
-    items = paginator.get_page(page)
+        if search_query or category_filter or item_type_filter or order != 'nearest':
+            # Other predicates or another order need the database anyway:
+            # compute distance in SQL
+            items = items.nearest(user_lat, user_lon, max_distance)
+        else:
+            # (distance_km, id) pairs from the spatial index, read a page at
+            # a time from the cursor on
+            index_matches = spatial_index.around(user_lat, user_lon, max_distance)
+
+    # Filter counts: the same search and location without the category
+    # and type filters, grouped in one query
+    facet_items = Item.objects.filter(is_available=True)
+    if search_query:
+        facet_items = facet_items.search(suggestion if showing_suggestion else search_query)
+    if nearest_search:
+        facet_items = facet_items.nearest(user_lat, user_lon, max_distance)
+    facets = item_facets(facet_items, categories, category_filter, item_type_filter)
+
+    # Pagination: cursors over the sort key, page numbers for relevance
+    if order:
+        paginator = KeysetPaginator(items if index_matches is None else index_matches, SORTS[order], 12)
+        page_items = paginator.page(request.GET.get('cursor'))
+    else:
+        paginator = EstimatedCountPaginator(items, 12)
+        page_items = paginator.get_page(request.GET.get('page'))
+
+    if index_matches is not None:
+        # Hydrate only the items shown on this page
+        by_id = items.in_bulk([item_id for _, item_id in page_items.object_list])
+        hydrated = []
+        for distance, item_id in page_items.object_list:
+            item = by_id.get(item_id)
+            if item is not None:
+                item.distance_km = distance
+                hydrated.append(item)
+        page_items.object_list = hydrated
+    items = page_items
     
     context = {
         'items': items,
-        'categories': categories,
+        'categories': facets['categories'],
+        'facets': facets,
         'search_query': search_query,
+        'suggestion': suggestion,
+        'showing_suggestion': showing_suggestion,
         'category_filter': category_filter,
         'item_type_filter': item_type_filter,
         'user_lat': user_lat,
         'user_lon': user_lon,
         'radius_km': radius_km,
         'nearest_search': nearest_search,
+        'sort': sort,
+        'page_links': page_links(request, items),
     }
     return render(request, 'items/item_list.html', context)
 
 
 
+@require_GET
+def autocomplete(request):
+    """
+    Search-as-you-type suggestions for ?q=: item titles and category names
+    with a word starting with it, most listed first, as JSON.
+    """
+    query = request.GET.get('q', '')
+    try:
+        limit = min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    list_url = reverse('item_list')
+    results = []
+    for kind, label, value in autocomplete_index.suggest(query, limit):
+        params = {'category': value} if kind == CATEGORY else {'search': value}
+        results.append({'label': label, 'type': kind, 'url': f'{list_url}?{urlencode(params)}'})
+    return JsonResponse({'query': query, 'results': results})
+
+
 @login_required
 def add_item(request):
     """
@@ -138,7 +214,8 @@ def my_items(request):
     """
     Display items owned by the current user.
     """
-    items = Item.objects.filter(owner=request.user).order_by('-created_at')
+    # request_stats carries the pending request count shown on each card
+    items = Item.objects.filter(owner=request.user).select_related('request_stats')
     
     # Filter by status
     status_filter = request.GET.get('status')
@@ -148,13 +225,12 @@ def my_items(request):
         items = items.filter(is_available=False)
     
     # Pagination
-    paginator = Paginator(items, 10)
-    page = request.GET.get('page')
-    items = paginator.get_page(page)
+    items = KeysetPaginator(items, ('-created_at', '-id'), 10).page(request.GET.get('cursor'))
     
     context = {
         'items': items,
         'status_filter': status_filter,
+        'page_links': page_links(request, items),
     }
     return render(request, 'items/my_items.html', context)
 
@@ -0,0 +1,52 @@
+"""
+Template context for the pending-requests badge shown in the navigation.
+
+pending_count is lazy: pages that never render the badge cost nothing,
+and within one request the value is looked up at most once. Lookups go
+through a short-TTL per-user cache in front of the denormalized
+UserRequestStats row; request_app.counters drops the entry when requests
+on the user's items change.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject, new_method_proxy
+
+# Seconds a cached badge count may be served; bounds staleness across
+# processes that do not share the cache
+PENDING_COUNT_TTL = 60
+
+
+def pending_count_key(user_id):
+    return f'request_app:pending_count:{user_id}'
+
+
+def pending_count_for(user):
+    """Pending requests on the user's items, through the cache."""
+    key = pending_count_key(user.pk)
+    count = cache.get(key)
+    if count is None:
+        from .models import UserRequestStats
+
+        count = UserRequestStats.objects.filter(pk=user.pk).values_list('pending_received', flat=True).first() or 0
+        cache.set(key, count, getattr(settings, 'PENDING_COUNT_CACHE_TTL', PENDING_COUNT_TTL))
+    return count
+
+
+class LazyCount(SimpleLazyObject):
+    """A lazily computed int that also works with int()/float() (e.g. |pluralize)."""
+    __int__ = new_method_proxy(int)
+    __float__ = new_method_proxy(float)
+    __index__ = new_method_proxy(int)
+
+
+def _request_pending_count(request):
+    # Memoized on the request: several templates may render per request
+    if not hasattr(request, '_pending_count'):
+        user = getattr(request, 'user', None)
+        request._pending_count = pending_count_for(user) if user is not None and user.is_authenticated else 0
+    return request._pending_count
+
+
+def pending_requests(request):
+    """Add pending_count (pending requests on the user's items) to every template."""
+    return {'pending_count': LazyCount(lambda: _request_pending_count(request))}
@@ -0,0 +1,171 @@
+"""
+Denormalized request counts for the profile and my_items dashboards.
+
+UserRequestStats keeps, per user, the pending/accepted requests received
+on their items and sent by them; ItemRequestStats keeps the pending
+requests per item. Every status transition (creation, status change,
+deletion) is turned into deltas applied with F() updates, from the
+ItemRequest signals for single saves and from ItemRequestQuerySet.
+set_status() and ItemRequest.accept() for bulk updates. reconcile() rebuilds both tables from
+ItemRequest and is run by the reconcile_request_counters command.
+Changes to pending_received drop the cached nav badge count (see
+request_app.context_processors) once they commit.
+"""
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+
+PENDING = 'Pending'
+ACCEPTED = 'Accepted'
+
+
+def transition_deltas(owner_id, requester_id, item_id, old_status, new_status):
+    """
+    Return ({user_id: {field: delta}}, {item_id: delta}) for one request
+    moving from old_status to new_status (None when it does not exist).
+    """
+    users = defaultdict(lambda: defaultdict(int))
+    items = defaultdict(int)
+    for status, sign in ((old_status, -1), (new_status, 1)):
+        if status == PENDING:
+            users[owner_id]['pending_received'] += sign
+            users[requester_id]['pending_sent'] += sign
+            items[item_id] += sign
+        elif status == ACCEPTED:
+            users[owner_id]['accepted_received'] += sign
+            users[requester_id]['accepted_sent'] += sign
+    return users, items
+
+
+def _bump(model, pk, deltas, create=True):
+    """Apply {field: delta} to the stats row keyed by pk, creating it if needed."""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(pk=pk).update(**updates) or not create:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(pk=pk, **deltas)
+    except IntegrityError:
+        # Created concurrently
+        model.objects.filter(pk=pk).update(**updates)
+
+
+def apply(user_deltas, item_deltas, create=True):
+    """
+    Apply summed deltas. With create=False missing rows are left alone,
+    which deletions need: the row may belong to a user or item that is
+    being deleted in the same cascade.
+    """
+    from .models import ItemRequestStats, UserRequestStats
+
+    for user_id, deltas in user_deltas.items():
+        _bump(UserRequestStats, user_id, deltas, create)
+    for item_id, delta in item_deltas.items():
+        _bump(ItemRequestStats, item_id, {'pending': delta}, create)
+    invalidate_pending_counts(
+        user_id for user_id, deltas in user_deltas.items() if deltas.get('pending_received')
+    )
+
+
+def invalidate_pending_counts(user_ids):
+    """Drop the cached badge counts of user_ids once the transaction commits."""
+    from .context_processors import pending_count_key
+
+    keys = [pending_count_key(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def record_transition(owner_id, requester_id, item_id, old_status, new_status):
+    if old_status != new_status:
+        deltas = transition_deltas(owner_id, requester_id, item_id, old_status, new_status)
+        apply(*deltas, create=new_status is not None)
+
+
+def record_transitions(rows):
+    """
+    Account for many requests changing status at once.
+
+    rows are (owner_id, requester_id, item_id, old_status, new_status)
+    tuples; deltas are summed so each stats row is updated once.
+    """
+    users = defaultdict(lambda: defaultdict(int))
+    items = defaultdict(int)
+    for owner_id, requester_id, item_id, old_status, new_status in rows:
+        if old_status == new_status:
+            continue
+        user_deltas, item_deltas = transition_deltas(owner_id, requester_id, item_id, old_status, new_status)
+        for user_id, deltas in user_deltas.items():
+            for field, delta in deltas.items():
+                users[user_id][field] += delta
+        for item_id, delta in item_deltas.items():
+            items[item_id] += delta
+    apply(users, items)
+
+
+def record_bulk_transition(rows, new_status):
+    """
+    Account for many requests moving to new_status at once; rows are
+    (owner_id, requester_id, item_id, old_status) tuples.
+    """
+    record_transitions(tuple(row) + (new_status,) for row in rows)
+
+
+def stats_for(user):
+    """The user's UserRequestStats, or an unsaved all-zero one."""
+    from .models import UserRequestStats
+
+    return UserRequestStats.objects.filter(pk=user.pk).first() or UserRequestStats(user=user)
+
+
+def _sync(model, actual, fields):
+    """Make model rows match {pk: values}; returns the pks that changed."""
+    stored = {row[0]: row[1:] for row in model.objects.values_list('pk', *fields)}
+    zero = (0,) * len(fields)
+    changed, missing, drifted = [], [], []
+    for pk in stored.keys() | actual.keys():
+        values = actual.get(pk, zero)
+        if stored.get(pk, zero) == values:
+            continue
+        row = model(pk=pk, **dict(zip(fields, values)))
+        (drifted if pk in stored else missing).append(row)
+        changed.append(pk)
+    model.objects.bulk_create(missing, batch_size=1000)
+    model.objects.bulk_update(drifted, fields, batch_size=1000)
+    return changed
+
+
+def reconcile():
+    """Rebuild both stats tables from ItemRequest; returns (users fixed, items fixed)."""
+    from .models import ItemRequest, ItemRequestStats, UserRequestStats
+
+    user_fields = ('pending_received', 'accepted_received', 'pending_sent', 'accepted_sent')
+    pending, accepted = Q(status=PENDING), Q(status=ACCEPTED)
+
+    users = defaultdict(lambda: [0, 0, 0, 0])
+    received = ItemRequest.objects.values('item_owner').annotate(
+        pending=Count('id', filter=pending), accepted=Count('id', filter=accepted),
+    )
+    for row in received:
+        users[row['item_owner']][0:2] = [row['pending'], row['accepted']]
+    sent = ItemRequest.objects.values('requested_by').annotate(
+        pending=Count('id', filter=pending), accepted=Count('id', filter=accepted),
+    )
+    for row in sent:
+        users[row['requested_by']][2:4] = [row['pending'], row['accepted']]
+
+    items = {
+        row['item']: (row['pending'],)
+        for row in ItemRequest.objects.filter(pending).values('item').annotate(pending=Count('id'))
+    }
+
+    with transaction.atomic():
+        fixed_users = _sync(UserRequestStats, {pk: tuple(values) for pk, values in users.items()}, user_fields)
+        fixed_items = _sync(ItemRequestStats, items, ('pending',))
+        invalidate_pending_counts(fixed_users)
+    return len(fixed_users), len(fixed_items)
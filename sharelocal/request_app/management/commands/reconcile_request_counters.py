@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from request_app import counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the per-user and per-item request counters from ItemRequest '
+        'and fix any drift. Safe to run periodically (e.g. from cron).'
+    )
+
+    def handle(self, *args, **options):
+        fixed_users, fixed_items = counters.reconcile()
+        self.stdout.write(self.style.SUCCESS(
+            f'Request counters reconciled: {fixed_users} user row(s), {fixed_items} item row(s) corrected'
+        ))
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:22
+
+import django.db.models.deletion
+from django.conf import settings
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def seed_request_stats(apps, schema_editor):
+    """Compute the counters for existing requests."""
+    ItemRequest = apps.get_model('request_app', 'ItemRequest')
+    UserRequestStats = apps.get_model('request_app', 'UserRequestStats')
+    ItemRequestStats = apps.get_model('request_app', 'ItemRequestStats')
+
+    counts = {'pending': Count('id', filter=Q(status='Pending')), 'accepted': Count('id', filter=Q(status='Accepted'))}
+    users = defaultdict(dict)
+    for row in ItemRequest.objects.values('item__owner').annotate(**counts):
+        users[row['item__owner']].update(pending_received=row['pending'], accepted_received=row['accepted'])
+    for row in ItemRequest.objects.values('requested_by').annotate(**counts):
+        users[row['requested_by']].update(pending_sent=row['pending'], accepted_sent=row['accepted'])
+    UserRequestStats.objects.bulk_create(
+        [UserRequestStats(user_id=user_id, **values) for user_id, values in users.items()],
+        batch_size=1000,
+    )
+
+    pending = ItemRequest.objects.filter(status='Pending').values('item').annotate(pending=Count('id'))
+    ItemRequestStats.objects.bulk_create(
+        [ItemRequestStats(item_id=row['item'], pending=row['pending']) for row in pending],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('items', '0010_search_terms'),
+        ('request_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemRequestStats',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='request_stats', serialize=False, to='items.item')),
+                ('pending', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Item request stats',
+                'verbose_name_plural': 'Item request stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserRequestStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='request_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('pending_received', models.IntegerField(default=0)),
+                ('accepted_received', models.IntegerField(default=0)),
+                ('pending_sent', models.IntegerField(default=0)),
+                ('accepted_sent', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'User request stats',
+                'verbose_name_plural': 'User request stats',
+            },
+        ),
+        migrations.RunPython(seed_request_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0011_item_listing_indexes'),
+        ('request_app', '0002_request_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='itemrequest',
+            index=models.Index(fields=['item', 'status'], name='itemrequest_item_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemrequest',
+            index=models.Index(fields=['requested_by', 'status', '-requested_date'], name='itemrequest_by_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemrequest',
+            index=models.Index(fields=['requested_by', '-requested_date'], name='itemrequest_by_date_idx'),
+        ),
+    ]
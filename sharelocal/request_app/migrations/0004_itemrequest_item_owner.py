@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 10000
+
+
+def copy_item_owners(apps, schema_editor):
+    """Copy each request's item owner, one id range per transaction."""
+    ItemRequest = apps.get_model('request_app', 'ItemRequest')
+    Item = apps.get_model('items', 'Item')
+
+    last = ItemRequest.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    owner = models.Subquery(Item.objects.filter(pk=models.OuterRef('item_id')).values('owner_id')[:1])
+    for start in range(0, last, BATCH_SIZE):
+        ItemRequest.objects.filter(
+            pk__gt=start, pk__lte=start + BATCH_SIZE, item_owner__isnull=True,
+        ).update(item_owner=owner)
+
+
+class Migration(migrations.Migration):
+    # The backfill commits batch by batch instead of holding one write
+    # transaction over the whole table
+    atomic = False
+
+    dependencies = [
+        ('items', '0011_item_listing_indexes'),
+        ('request_app', '0003_itemrequest_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemrequest',
+            name='item_owner',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='received_requests', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(copy_item_owners, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='itemrequest',
+            name='item_owner',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='received_requests', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='itemrequest',
+            index=models.Index(fields=['item_owner', 'status', '-requested_date'], name='itemrequest_owner_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemrequest',
+            index=models.Index(fields=['item_owner', '-requested_date'], name='itemrequest_owner_date_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def remove_duplicate_open_requests(apps, schema_editor):
+    """
+    Keep one open (not accepted) request per user and item: the pending
+    one if there is one, else the newest. Deleted requests are taken off
+    the site-wide request count, and deleted pending ones off the request
+    counters.
+    """
+    ItemRequest = apps.get_model('request_app', 'ItemRequest')
+    UserRequestStats = apps.get_model('request_app', 'UserRequestStats')
+    ItemRequestStats = apps.get_model('request_app', 'ItemRequestStats')
+    SiteCounter = apps.get_model('core', 'SiteCounter')
+
+    open_requests = ItemRequest.objects.exclude(status='Accepted')
+    duplicates = list(
+        open_requests.values_list('item_id', 'requested_by_id')
+        .annotate(n=models.Count('id')).filter(n__gt=1).order_by()
+    )
+    pending_first = models.Case(models.When(status='Pending', then=0), default=1)
+    deleted = 0
+    for item_id, requester_id, _ in duplicates:
+        rows = list(
+            open_requests.filter(item_id=item_id, requested_by_id=requester_id)
+            .order_by(pending_first, '-requested_date', '-id')
+            .values_list('id', 'item_owner_id', 'status')
+        )
+        extra = rows[1:]
+        ItemRequest.objects.filter(id__in=[row[0] for row in extra]).delete()
+        deleted += len(extra)
+        pending = sum(1 for row in extra if row[2] == 'Pending')
+        if pending:
+            owner_id = rows[0][1]
+            UserRequestStats.objects.filter(pk=owner_id).update(pending_received=models.F('pending_received') - pending)
+            UserRequestStats.objects.filter(pk=requester_id).update(pending_sent=models.F('pending_sent') - pending)
+            ItemRequestStats.objects.filter(pk=item_id).update(pending=models.F('pending') - pending)
+    if deleted:
+        # core.counters.REQUESTS; a missing row is created by the next
+        # reconcile_counters run with the right value
+        SiteCounter.objects.filter(name='requests').update(value=models.F('value') - deleted)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_sitecounter'),
+        ('items', '0011_item_listing_indexes'),
+        ('request_app', '0004_itemrequest_item_owner'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_open_requests, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='itemrequest',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'Accepted'), _negated=True), fields=('item', 'requested_by'), name='itemrequest_one_open_per_user'),
+        ),
+    ]
\ No newline at end of file
@@ -1,19 +1,231 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Value, When
 from django.contrib.auth.models import User
+from django.utils import timezone
+from core import counters as site_counters, prefetch
 from items.models import Item
+from . import counters
 # Create your models here.
 
-class ItemRequest(models.Model):
+def unlist_accepted_item(item_id, listing):
+    """
+    Drop an item taken by an accepted request from the in-process indexes
+    and the cached listing counts. listing is its (title, category_id)
+    if it was available until then, else None.
+    """
+    from core.pagination import invalidate_counts
+    from items.autocomplete import autocomplete_index
+    from items.spatial import spatial_index
+
+    spatial_index.discard(item_id)
+    if listing is not None:
+        autocomplete_index.move((*listing, True), None)
+        invalidate_counts(Item)
+    # The requests changed status whether or not the item was listed
+    invalidate_counts(ItemRequest)
+
+
+class ItemRequestQuerySet(prefetch.AutoPrefetchQuerySetMixin, models.QuerySet):
+    def set_status(self, status):
+        """
+        Bulk-update status, keeping the request counters in step.
+
+        update() sends no signals, so the affected rows are read first and
+        their transitions recorded in the same transaction. Accepted
+        requests are left alone: the requester may have opened a new one
+        for the item since, and reopening the old one would break the
+        one-open-request constraint.
+        """
+        with transaction.atomic(using=self.db):
+            rows = list(self.select_for_update().exclude(status__in=[status, 'Accepted']).values_list(
+                'id', 'item_owner_id', 'requested_by_id', 'item_id', 'status',
+            ))
+            if not rows:
+                return 0
+            updated = ItemRequest.objects.filter(id__in=[row[0] for row in rows]).update(status=status)
+            counters.record_bulk_transition([row[1:] for row in rows], status)
+        return updated
+
+    def open_request(self, item, user):
+        """user's open (not accepted) request for item, or None."""
+        # At most one by the unique constraint, so no ORDER BY for first()
+        return next(iter(self.filter(item=item, requested_by=user).exclude(status='Accepted')[:1]), None)
+
+    def request_item(self, item, user):
+        """
+        Open a request from user for item, or return the open (not
+        accepted) one they already have: (request, created).
+
+        The INSERT is tried first and the unique constraint on open
+        requests decides: a new request takes no lookup, and double
+        submits cannot both create one.
+        """
+        try:
+            with transaction.atomic(using=self.db):
+                return self.create(item=item, requested_by=user), True
+        except IntegrityError:
+            existing = self.open_request(item, user)
+            if existing is None:
+                raise
+            return existing, False
+
+    def request_items(self, items, user):
+        """
+        Open requests from user for several items in one transaction and
+        return the new ones. Items the user owns or already has an open
+        request for are skipped.
+        """
+        items = {item.pk: item for item in items if item.owner_id != user.id}
+        with transaction.atomic(using=self.db):
+            open_ids = set(self.filter(item_id__in=items, requested_by=user).exclude(
+                status='Accepted').values_list('item_id', flat=True))
+            new = [
+                ItemRequest(item=item, item_owner_id=item.owner_id, requested_by=user)
+                for pk, item in items.items() if pk not in open_ids
+            ]
+            try:
+                with transaction.atomic(using=self.db):
+                    created = self.bulk_create(new)
+            except IntegrityError:
+                # One of them was opened concurrently: go one at a time
+                return [
+                    request for request, is_new in (self.request_item(item, user) for item in items.values())
+                    if is_new
+                ]
+            # bulk_create sends no signals
+            counters.record_transitions(
+                (request.item_owner_id, user.id, request.item_id, None, 'Pending') for request in created
+            )
+            site_counters.adjust(site_counters.REQUESTS, len(created))
+        return created
+
+
+class ItemRequest(prefetch.AutoPrefetchModelMixin, models.Model):
     STATUS_CHOICES = [
         ('Pending', 'Pending'),
         ('Accepted', 'Accepted'),
         ('Rejected', 'Rejected'),
     ]
 
-    item = models.ForeignKey(Item, on_delete=models.CASCADE)
-    requested_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    item = prefetch.ForeignKey(Item, on_delete=models.CASCADE)
+    # Copy of item.owner, set on save: owner-side lists filter on it
+    # without joining items_item. No index of its own, the composite
+    # indexes below lead with it.
+    item_owner = prefetch.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='received_requests', editable=False, db_index=False,
+    )
+    requested_by = prefetch.ForeignKey(User, on_delete=models.CASCADE)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
     requested_date = models.DateTimeField(auto_now_add=True)
 
+    objects = ItemRequestQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # An owner's received requests, newest first, with and without a status filter
+            models.Index(fields=['item_owner', 'status', '-requested_date'], name='itemrequest_owner_status_idx'),
+            models.Index(fields=['item_owner', '-requested_date'], name='itemrequest_owner_date_idx'),
+            # Requests on an item by status (accept_request, duplicate checks)
+            models.Index(fields=['item', 'status'], name='itemrequest_item_status_idx'),
+            # A user's sent requests, newest first, with and without a status filter
+            models.Index(fields=['requested_by', 'status', '-requested_date'], name='itemrequest_by_status_idx'),
+            models.Index(fields=['requested_by', '-requested_date'], name='itemrequest_by_date_idx'),
+        ]
+        constraints = [
+            # One open (pending or rejected) request per user and item; once
+            # accepted the item can be requested again
+            models.UniqueConstraint(
+                fields=['item', 'requested_by'], condition=~models.Q(status='Accepted'),
+                name='itemrequest_one_open_per_user',
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Status as stored, so post_save can record the transition
+        instance._stored_status = instance.__dict__.get('status')
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.item_owner_id is None and self.item_id is not None:
+            # The item is usually cached by the view; avoid loading it otherwise
+            if ItemRequest.item.is_cached(self):
+                self.item_owner_id = self.item.owner_id
+            else:
+                self.item_owner_id = Item.objects.filter(pk=self.item_id).values_list('owner_id', flat=True).first()
+        super().save(*args, **kwargs)
+
+    def accept(self):
+        """
+        Accept this request, reject the item's other pending requests and
+        mark the item unavailable, in one transaction.
+
+        The first statement writes the item row, which locks it (the whole
+        database on SQLite): concurrent accepts for the same item run one
+        after the other, and the later ones find the request rejected.
+        Returns False, changing nothing, if the request is no longer
+        pending.
+        """
+        item_id = self.item_id
+        now = timezone.now()
+        with transaction.atomic():
+            # Either update writes the row, so the lock is taken whether or
+            # not the item was still listed
+            listed = Item.objects.filter(pk=item_id, is_available=True).update(is_available=False, updated_at=now)
+            if not listed:
+                Item.objects.filter(pk=item_id).update(updated_at=now)
+            pending = ItemRequest.objects.filter(item_id=item_id, status='Pending')
+            rows = list(pending.values_list('id', 'item_owner_id', 'requested_by_id'))
+            if self.pk not in {row[0] for row in rows}:
+                transaction.set_rollback(True)
+                return False
+            pending.update(status=Case(When(pk=self.pk, then=Value('Accepted')), default=Value('Rejected')))
+            counters.record_transitions(
+                (owner_id, requester_id, item_id, 'Pending', 'Accepted' if pk == self.pk else 'Rejected')
+                for pk, owner_id, requester_id in rows
+            )
+            listing = Item.objects.filter(pk=item_id).values_list('title', 'category_id').first() if listed else None
+            # update() sends no post_save: take the item out of the listings here
+            transaction.on_commit(lambda: unlist_accepted_item(item_id, listing))
+
+        self.status = self._stored_status = 'Accepted'
+        if ItemRequest.item.is_cached(self):
+            self.item.is_available = False
+        return True
+
+    def __str__(self):
+        return f"{self.requested_by.username} -> {self.item.title}"
+
+
+class UserRequestStats(models.Model):
+    """
+    Request counts for one user's dashboards, maintained by request_app.counters.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='request_stats')
+    pending_received = models.IntegerField(default=0)
+    accepted_received = models.IntegerField(default=0)
+    pending_sent = models.IntegerField(default=0)
+    accepted_sent = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'User request stats'
+        verbose_name_plural = 'User request stats'
+
+    def __str__(self):
+        return f"{self.user_id}: {self.pending_received} pending received"
+
+
+class ItemRequestStats(models.Model):
+    """
+    Pending request count for one item, maintained by request_app.counters.
+    """
+    item = models.OneToOneField(Item, on_delete=models.CASCADE, primary_key=True, related_name='request_stats')
+    pending = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Item request stats'
+        verbose_name_plural = 'Item request stats'
+
     def __str__(self):
-        return f"{self.requested_by.username} -> {self.item.title}"
\ No newline at end of file
+        return f"{self.item_id}: {self.pending} pending"
\ No newline at end of file
@@ -0,0 +1,50 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+
+from . import counters
+from .models import Item, ItemRequest
+
+
+@receiver(post_save, sender=ItemRequest)
+def count_request_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if not created and not hasattr(instance, '_stored_status'):
+        # Saved without being loaded: the previous status is unknown, so
+        # leave it to reconcile_request_counters
+        return
+    old_status = None if created else instance._stored_status
+    counters.record_transition(
+        instance.item_owner_id, instance.requested_by_id, instance.item_id, old_status, instance.status,
+    )
+    instance._stored_status = instance.status
+
+
+@receiver(pre_delete, sender=ItemRequest)
+def count_request_delete(sender, instance, **kwargs):
+    # pre_delete: the counters change inside the deletion's transaction
+    counters.record_transition(
+        instance.item_owner_id, instance.requested_by_id, instance.item_id, instance.status, None,
+    )
+
+
+@receiver(post_save, sender=Item)
+def sync_request_owner(sender, instance, created, raw=False, **kwargs):
+    """Move an item's requests, and their received counts, to its new owner."""
+    old_owner_id = getattr(instance, '_stored_owner_id', instance.owner_id)
+    if created or raw or old_owner_id == instance.owner_id:
+        return
+    received = {counters.PENDING: 'pending_received', counters.ACCEPTED: 'accepted_received'}
+    user_deltas = {old_owner_id: defaultdict(int), instance.owner_id: defaultdict(int)}
+    with transaction.atomic():
+        requests = ItemRequest.objects.filter(item=instance)
+        for status, count in requests.values_list('status').annotate(count=Count('id')).order_by():
+            if status in received:
+                user_deltas[old_owner_id][received[status]] -= count
+                user_deltas[instance.owner_id][received[status]] += count
+        requests.update(item_owner=instance.owner_id)
+        counters.apply(user_deltas, {})
@@ -1,9 +1,20 @@
-from django.test import TestCase
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase
 from django.urls import reverse
 from django.contrib.auth.models import User
 from items.models import Item
+from core import counters as site_counters
 from core.models import Category
-from .models import ItemRequest
+from core.pagination import count_cache_key
+from items.autocomplete import autocomplete_index
+from items.facets import facet_counts
+from . import counters
+from .context_processors import pending_count_for, pending_requests
+from .models import ItemRequest, ItemRequestStats, UserRequestStats
 
 
 class RequestViewTests(TestCase):
@@ -46,3 +57,289 @@ class RequestViewTests(TestCase):
         # second request should create new entry
         resp = self.client.post(url, follow=True)
         self.assertEqual(ItemRequest.objects.filter(requested_by=self.other, item=self.item).count(), 2)
+
+    def test_accepted_request_cannot_be_rejected_after_a_new_request(self):
+        self.client.login(username='other', password='pass456')
+        url = reverse('create-request', args=[self.item.id])
+        self.client.post(url)
+        accepted = ItemRequest.objects.get(requested_by=self.other, item=self.item)
+        accepted.accept()
+        self.client.post(url)
+
+        self.client.login(username='owner', password='pass123')
+        response = self.client.post(reverse('reject-request', args=[accepted.id]), follow=True)
+        self.assertContains(response, 'already been accepted')
+        self.assertEqual(ItemRequest.objects.get(pk=accepted.pk).status, 'Accepted')
+        self.assertEqual(ItemRequest.objects.filter(item=self.item).set_status('Rejected'), 1)
+        self.assertEqual(ItemRequest.objects.get(pk=accepted.pk).status, 'Accepted')
+
+
+class RequestCounterTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', password='pass123')
+        self.alice = User.objects.create_user(username='alice', password='pass123')
+        self.bob = User.objects.create_user(username='bob', password='pass123')
+        self.item = Item.objects.create(owner=self.owner, title='Tent', description='Desc')
+
+    def stats(self, user):
+        stats = counters.stats_for(user)
+        return (stats.pending_received, stats.accepted_received, stats.pending_sent, stats.accepted_sent)
+
+    def pending(self, item):
+        return ItemRequestStats.objects.filter(item=item).values_list('pending', flat=True).first()
+
+    def request_as(self, user):
+        self.client.force_login(user)
+        self.client.post(reverse('create-request', args=[self.item.id]))
+        return ItemRequest.objects.get(item=self.item, requested_by=user, status='Pending')
+
+    def test_accept_rejects_the_others_and_keeps_counts(self):
+        first = self.request_as(self.alice)
+        self.request_as(self.bob)
+        self.assertEqual(self.stats(self.owner), (2, 0, 0, 0))
+        self.assertEqual(self.stats(self.alice), (0, 0, 1, 0))
+        self.assertEqual(self.pending(self.item), 2)
+
+        self.client.force_login(self.owner)
+        self.client.post(reverse('accept-request', args=[first.id]))
+        self.assertEqual(self.stats(self.owner), (0, 1, 0, 0))
+        self.assertEqual(self.stats(self.alice), (0, 0, 0, 1))
+        self.assertEqual(self.stats(self.bob), (0, 0, 0, 0))
+        self.assertEqual(self.pending(self.item), 0)
+        self.assertFalse(Item.objects.get(pk=self.item.pk).is_available)
+
+    def test_accepting_a_rejected_request_changes_nothing(self):
+        first = self.request_as(self.alice)
+        second = self.request_as(self.bob)
+        self.client.force_login(self.owner)
+        self.client.post(reverse('accept-request', args=[first.id]))
+
+        response = self.client.post(reverse('accept-request', args=[second.id]), follow=True)
+        self.assertContains(response, 'no longer pending')
+        self.assertEqual(ItemRequest.objects.get(pk=second.pk).status, 'Rejected')
+        self.assertEqual(ItemRequest.objects.get(pk=first.pk).status, 'Accepted')
+        self.assertEqual(self.stats(self.owner), (0, 1, 0, 0))
+
+    def test_reject_and_delete_update_counts(self):
+        request = self.request_as(self.alice)
+        self.client.force_login(self.owner)
+        self.client.post(reverse('reject-request', args=[request.id]))
+        self.assertEqual(self.stats(self.owner), (0, 0, 0, 0))
+
+        self.request_as(self.bob)
+        self.item.delete()
+        self.assertEqual(self.stats(self.owner), (0, 0, 0, 0))
+        self.assertEqual(self.stats(self.bob), (0, 0, 0, 0))
+
+    def test_profile_and_my_items_render_counters(self):
+        self.request_as(self.alice)
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.context['pending_received'], 1)
+        response = self.client.get(reverse('my_items'))
+        self.assertContains(response, '1 pending')
+
+    def test_reconcile_repairs_drift(self):
+        self.request_as(self.alice)
+        UserRequestStats.objects.filter(pk=self.owner.pk).update(pending_received=5)
+        ItemRequestStats.objects.all().delete()
+        self.assertEqual(counters.reconcile(), (1, 1))
+        self.assertEqual(self.stats(self.owner), (1, 0, 0, 0))
+        self.assertEqual(self.pending(self.item), 1)
+        self.assertEqual(counters.reconcile(), (0, 0))
+
+    def test_item_owner_is_copied_on_create(self):
+        request = self.request_as(self.alice)
+        self.assertEqual(request.item_owner, self.owner)
+        other = ItemRequest.objects.create(item=Item.objects.get(pk=self.item.pk), requested_by=self.bob)
+        self.assertEqual(ItemRequest.objects.get(pk=other.pk).item_owner_id, self.owner.id)
+
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('request-list'))
+        self.assertEqual(len(response.context['requests']), 2)
+
+    def test_owner_change_moves_requests_and_counts(self):
+        self.request_as(self.alice)
+        item = Item.objects.get(pk=self.item.pk)
+        item.owner = self.bob
+        item.save()
+
+        self.assertEqual(ItemRequest.objects.get(item=item).item_owner_id, self.bob.id)
+        self.assertEqual(self.stats(self.owner), (0, 0, 0, 0))
+        self.assertEqual(self.stats(self.bob), (1, 0, 0, 0))
+        self.assertEqual(counters.reconcile(), (0, 0))
+
+
+class PendingCountContextProcessorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.owner = User.objects.create_user(username='owner', password='pass123')
+        self.other = User.objects.create_user(username='other', password='pass123')
+        self.item = Item.objects.create(owner=self.owner, title='Kayak', description='Desc')
+
+    def make_request(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ItemRequest.objects.create(item=self.item, requested_by=self.other)
+
+    def test_badge_is_shown_on_every_page(self):
+        self.make_request()
+        self.client.force_login(self.owner)
+        for url in (reverse('item_list'), reverse('my-requests')):
+            response = self.client.get(url)
+            self.assertContains(response, '<span class="badge-requests">1</span>', html=True)
+
+    def test_count_is_lazy_and_evaluated_once_per_request(self):
+        request = RequestFactory().get('/')
+        request.user = self.owner
+        with self.assertNumQueries(0):
+            context = pending_requests(request)
+        with self.assertNumQueries(1):
+            self.assertEqual(int(context['pending_count']), 0)
+            self.assertEqual(int(pending_requests(request)['pending_count']), 0)
+
+    def test_cache_is_dropped_when_requests_change(self):
+        self.assertEqual(pending_count_for(self.owner), 0)
+        with self.assertNumQueries(0):
+            pending_count_for(self.owner)
+
+        request = self.make_request()
+        self.assertEqual(pending_count_for(self.owner), 1)
+
+        request.status = 'Rejected'
+        with self.captureOnCommitCallbacks(execute=True):
+            request.save()
+        self.assertEqual(pending_count_for(self.owner), 0)
+
+
+class ConcurrentAcceptTests(TransactionTestCase):
+    THREADS = 8
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', password='pass123')
+        self.item = Item.objects.create(owner=self.owner, title='Tent', description='Desc')
+        self.requesters = [User.objects.create_user(username=f'user{i}') for i in range(self.THREADS)]
+        self.requests = [
+            ItemRequest.objects.create(item=self.item, requested_by=user) for user in self.requesters
+        ]
+
+    def accept_all_at_once(self):
+        barrier = threading.Barrier(self.THREADS)
+        results, errors = [], []
+
+        def accept(pk):
+            try:
+                request = ItemRequest.objects.get(pk=pk)
+                barrier.wait()
+                while True:
+                    try:
+                        results.append(request.accept())
+                        break
+                    except OperationalError as e:
+                        # The shared-cache in-memory test database reports
+                        # contention at once where a database file would
+                        # wait out its busy timeout: wait here instead
+                        if 'locked' not in str(e):
+                            raise
+                        time.sleep(0.001)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=accept, args=(r.pk,)) for r in self.requests]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_parallel_accepts_accept_exactly_one(self):
+        results, errors = self.accept_all_at_once()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(results), [False] * (self.THREADS - 1) + [True])
+        statuses = list(ItemRequest.objects.values_list('status', flat=True))
+        self.assertEqual(statuses.count('Accepted'), 1)
+        self.assertEqual(statuses.count('Rejected'), self.THREADS - 1)
+        self.assertFalse(Item.objects.get(pk=self.item.pk).is_available)
+        self.assertEqual(counters.reconcile(), (0, 0))
+
+
+class OpenRequestTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', password='pass123')
+        self.alice = User.objects.create_user(username='alice', password='pass123')
+        self.items = [
+            Item.objects.create(owner=self.owner, title=f'Item {i}', description='Desc') for i in range(3)
+        ]
+
+    def test_one_open_request_per_user_and_item(self):
+        ItemRequest.objects.create(item=self.items[0], requested_by=self.alice, status='Rejected')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ItemRequest.objects.create(item=self.items[0], requested_by=self.alice)
+        ItemRequest.objects.filter(item=self.items[0]).update(status='Accepted')
+        ItemRequest.objects.create(item=self.items[0], requested_by=self.alice)
+
+    def test_request_item_returns_the_open_request(self):
+        first, created = ItemRequest.objects.request_item(self.items[0], self.alice)
+        self.assertTrue(created)
+        again, created = ItemRequest.objects.request_item(self.items[0], self.alice)
+        self.assertFalse(created)
+        self.assertEqual(again, first)
+        self.assertEqual(counters.stats_for(self.alice).pending_sent, 1)
+
+    def test_request_items_creates_the_missing_ones(self):
+        ItemRequest.objects.request_item(self.items[0], self.alice)
+        own = Item.objects.create(owner=self.alice, title='Mine', description='Desc')
+
+        created = ItemRequest.objects.request_items(self.items + [own], self.alice)
+
+        self.assertEqual(sorted(request.item_id for request in created), [self.items[1].pk, self.items[2].pk])
+        self.assertEqual(ItemRequest.objects.filter(requested_by=self.alice).count(), 3)
+        self.assertEqual(ItemRequest.objects.filter(item_owner=self.owner).count(), 3)
+        self.assertEqual(counters.stats_for(self.owner).pending_received, 3)
+        self.assertEqual(counters.reconcile(), (0, 0))
+        self.assertEqual(site_counters.reconcile(), {})
+
+    def test_bulk_view(self):
+        self.client.force_login(self.alice)
+        response = self.client.post(reverse('create-requests'), {'item_id': [item.pk for item in self.items]})
+        self.assertRedirects(response, reverse('my-requests'))
+        self.assertEqual(ItemRequest.objects.filter(requested_by=self.alice, status='Pending').count(), 3)
+
+
+class AcceptListingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='pass123')
+        self.alice = User.objects.create_user(username='alice', password='pass123')
+        self.category = Category.objects.create(name='Camping gear')
+        self.item = Item.objects.create(owner=self.owner, title='Tent', description='Desc', category=self.category)
+        self.request = ItemRequest.objects.create(item=self.item, requested_by=self.alice)
+        self.addCleanup(autocomplete_index.reset)
+
+    def test_accept_updates_autocomplete_and_cached_counts(self):
+        Item.objects.create(owner=self.owner, title='Stove', description='Desc', category=self.category)
+        autocomplete_index.rebuild()
+        available = Item.objects.filter(is_available=True, category=self.category)
+        self.assertEqual(facet_counts(available), {(self.category.pk, 'Share'): 2})
+        self.assertEqual(autocomplete_index.suggest('ten'), [('item', 'Tent', 'Tent')])
+        counted_key = count_cache_key(available)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.request.accept())
+
+        self.assertEqual(facet_counts(available), {(self.category.pk, 'Share'): 1})
+        self.assertEqual(autocomplete_index.suggest('ten'), [])
+        self.assertEqual(autocomplete_index.suggest('camping'), [('category', 'Camping gear', self.category.pk)])
+        self.assertNotEqual(count_cache_key(available), counted_key)
+
+    def test_accepting_an_unlisted_item_leaves_autocomplete_alone(self):
+        Item.objects.filter(pk=self.item.pk).update(is_available=False)
+        Item.objects.create(owner=self.owner, title='Tent', description='Desc')
+        autocomplete_index.rebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.request.accept())
+
+        self.assertEqual(autocomplete_index.suggest('ten'), [('item', 'Tent', 'Tent')])
@@ -2,7 +2,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Q
-from django.core.paginator import Paginator
+from core.pagination import EstimatedCountPaginator
 from items.models import Item
 from .models import ItemRequest
 from .forms import RequestItemForm, RequestStatusForm
@@ -11,7 +11,7 @@ from .forms import RequestItemForm, RequestStatusForm
 @login_required
 def request_list(request):
     """List all requests for the current user's items"""
-    requests = ItemRequest.objects.filter(item__owner=request.user).order_by('-requested_date')
+    requests = ItemRequest.objects.filter(item_owner=request.user).order_by('-requested_date')
     
     # Filter by status
     status_filter = request.GET.get('status')
@@ -19,7 +19,7 @@ def request_list(request):
         requests = requests.filter(status=status_filter)
     
     # Pagination
-    paginator = Paginator(requests, 10)
+    paginator = EstimatedCountPaginator(requests, 10)
     page = request.GET.get('page')
     requests = paginator.get_page(page)
     
@@ -42,7 +42,7 @@ def my_requests(request):
         requests = requests.filter(status=status_filter)
     
     # Pagination
-    paginator = Paginator(requests, 10)
+    paginator = EstimatedCountPaginator(requests, 10)
     page = request.GET.get('page')
     requests = paginator.get_page(page)
     
@@ -62,65 +62,64 @@ def create_request(request, item_id):
     # Check if user is the owner
     if item.owner == request.user:
         messages.error(request, 'You cannot request your own item.')
-        return redirect('item-detail', pk=item_id)
+        return redirect('item_detail', item_id=item_id)
 
-    # Check if user already requested this item and the request is not accepted
-    existing_request = ItemRequest.objects.filter(
-        item=item,
-        requested_by=request.user
-    ).exclude(status='Accepted').first()
+    if request.method == 'POST':
+        # Creates the request unless the user already has an open one
+        item_request, created = ItemRequest.objects.request_item(item, request.user)
+        if created:
+            messages.success(request, f'Request for {item.title} has been sent!')
+            return redirect('my-requests')
+        # ignore form submission when a pending/rejected request exists
+        messages.warning(request, 'You have already requested this item. See details below.')
+        existing_request = item_request
+    else:
+        # Check if user already requested this item and the request is not accepted
+        existing_request = ItemRequest.objects.open_request(item, request.user)
 
     if existing_request:
         # simply show the existing request details on the page
-        if request.method == 'POST':
-            # ignore form submission when a pending/rejected request exists
-            messages.warning(request, 'You have already requested this item. See details below.')
         context = {
             'item': item,
             'existing_request': existing_request,
         }
         return render(request, 'request_app/create_request.html', context)
 
-    # create a new request normally
-    if request.method == 'POST':
-        # Create the request
-        item_request = ItemRequest.objects.create(
-            item=item,
-            requested_by=request.user,
-            status='Pending'
-        )
-        messages.success(request, f'Request for {item.title} has been sent!')
-        return redirect('my-requests')
-
     context = {'item': item}
     return render(request, 'request_app/create_request.html', context)
 
 
+@login_required
+def create_requests(request):
+    """Request several items at once (POST item_id, repeated)"""
+    if request.method != 'POST':
+        return redirect('item_list')
+    item_ids = [item_id for item_id in request.POST.getlist('item_id') if item_id.isdigit()]
+    items = Item.objects.filter(id__in=item_ids)
+    created = ItemRequest.objects.request_items(items, request.user)
+    if created:
+        messages.success(request, f'{len(created)} request(s) sent!')
+    else:
+        messages.warning(request, 'No new requests: you own these items or already requested them.')
+    return redirect('my-requests')
+
+
 @login_required
 def accept_request(request, request_id):
     """Accept a request for an item"""
     item_request = get_object_or_404(ItemRequest, id=request_id)
     
     # Check if user is the owner of the item
-    if item_request.item.owner != request.user:
+    if item_request.item_owner_id != request.user.id:
         messages.error(request, 'You do not have permission to accept this request.')
         return redirect('request-list')
     
     if request.method == 'POST':
-        item_request.status = 'Accepted'
-        item_request.save()
-        
-        # Update item status
-        item_request.item.status = 'Requested'
-        item_request.item.save()
-        
-        # Reject all other pending requests for this item
-        ItemRequest.objects.filter(
-            item=item_request.item,
-            status='Pending'
-        ).exclude(id=item_request.id).update(status='Rejected')
-        
-        messages.success(request, f'Request from {item_request.requested_by.username} has been accepted!')
+        # Also rejects the other pending requests and marks the item unavailable
+        if item_request.accept():
+            messages.success(request, f'Request from {item_request.requested_by.username} has been accepted!')
+        else:
+            messages.error(request, 'This request is no longer pending.')
         return redirect('request-list')
     
     context = {'request_obj': item_request}
@@ -133,10 +132,15 @@ def reject_request(request, request_id):
     item_request = get_object_or_404(ItemRequest, id=request_id)
     
     # Check if user is the owner of the item
-    if item_request.item.owner != request.user:
+    if item_request.item_owner_id != request.user.id:
         messages.error(request, 'You do not have permission to reject this request.')
         return redirect('request-list')
     
+    # An accepted request is final; the user may have requested the item again since
+    if item_request.status == 'Accepted':
+        messages.error(request, 'This request has already been accepted.')
+        return redirect('request-list')
+
     if request.method == 'POST':
         item_request.status = 'Rejected'
         item_request.save()
@@ -153,7 +157,7 @@ def request_detail(request, request_id):
     item_request = get_object_or_404(ItemRequest, id=request_id)
     
     # Check if user is involved in the request
-    if item_request.requested_by != request.user and item_request.item.owner != request.user:
+    if item_request.requested_by_id != request.user.id and item_request.item_owner_id != request.user.id:
         messages.error(request, 'You do not have permission to view this request.')
         return redirect('home')
     
@@ -166,7 +170,7 @@ def request_history(request):
     """View request history (both sent and received)"""
     # Get all requests related to the user
     sent_requests = ItemRequest.objects.filter(requested_by=request.user).order_by('-requested_date')
-    received_requests = ItemRequest.objects.filter(item__owner=request.user).order_by('-requested_date')
+    received_requests = ItemRequest.objects.filter(item_owner=request.user).order_by('-requested_date')
     
     # Filter by status
     status_filter = request.GET.get('status')
@@ -181,15 +185,3 @@ def request_history(request):
         'statuses': ItemRequest.STATUS_CHOICES,
     }
     return render(request, 'request_app/request_history.html', context)
-
-
-@login_required
-def pending_requests_count(request):
-    """Get count of pending requests for the user's items"""
-    if request.user.is_authenticated:
-        count = ItemRequest.objects.filter(
-            item__owner=request.user,
-            status='Pending'
-        ).count()
-        return {'pending_count': count}
-    return {'pending_count': 0}
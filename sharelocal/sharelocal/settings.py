@@ -66,6 +66,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'request_app.context_processors.pending_requests',
             ],
         },
     },
@@ -129,4 +130,27 @@ LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'login'
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR/'media'
\ No newline at end of file
+MEDIA_ROOT = BASE_DIR/'media'
+
+# Geocoding
+# Saves queue geocoding for the geocode_worker command instead of calling
+# the provider inline; set GEOCODE_ASYNC = False to geocode synchronously.
+GEOCODE_ASYNC = True
+# Answer from the core.Location gazetteer first and only ask Nominatim on a
+# miss; set GEOCODER_FALLBACK_BACKEND = None for air-gapped environments.
+GEOCODER_BACKEND = 'core.geocoding.GazetteerGeocoder'
+GEOCODER_FALLBACK_BACKEND = 'core.geocoding.NominatimGeocoder'
+# Shared Nominatim client: Nominatim's usage policy allows 1 request per
+# second. After GEOCODER_CIRCUIT_THRESHOLD consecutive failed lookups the
+# provider is not called for GEOCODER_CIRCUIT_COOLDOWN seconds.
+GEOCODER_RATE_LIMIT = 1.0
+GEOCODER_TIMEOUT = 5
+GEOCODER_MAX_RETRIES = 2
+GEOCODER_CIRCUIT_THRESHOLD = 5
+GEOCODER_CIRCUIT_COOLDOWN = 60
+
+# SQL query budgets per view (see core.querybudget). Add
+# 'core.middleware.QueryBudgetMiddleware' to MIDDLEWARE to check live
+# requests against them; it only runs when DEBUG (or QUERY_BUDGET_ENABLED)
+# is set.
+QUERY_BUDGETS_FILE = BASE_DIR / 'query_budgets.json'
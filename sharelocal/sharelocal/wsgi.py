@@ -14,3 +14,17 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sharelocal.settings')
 
 application = get_wsgi_application()
+
+# Build the nearest-item spatial index and the autocomplete index before
+# the worker takes traffic, and keep reloading them in the background
+# (from the first query on, in the serving process)
+from django.db import connection  # noqa: E402
+from items.autocomplete import autocomplete_index  # noqa: E402
+from items.spatial import spatial_index  # noqa: E402
+
+spatial_index.warm()
+spatial_index.start_refresh()
+autocomplete_index.warm()
+autocomplete_index.start_refresh()
+# Workers forked after this import must not share the warm-up connection
+connection.close()